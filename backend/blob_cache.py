@@ -0,0 +1,413 @@
+"""
+Pixova AI - Local Image Blob Cache
+Content-addressed disk cache for provider images, shared by all workers on the host
+"""
+import asyncio
+import fcntl
+import hashlib
+import os
+import re
+import tempfile
+import threading
+from typing import Any, AsyncIterator, Dict, Iterable, Optional, Set, Tuple
+
+import httpx
+
+from config import settings
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+
+# Links to images we store ourselves (b64_json generations)
+LOCAL_IMAGE_PATH = re.compile(r"/api/images/([0-9a-f]{64})$")
+
+# Host names that are safe to use as file names under hosts/
+HOST_NAME = re.compile(r"[a-z0-9.-]{1,253}")
+
+# Magic bytes of image formats providers return
+IMAGE_SIGNATURES = (
+    (b"\x89PNG", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF8", "image/gif"),
+)
+
+
+class BlobTooLargeError(Exception):
+    """Image is larger than the configured download limit"""
+
+
+def sniff_content_type(head: bytes) -> str:
+    """Image content type from leading bytes (PNG if unknown)"""
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    for signature, content_type in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return content_type
+    return "image/png"
+
+
+class BlobCache:
+    """
+    Disk cache of image bytes keyed by content hash.
+
+    Layout under `blob_cache_dir`:
+        blobs/ab/<sha256>   image bytes (named by the hash of their content)
+        urls/<sha256(url)>  "<blob hash>\\n<content type>" index entry
+        hosts/<host>        provider image host seen in a generation (empty file)
+
+    - Writes go to a temp file in the same directory and are published with
+      os.replace, so readers in any worker see a complete file or nothing.
+    - Reads bump the file mtime; when the cache grows past
+      `blob_cache_max_bytes` the least recently used blobs are deleted down to
+      90% of the limit. Eviction holds an flock so only one worker runs it.
+    - The download proxy only indexes URLs on provider hosts (`blob_cache_hosts`
+      plus hosts recorded by `remember_host`), so clients cannot fill the cache
+      with arbitrary URLs.
+    """
+
+    EVICT_TARGET = 0.9
+    RESCAN_EVERY = 100  # Re-measure the directory every N stores (other workers write too)
+
+    def __init__(self):
+        self._root: Optional[str] = None
+        self._lock = threading.Lock()
+        self._approx_bytes: Optional[int] = None
+        self._stored = 0
+        self._http: Optional[httpx.Client] = None
+        self._hosts: Set[str] = set()
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    @property
+    def enabled(self) -> bool:
+        return settings.blob_cache_enabled
+
+    # ===========================================
+    # PATHS
+    # ===========================================
+
+    def _get_root(self) -> str:
+        if self._root is None:
+            root = settings.blob_cache_dir
+            os.makedirs(os.path.join(root, "blobs"), exist_ok=True)
+            os.makedirs(os.path.join(root, "urls"), exist_ok=True)
+            os.makedirs(os.path.join(root, "hosts"), exist_ok=True)
+            self._root = root
+            logger.info(f"🗃️ Image blob cache ready ({root})")
+        return self._root
+
+    def blob_path(self, blob_hash: str) -> str:
+        return os.path.join(self._get_root(), "blobs", blob_hash[:2], blob_hash)
+
+    @staticmethod
+    def image_url(blob_hash: str) -> str:
+        """
+        Public URL of a stored image (served by /api/images/{blob_hash}).
+        Relative to this API unless PUBLIC_BASE_URL is set.
+        """
+        return f"{settings.public_base_url.rstrip('/')}/api/images/{blob_hash}"
+
+    @staticmethod
+    def local_hash(url: str) -> Optional[str]:
+        """Blob hash if the URL points at an image we store ourselves"""
+        match = LOCAL_IMAGE_PATH.search(url)
+        if match and ((settings.public_base_url and url.startswith(settings.public_base_url)) or url.startswith("/api/images/")):
+            return match.group(1)
+        return None
+
+    @staticmethod
+    def _host(url: str) -> Optional[str]:
+        try:
+            parsed = httpx.URL(url)
+        except (httpx.InvalidURL, TypeError):
+            return None
+        host = parsed.host.lower()
+        if parsed.scheme not in ("http", "https") or not HOST_NAME.fullmatch(host):
+            return None
+        return host
+
+    def _index_path(self, url: str) -> str:
+        url_hash = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(self._get_root(), "urls", url_hash)
+
+    # ===========================================
+    # LOOKUP / STORE (blocking)
+    # ===========================================
+
+    def lookup(self, url: str) -> Optional[Tuple[str, str]]:
+        """(blob hash, content type) of a cached URL, or None"""
+        blob_hash = self.local_hash(url)
+        if blob_hash is not None:
+            path = self.blob_path(blob_hash)
+            try:
+                with open(path, "rb") as f:
+                    head = f.read(16)
+                os.utime(path)
+            except FileNotFoundError:
+                return None
+            return blob_hash, sniff_content_type(head)
+
+        index_path = self._index_path(url)
+        try:
+            with open(index_path, "r") as f:
+                blob_hash, _, content_type = f.read().partition("\n")
+            path = self.blob_path(blob_hash)
+            os.utime(path)
+            os.utime(index_path)
+        except FileNotFoundError:
+            return None
+        return blob_hash, content_type or "image/png"
+
+    def has(self, blob_hash: str) -> bool:
+        return os.path.exists(self.blob_path(blob_hash))
+
+    def read(self, blob_hash: str) -> bytes:
+        path = self.blob_path(blob_hash)
+        with open(path, "rb") as f:
+            data = f.read()
+        os.utime(path)
+        return data
+
+    def put(self, data: bytes, url: Optional[str] = None, content_type: str = "image/png") -> str:
+        """Store bytes (and optionally index them under a URL); returns the blob hash"""
+        return self._ingest([data], url, content_type)
+
+    def _ingest(self, chunks: Iterable[bytes], url: Optional[str], content_type: str) -> str:
+        """Write chunks to a temp file while hashing, then publish atomically"""
+        fd, tmp_path = self._new_temp()
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in chunks:
+                    size = self._check_size(size + len(chunk))
+                    digest.update(chunk)
+                    f.write(chunk)
+            return self._publish(tmp_path, digest.hexdigest(), size, url, content_type)
+        except BaseException:
+            self._discard(tmp_path)
+            raise
+
+    def _new_temp(self) -> Tuple[int, str]:
+        return tempfile.mkstemp(dir=os.path.join(self._get_root(), "blobs"), prefix=".tmp-")
+
+    @staticmethod
+    def _check_size(size: int) -> int:
+        if size > settings.download_max_bytes:
+            raise BlobTooLargeError(f"Image exceeds the {settings.download_max_bytes} byte limit")
+        return size
+
+    @staticmethod
+    def _discard(tmp_path: str):
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+    def _publish(self, tmp_path: str, blob_hash: str, size: int, url: Optional[str], content_type: str) -> str:
+        path = self.blob_path(blob_hash)
+        if os.path.exists(path):
+            # Same content already stored (by us or another worker)
+            os.unlink(tmp_path)
+            os.utime(path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+            self._account(size)
+
+        if url is not None:
+            self._write_index(url, blob_hash, content_type)
+        return blob_hash
+
+    def _write_index(self, url: str, blob_hash: str, content_type: str):
+        index_path = self._index_path(url)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(index_path), prefix=".tmp-")
+        with os.fdopen(fd, "w") as f:
+            f.write(f"{blob_hash}\n{content_type}")
+        os.replace(tmp_path, index_path)
+
+    # ===========================================
+    # CACHEABLE HOSTS (blocking)
+    # ===========================================
+
+    def remember_host(self, url: str):
+        """Record the host of a provider image URL so the download proxy may cache it"""
+        host = self._host(url)
+        if host is None or host in self._hosts:
+            return
+        # Recorded on disk so workers that did not run the generation see it too
+        try:
+            open(os.path.join(self._get_root(), "hosts", host), "a").close()
+        except OSError as e:
+            logger.debug("Could not record image host", host=host, error=str(e)[:200])
+            return
+        self._hosts.add(host)
+
+    def is_cacheable(self, url: str) -> bool:
+        """Whether the download proxy may store and index this URL"""
+        host = self._host(url)
+        if host is None:
+            return False
+        if host in self._hosts or host in settings.blob_cache_hosts_list:
+            return True
+        if os.path.exists(os.path.join(self._get_root(), "hosts", host)):
+            self._hosts.add(host)
+            return True
+        return False
+
+    # ===========================================
+    # EVICTION
+    # ===========================================
+
+    def _account(self, added: int):
+        with self._lock:
+            self._stored += 1
+            if self._approx_bytes is None or self._stored % self.RESCAN_EVERY == 0:
+                self._approx_bytes = self._scan_size()
+            else:
+                self._approx_bytes += added
+            over = self._approx_bytes > settings.blob_cache_max_bytes
+        if over:
+            self._evict()
+
+    def _scan_size(self) -> int:
+        total = 0
+        for entry in self._iter_blobs():
+            total += entry[2]
+        return total
+
+    def _iter_blobs(self):
+        """(path, mtime, size) of every blob"""
+        blobs_dir = os.path.join(self._get_root(), "blobs")
+        for shard in os.scandir(blobs_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                yield entry.path, stat.st_mtime, stat.st_size
+
+    def _evict(self):
+        """Delete least recently used blobs (and stale URL entries) down to the target size"""
+        lock_path = os.path.join(self._get_root(), ".evict.lock")
+        with open(lock_path, "w") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return  # Another worker is evicting
+
+            blobs = sorted(self._iter_blobs(), key=lambda b: b[1])
+            total = sum(b[2] for b in blobs)
+            target = settings.blob_cache_max_bytes * self.EVICT_TARGET
+            cutoff_mtime = None
+            removed = 0
+
+            for path, mtime, size in blobs:
+                if total <= target:
+                    break
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                removed += 1
+                cutoff_mtime = mtime
+
+            # URL entries not used since the newest evicted blob may point at deleted blobs
+            if cutoff_mtime is not None:
+                for entry in os.scandir(os.path.join(self._get_root(), "urls")):
+                    try:
+                        if entry.stat().st_mtime <= cutoff_mtime:
+                            os.unlink(entry.path)
+                    except FileNotFoundError:
+                        continue
+
+            with self._lock:
+                self._approx_bytes = total
+            self.evicted += removed
+            if removed:
+                logger.info(f"🧹 Evicted {removed} cached image(s)", cache_bytes=total)
+
+    # ===========================================
+    # FETCH (read-through)
+    # ===========================================
+
+    def _get_http(self) -> httpx.Client:
+        if self._http is None:
+            self._http = httpx.Client(
+                timeout=httpx.Timeout(settings.download_timeout, connect=settings.http_connect_timeout),
+                follow_redirects=True
+            )
+        return self._http
+
+    def fetch(self, url: str) -> bytes:
+        """Image bytes for a URL: from disk if cached, else downloaded once and stored (blocking)"""
+        if not self.enabled and self.local_hash(url) is None:
+            response = self._get_http().get(url)
+            response.raise_for_status()
+            return response.content
+
+        cached = self.lookup(url)
+        if cached is not None:
+            self.hits += 1
+            return self.read(cached[0])
+
+        self.misses += 1
+        with self._get_http().stream("GET", url) as response:
+            response.raise_for_status()
+            content_type = response.headers.get("content-type", "image/png")
+            blob_hash = self._ingest(response.iter_bytes(), url, content_type)
+        return self.read(blob_hash)
+
+    async def tee(self, url: str, chunks: AsyncIterator[bytes], content_type: str) -> AsyncIterator[bytes]:
+        """
+        Pass a download through to the caller while storing it.
+        The blob is published (and the URL indexed) only once the whole body
+        went through; an aborted or oversized stream leaves nothing behind.
+        """
+        self.misses += 1
+        fd, tmp_path = self._new_temp()
+        digest = hashlib.sha256()
+        size = 0
+        complete = False
+        try:
+            with os.fdopen(fd, "wb") as f:
+                async for chunk in chunks:
+                    size = self._check_size(size + len(chunk))
+                    digest.update(chunk)
+                    f.write(chunk)
+                    yield chunk
+            complete = True
+        finally:
+            if not complete:
+                self._discard(tmp_path)
+
+        try:
+            await asyncio.to_thread(self._publish, tmp_path, digest.hexdigest(), size, url, content_type)
+        except OSError as e:
+            # The client already has the image; only the cache entry is lost
+            self._discard(tmp_path)
+            logger.warning("Could not store downloaded image", error=str(e)[:200])
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            "approx_bytes": self._approx_bytes,
+            "max_bytes": settings.blob_cache_max_bytes,
+            "evicted": self.evicted,
+        }
+
+    def close(self):
+        if self._http is not None:
+            self._http.close()
+            self._http = None
+
+
+# Singleton instance
+blob_cache = BlobCache()
@@ -0,0 +1,138 @@
+"""
+Pixova AI - CLIP Inference Backends
+Text/image embedding engines for quality validation: PyTorch (reference)
+or an exported ONNX graph on ONNX Runtime (optionally int8-quantized)
+"""
+import json
+import os
+from typing import List, Optional
+
+import numpy as np
+from PIL import Image
+
+from config import settings
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+
+# File names written by scripts/export_clip_onnx.py
+ONNX_TEXT_FILE = "text.onnx"
+ONNX_VISION_FILE = "vision.onnx"
+ONNX_TEXT_INT8_FILE = "text.int8.onnx"
+ONNX_VISION_INT8_FILE = "vision.int8.onnx"
+ONNX_META_FILE = "clip.json"
+
+
+def _normalize(embeds: np.ndarray) -> np.ndarray:
+    return embeds / np.linalg.norm(embeds, axis=-1, keepdims=True)
+
+
+class ClipBackend:
+    """
+    Produces L2-normalized CLIP embeddings.
+    Similarity logits are `logit_scale * image_embeds @ text_embeds.T`,
+    the same as CLIPModel.forward.
+    """
+
+    name = "base"
+    logit_scale: float = 100.0
+
+    def encode_text(self, texts: List[str]) -> np.ndarray:
+        raise NotImplementedError
+
+    def encode_images(self, images: List[Image.Image]) -> np.ndarray:
+        raise NotImplementedError
+
+
+class TorchClipBackend(ClipBackend):
+    """Full-precision transformers CLIPModel on PyTorch"""
+
+    name = "torch"
+
+    def __init__(self, model_name: str, threads: int = 0):
+        import torch
+        from transformers import CLIPModel, CLIPProcessor
+
+        if threads:
+            torch.set_num_threads(threads)
+        self._torch = torch
+        self.model = CLIPModel.from_pretrained(model_name).eval()
+        self.processor = CLIPProcessor.from_pretrained(model_name)
+        self.logit_scale = float(self.model.logit_scale.exp().item())
+
+    @staticmethod
+    def _features(output):
+        # Newer transformers return a model output instead of the projected tensor
+        return output if hasattr(output, "numpy") else output.pooler_output
+
+    def encode_text(self, texts: List[str]) -> np.ndarray:
+        inputs = self.processor.tokenizer(texts, return_tensors="pt", padding=True)
+        with self._torch.no_grad():
+            embeds = self._features(self.model.get_text_features(**inputs))
+        return _normalize(embeds.numpy())
+
+    def encode_images(self, images: List[Image.Image]) -> np.ndarray:
+        pixel_values = self.processor.image_processor(images=images, return_tensors="pt")["pixel_values"]
+        with self._torch.no_grad():
+            embeds = self._features(self.model.get_image_features(pixel_values=pixel_values))
+        return _normalize(embeds.numpy())
+
+
+class OnnxClipBackend(ClipBackend):
+    """
+    Exported text and vision towers on ONNX Runtime (CPU).
+    No PyTorch in the worker; with the int8 graphs the weights are about
+    a quarter of the fp32 size and matmuls run on integer kernels.
+    """
+
+    name = "onnx"
+
+    def __init__(self, model_dir: str, quantized: bool = True, threads: int = 0):
+        import onnxruntime as ort
+        from transformers import CLIPProcessor
+
+        with open(os.path.join(model_dir, ONNX_META_FILE)) as f:
+            meta = json.load(f)
+        self.logit_scale = float(meta["logit_scale"])
+        self.processor = CLIPProcessor.from_pretrained(meta["model_name"])
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+
+        text_file, vision_file = (
+            (ONNX_TEXT_INT8_FILE, ONNX_VISION_INT8_FILE) if quantized else (ONNX_TEXT_FILE, ONNX_VISION_FILE)
+        )
+        providers = ["CPUExecutionProvider"]
+        self._text = ort.InferenceSession(os.path.join(model_dir, text_file), options, providers=providers)
+        self._vision = ort.InferenceSession(os.path.join(model_dir, vision_file), options, providers=providers)
+        self.name = "onnx-int8" if quantized else "onnx"
+
+    def encode_text(self, texts: List[str]) -> np.ndarray:
+        inputs = self.processor.tokenizer(texts, return_tensors="np", padding=True)
+        feeds = {
+            "input_ids": inputs["input_ids"].astype(np.int64),
+            "attention_mask": inputs["attention_mask"].astype(np.int64),
+        }
+        return _normalize(self._text.run(None, feeds)[0])
+
+    def encode_images(self, images: List[Image.Image]) -> np.ndarray:
+        pixel_values = self.processor.image_processor(images=images, return_tensors="np")["pixel_values"]
+        return _normalize(self._vision.run(None, {"pixel_values": pixel_values.astype(np.float32)})[0])
+
+
+def create_clip_backend(backend: Optional[str] = None) -> ClipBackend:
+    """
+    Build the configured backend.
+    Falls back to PyTorch if the ONNX runtime or exported graphs are unavailable.
+    """
+    backend = backend or settings.clip_backend
+    if backend == "onnx":
+        try:
+            return OnnxClipBackend(settings.clip_onnx_dir, settings.clip_onnx_quantized, settings.clip_threads)
+        except Exception as e:
+            logger.warning("ONNX CLIP backend unavailable, using torch", error=str(e), model_dir=settings.clip_onnx_dir)
+    return TorchClipBackend(settings.clip_model_name, settings.clip_threads)
@@ -4,7 +4,7 @@ Centralized, validated configuration with environment-based overrides
 """
 from pydantic_settings import BaseSettings
 from pydantic import Field, field_validator
-from typing import List
+from typing import Dict, List
 from functools import lru_cache
 import os
 
@@ -37,11 +37,49 @@ class Settings(BaseSettings):
     a4f_base_url: str = "https://api.a4f.co/v1"
     api_timeout: int = Field(default=120, ge=10, le=300)
     
+    # ===========================================
+    # HTTP CONNECTION POOL (image API)
+    # ===========================================
+    http_max_connections: int = Field(default=64, ge=1, le=1024, description="Max concurrent sockets to the image API")
+    http_max_keepalive: int = Field(default=16, ge=0, le=1024, description="Idle keep-alive sockets kept in the pool")
+    http_keepalive_expiry: float = Field(default=30.0, ge=1.0, description="Seconds an idle socket is kept alive")
+    http_connect_timeout: float = Field(default=10.0, ge=1.0, description="TCP/TLS connect timeout in seconds")
+    
+    # ===========================================
+    # IMAGE DOWNLOAD PROXY (/api/download)
+    # ===========================================
+    download_timeout: float = Field(default=30.0, ge=1.0, description="Upstream read timeout for proxied downloads")
+    download_max_connections: int = Field(default=32, ge=1, le=1024, description="Max sockets to image hosts")
+    download_max_bytes: int = Field(default=25 * 1024 * 1024, ge=1024, description="Largest image the proxy will stream")
+    
+    # ===========================================
+    # IMAGE BLOB CACHE (downloads, post-processing, validation)
+    # ===========================================
+    blob_cache_enabled: bool = Field(default=True, description="Cache provider images on local disk by content hash")
+    blob_cache_dir: str = Field(default="/tmp/pixova/blobs", description="Blob cache directory (shared by workers)")
+    blob_cache_max_bytes: int = Field(default=1024 * 1024 * 1024, ge=1024 * 1024, description="Disk budget before LRU eviction")
+    blob_cache_hosts: str = Field(
+        default="",
+        description="Comma-separated image hosts /api/download may cache (provider hosts seen in generations are added automatically)"
+    )
+    
     # ===========================================
     # RATE LIMITING
     # ===========================================
     rate_limit_requests: int = Field(default=300, description="Requests per window (5/min)")
     rate_limit_window: int = Field(default=3600, description="Window in seconds (1 hour)")
+    rate_limit_backend: str = Field(default="sqlite", description="memory|sqlite (sqlite is shared across workers)")
+    rate_limit_sqlite_path: str = Field(default="/tmp/pixova/rate_limits.sqlite3", description="SQLite limiter file")
+    rate_limit_busy_timeout_ms: int = Field(
+        default=1000, ge=1, le=10000,
+        description="Max wait (off the event loop) for the shared limiter lock before falling back to the in-process limiter"
+    )
+    rate_limit_max_clients: int = Field(default=10000, ge=100, description="Max clients tracked in memory (LRU)")
+    rate_limit_route_costs: str = Field(
+        default="/api/jobs/:0,/api/images/:0",
+        description="Comma-separated path:cost overrides (trailing '/' = prefix); other routes cost 1"
+    )
+    rate_limit_variation_cost: int = Field(default=1, ge=0, description="Extra cost per variation beyond the first")
     
     # ===========================================
     # CORS CONFIGURATION
@@ -67,6 +105,76 @@ class Settings(BaseSettings):
     retry_base_delay: float = Field(default=1.0, description="Base delay in seconds")
     retry_max_delay: float = Field(default=10.0, description="Max delay in seconds")
     
+    # ===========================================
+    # CONCURRENCY CONFIGURATION
+    # ===========================================
+    concurrent_variations: bool = Field(default=True, description="Generate variations in parallel")
+    max_concurrent_variations: int = Field(default=3, ge=1, le=5, description="Per-request cap on parallel variations")
+    
+    # ===========================================
+    # POST-PROCESSING (per-request opt-in, process pool)
+    # ===========================================
+    processing_enabled: bool = Field(default=True, description="Allow requests to opt into post-processing")
+    processing_workers: int = Field(default=0, ge=0, le=64, description="Pool processes per worker (0 = CPU count / WORKERS)")
+    processing_max_queued: int = Field(default=8, ge=0, description="Jobs allowed to wait beyond the busy workers")
+    processing_queue_wait: float = Field(default=2.0, ge=0.0, description="Seconds to wait for pool capacity before skipping")
+    processing_timeout: float = Field(default=20.0, ge=1.0, description="Per-image processing timeout in seconds")
+    processing_palette_colors: int = Field(default=128, ge=2, le=256, description="Palette size for styles without their own")
+    processing_palette_sizes: str = Field(
+        default="minimalist:12,corporate:24,elegant:24,modern:48,creative:96,vibrant:128",
+        description="Comma-separated style:colors palette sizes"
+    )
+    processing_sample_pixels: int = Field(default=65536, ge=1024, description="Pixels sampled to fit the palette")
+    processing_tile_size: int = Field(default=512, ge=0, description="Process images in tiles of this size (0 = whole image)")
+    
+    # ===========================================
+    # QUALITY VALIDATION (CLIP inference)
+    # ===========================================
+    clip_backend: str = Field(default="torch", description="torch|onnx (onnx: exported graph via ONNX Runtime)")
+    clip_model_name: str = Field(default="openai/clip-vit-base-patch32", description="CLIP checkpoint (tokenizer/preprocessing too)")
+    clip_onnx_dir: str = Field(default="./models/clip-onnx", description="Output of scripts/export_clip_onnx.py")
+    clip_onnx_quantized: bool = Field(default=True, description="Use the int8 (dynamically quantized) ONNX graphs")
+    clip_threads: int = Field(default=0, ge=0, le=64, description="Inference threads per worker (0 = runtime default)")
+    clip_text_cache_size: int = Field(default=256, ge=1, description="Positive-prompt embeddings kept in memory (LRU)")
+    
+    # ===========================================
+    # VALIDATION SIDECAR (one shared CLIP process per host)
+    # ===========================================
+    validation_sidecar_enabled: bool = Field(default=False, description="Score via validation_server.py over a Unix socket")
+    validation_socket_path: str = Field(default="/tmp/pixova/validation.sock", description="Sidecar Unix socket")
+    validation_timeout: float = Field(default=15.0, ge=0.5, description="Seconds to wait for the sidecar before leaving images unscored")
+    validation_max_batch: int = Field(default=32, ge=1, le=256, description="Most images per sidecar forward pass")
+    validation_batch_window_ms: float = Field(default=5.0, ge=0.0, description="How long the sidecar waits to fill a batch")
+    
+    # ===========================================
+    # VALIDATED GENERATION (per-request opt-in)
+    # ===========================================
+    validated_generation_enabled: bool = Field(default=True, description="Allow requests to opt into validated generation")
+    validation_threshold: float = Field(default=0.28, ge=0.0, le=1.0, description="CLIP score below which a variation is regenerated")
+    validation_latency_budget: float = Field(default=45.0, ge=0.0, description="Seconds after request start past which no regeneration starts")
+    validation_max_regenerations: int = Field(default=2, ge=0, le=10, description="Extra model calls for regeneration allowed per request")
+    
+    # ===========================================
+    # SCHEDULER (upstream call queue, per worker)
+    # ===========================================
+    scheduler_enabled: bool = Field(default=True, description="Queue upstream calls by plan priority")
+    scheduler_max_concurrent: int = Field(default=16, ge=1, le=1024, description="Upstream image API calls in flight at once")
+    scheduler_max_queue_wait: float = Field(default=25.0, ge=1.0, description="Reject with 503 when queue wait would exceed this (s)")
+    scheduler_default_service_seconds: float = Field(default=10.0, gt=0.0, description="Assumed call duration before samples exist")
+    gateway_secret: str = Field(
+        default="",
+        description="Shared secret of the authenticating gateway; plan headers are only trusted with it (empty = every caller is free)"
+    )
+    
+    # ===========================================
+    # HEDGED REQUESTS (opt-in)
+    # ===========================================
+    hedging_enabled: bool = Field(default=False, description="Start the next model in parallel when the current one is slow")
+    hedge_quantile: float = Field(default=0.9, gt=0.0, lt=1.0, description="Latency quantile used as the hedge delay")
+    hedge_min_samples: int = Field(default=10, ge=1, description="Latency samples needed before the quantile is trusted")
+    hedge_default_delay: float = Field(default=15.0, ge=0.5, description="Hedge delay in seconds until enough samples exist")
+    max_hedges_per_request: int = Field(default=2, ge=0, le=10, description="Extra parallel model calls allowed per request")
+    
     # ===========================================
     # MODEL CONFIGURATION (Working models prioritized)
     # ===========================================
@@ -76,11 +184,72 @@ class Settings(BaseSettings):
         description="Comma-separated list of fallback models (working first, then non-working)"
     )
     
+    # ===========================================
+    # IMAGE RESPONSE FORMAT
+    # ===========================================
+    image_response_format: str = Field(
+        default="url",
+        description="url|b64_json (b64_json: image bytes come back inline, no second download)"
+    )
+    b64_json_models: str = Field(
+        default="*",
+        description="Comma-separated models to ask for b64_json ('*' = all); others use URLs"
+    )
+    public_base_url: str = Field(
+        default="",
+        description="Base URL clients use to reach this API (for /api/images links; empty = relative links)"
+    )
+    
+    # ===========================================
+    # RESULT CACHE
+    # ===========================================
+    cache_enabled: bool = Field(default=True, description="Serve identical generation requests from cache")
+    cache_backend: str = Field(default="memory", description="memory|sqlite (sqlite is shared across workers)")
+    cache_ttl_seconds: int = Field(default=3600, ge=1, description="Entry lifetime (keep below provider URL expiry)")
+    cache_max_entries: int = Field(default=1000, ge=1, description="LRU bound on cached results")
+    cache_sqlite_path: str = Field(default="/tmp/pixova/result_cache.sqlite3", description="SQLite cache file")
+    
+    # ===========================================
+    # ASYNC JOBS (POST /api/jobs)
+    # ===========================================
+    jobs_backend: str = Field(default="sqlite", description="memory|sqlite (sqlite lets any worker serve job status)")
+    jobs_sqlite_path: str = Field(default="/tmp/pixova/jobs.sqlite3", description="SQLite job store file")
+    jobs_ttl_seconds: int = Field(default=3600, ge=60, description="How long finished jobs stay queryable")
+    jobs_max_retained: int = Field(default=1000, ge=10, description="Max jobs kept by the memory store")
+    jobs_poll_interval: float = Field(default=0.5, gt=0.0, description="Event poll interval for jobs run by another worker")
+    jobs_keepalive_seconds: float = Field(default=15.0, ge=1.0, description="SSE keep-alive comment interval")
+    
+    # ===========================================
+    # MODEL SCOREBOARD (adaptive fallback ordering)
+    # ===========================================
+    adaptive_model_order: bool = Field(default=True, description="Reorder the model chain by live success/latency stats")
+    scoreboard_window: int = Field(default=50, ge=5, le=1000, description="Recent calls per model in the rolling success rate")
+    scoreboard_ewma_alpha: float = Field(default=0.2, gt=0.0, le=1.0, description="EWMA smoothing for model latency")
+    scoreboard_min_samples: int = Field(default=3, ge=1, description="Calls needed before a model is ranked by its stats")
+    scoreboard_min_success_rate: float = Field(default=0.5, ge=0.0, le=1.0, description="Below this a model is ranked as failing")
+    scoreboard_slow_ms: int = Field(default=30000, ge=1000, description="EWMA latency above this ranks a model as slow")
+    scoreboard_recovery_seconds: int = Field(default=300, ge=0, description="Failing models are retried after this long without failures")
+    
+    # ===========================================
+    # CIRCUIT BREAKERS (per model)
+    # ===========================================
+    circuit_breaker_enabled: bool = Field(default=True, description="Skip models whose circuit is open")
+    circuit_failure_threshold: int = Field(default=5, ge=1, description="Consecutive failures that open a circuit")
+    circuit_error_rate_threshold: float = Field(default=0.5, gt=0.0, le=1.0, description="Windowed error rate that opens a circuit")
+    circuit_window: int = Field(default=20, ge=1, description="Recent calls considered for the error rate")
+    circuit_min_calls: int = Field(default=10, ge=1, description="Calls in window before the error rate can trip")
+    circuit_cooldown_seconds: float = Field(default=30.0, ge=1.0, description="Open time before a half-open probe")
+    
     # ===========================================
     # LOGGING
     # ===========================================
     log_level: str = Field(default="INFO", description="DEBUG|INFO|WARNING|ERROR")
     log_format: str = "json"  # json or text
+    log_async: bool = Field(default=True, description="Write logs from a background thread (callers only enqueue)")
+    log_queue_size: int = Field(default=10000, ge=1, description="Records buffered for the log writer thread")
+    log_queue_policy: str = Field(default="drop", description="drop|block when the log queue is full")
+    log_block_timeout: float = Field(default=0.05, ge=0.0, description="Max seconds a caller waits for queue space (block policy)")
+    log_batch_size: int = Field(default=256, ge=1, description="Most records per write to stdout")
     
     # ===========================================
     # VALIDATORS
@@ -93,6 +262,42 @@ class Settings(BaseSettings):
             raise ValueError(f"environment must be one of {allowed}")
         return v
     
+    @field_validator("cache_backend", "jobs_backend", "rate_limit_backend")
+    @classmethod
+    def validate_storage_backend(cls, v: str) -> str:
+        allowed = {"memory", "sqlite"}
+        v = v.lower()
+        if v not in allowed:
+            raise ValueError(f"storage backend must be one of {allowed}")
+        return v
+    
+    @field_validator("image_response_format")
+    @classmethod
+    def validate_image_response_format(cls, v: str) -> str:
+        allowed = {"url", "b64_json"}
+        v = v.lower()
+        if v not in allowed:
+            raise ValueError(f"image_response_format must be one of {allowed}")
+        return v
+    
+    @field_validator("clip_backend")
+    @classmethod
+    def validate_clip_backend(cls, v: str) -> str:
+        allowed = {"torch", "onnx"}
+        v = v.lower()
+        if v not in allowed:
+            raise ValueError(f"clip_backend must be one of {allowed}")
+        return v
+    
+    @field_validator("log_queue_policy")
+    @classmethod
+    def validate_log_queue_policy(cls, v: str) -> str:
+        allowed = {"drop", "block"}
+        v = v.lower()
+        if v not in allowed:
+            raise ValueError(f"log_queue_policy must be one of {allowed}")
+        return v
+    
     @field_validator("log_level")
     @classmethod
     def validate_log_level(cls, v: str) -> str:
@@ -123,6 +328,30 @@ class Settings(BaseSettings):
         """Parse fallback models from comma-separated string"""
         return [model.strip() for model in self.fallback_models.split(",") if model.strip()]
     
+    @property
+    def blob_cache_hosts_list(self) -> List[str]:
+        """Parse cacheable download hosts from comma-separated string"""
+        return [host.strip().lower() for host in self.blob_cache_hosts.split(",") if host.strip()]
+    
+    @property
+    def b64_json_models_list(self) -> List[str]:
+        """Parse b64_json-capable models from comma-separated string"""
+        return [model.strip() for model in self.b64_json_models.split(",") if model.strip()]
+    
+    @property
+    def processing_palette_sizes_map(self) -> Dict[str, int]:
+        """Parse style:colors palette sizes (clamped to 2-256)"""
+        sizes = {}
+        for item in self.processing_palette_sizes.split(","):
+            style, _, colors = item.partition(":")
+            if style.strip() and colors.strip().isdigit():
+                sizes[style.strip()] = min(max(int(colors), 2), 256)
+        return sizes
+    
+    def palette_colors(self, style: str) -> int:
+        """Post-processing palette size for a style preset"""
+        return self.processing_palette_sizes_map.get(style, self.processing_palette_colors)
+    
     @property
     def all_models(self) -> List[str]:
         """Get full model chain (primary + fallbacks)"""
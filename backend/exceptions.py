@@ -79,6 +79,30 @@ class UnsupportedDesignTypeError(ValidationError):
         )
 
 
+class JobNotFoundError(PixovaException):
+    """Unknown or expired job id"""
+    status_code = 404
+    error_code = "JOB_NOT_FOUND"
+    
+    def __init__(self, job_id: str):
+        super().__init__(
+            f"Job '{job_id}' not found or expired",
+            details={"job_id": job_id}
+        )
+
+
+class ImageNotFoundError(PixovaException):
+    """Unknown or evicted stored image"""
+    status_code = 404
+    error_code = "IMAGE_NOT_FOUND"
+    
+    def __init__(self, image_id: str):
+        super().__init__(
+            f"Image '{image_id}' not found or expired",
+            details={"image_id": image_id}
+        )
+
+
 class RateLimitError(PixovaException):
     """Rate limit exceeded"""
     status_code = 429
@@ -125,6 +149,19 @@ class APITimeoutError(GenerationError):
     status_code = 504
 
 
+class ServiceOverloadedError(PixovaException):
+    """Generation queue too deep to finish within the deadline"""
+    status_code = 503
+    error_code = "SERVICE_OVERLOADED"
+    
+    def __init__(self, retry_after: int = 30, estimated_wait: float = 0.0):
+        super().__init__(
+            "Generation queue is full. Please retry shortly.",
+            details={"retry_after_seconds": retry_after, "estimated_wait_seconds": round(estimated_wait, 1)}
+        )
+        self.retry_after = retry_after
+
+
 class ConfigurationError(PixovaException):
     """Application misconfiguration"""
     status_code = 500
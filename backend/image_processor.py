@@ -6,9 +6,11 @@ Fixes AI-generated logo weaknesses: gradients, soft shadows, blurry edges, text
 import io
 import numpy as np
 from PIL import Image, ImageEnhance, ImageFilter
-import requests
-from typing import Optional
+from typing import Any, Dict, List, Optional, Tuple
+from config import settings
 from logger import get_logger
+from blob_cache import blob_cache
+from quantizer import PaletteQuantizer
 
 logger = get_logger(__name__)
 
@@ -16,84 +18,190 @@ logger = get_logger(__name__)
 class ImageProcessor:
     """Post-processing pipeline to enforce logo discipline"""
     
+    # Paeth's median-of-9 network: compare-exchange pairs, median ends in slot 4
+    MEDIAN9_NETWORK = (
+        (1, 2), (4, 5), (7, 8), (0, 1), (3, 4), (6, 7), (1, 2), (4, 5), (7, 8),
+        (0, 3), (5, 8), (4, 7), (3, 6), (1, 4), (2, 5), (4, 7), (4, 2), (6, 4), (4, 2),
+    )
+    MEDIAN_STRIP_ROWS = 128  # Rows per median-filter strip
+    TILE_HALO = 16           # Border around each tile; covers UnsharpMask(3) + SMOOTH + median (10px)
+    
     def __init__(self):
         self.gradient_threshold = 15  # Max color distance for "flat" colors (AGGRESSIVE)
         self.edge_strength = 3.0      # Edge sharpening multiplier (MAXIMUM)
         self.color_bits = 4           # Bits per channel for posterization (16 colors per channel)
         self.contrast_boost = 2.5     # Contrast enhancement (EXTREME)
+        self.palette_colors = settings.processing_palette_colors  # Default palette size
+        self.quantizer = PaletteQuantizer(settings.processing_sample_pixels)
         
-    def process_logo(self, image_url: str) -> Optional[bytes]:
+    def process_logo(self, image_url: str, image_bytes: Optional[bytes] = None) -> Optional[bytes]:
         """
         Download and process logo image
         Returns processed image as bytes, or None if processing fails
+        
+        Pass `image_bytes` when the image is already in memory (b64_json
+        generations) to skip the download.
         """
         try:
             logger.info(f"⚙️ Processing image: {image_url[:60]}...")
             
-            # Download image
-            response = requests.get(image_url, timeout=30)
-            response.raise_for_status()
-            image = Image.open(io.BytesIO(response.content))
+            # Download image (at most once per host via the blob cache)
+            if image_bytes is None:
+                image_bytes = blob_cache.fetch(image_url)
             
-            # Convert to RGB if needed
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
+            return self.process_bytes(image_bytes)
             
-            # Apply processing pipeline
-            image = self._flatten_gradients(image)
-            image = self._binarize_colors(image)
-            image = self._sharpen_edges(image)
-            image = self._remove_noise(image)
+        except Exception as e:
+            logger.error(f"❌ Image processing failed: {str(e)}")
+            return None
+    
+    def process_bytes(self, image_bytes: bytes, colors: Optional[int] = None) -> Optional[bytes]:
+        """
+        Process an in-memory logo image
+        Returns processed image as PNG bytes, or None if processing fails
+        """
+        result = self.process_with_palette(image_bytes, colors)
+        return result[0] if result is not None else None
+    
+    def process_with_palette(
+        self,
+        image_bytes: bytes,
+        colors: Optional[int] = None
+    ) -> Optional[Tuple[bytes, List[Dict[str, Any]]]]:
+        """
+        Process an in-memory logo image with a palette of at most `colors` colors
+        Returns (PNG bytes, palette), or None if processing fails
+        """
+        try:
+            image, palette = self._run(Image.open(io.BytesIO(image_bytes)), colors)
             
             # Convert back to bytes
             output = io.BytesIO()
             image.save(output, format='PNG', optimize=True)
             
-            logger.info("✅ Image processing complete")
-            return output.getvalue()
+            logger.info(f"✅ Image processing complete ({len(palette)} colors)")
+            return output.getvalue(), palette
             
         except Exception as e:
             logger.error(f"❌ Image processing failed: {str(e)}")
             return None
     
-    def _flatten_gradients(self, image: Image.Image) -> Image.Image:
+    def process_image(self, image: Image.Image, colors: Optional[int] = None) -> Image.Image:
+        """Apply the processing pipeline to a decoded image"""
+        return self._run(image, colors)[0]
+    
+    def _run(self, image: Image.Image, colors: Optional[int]) -> Tuple[Image.Image, List[Dict[str, Any]]]:
         """
-        Reduce gradients to solid colors
-        Strategy: Aggressive posterization + extreme contrast
+        Run the pipeline tile by tile.
+        
+        Only the palette needs the whole image (a sample and a histogram);
+        every other stage is computed per tile with a TILE_HALO border of real
+        neighbors, so the output is identical to processing the full frame
+        while intermediate copies stay tile-sized.
         """
-        logger.debug("→ Flattening gradients (AGGRESSIVE MODE)...")
+        # Convert to RGB if needed
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        pixels = np.asarray(image)
+        del image
+        
+        height, width = pixels.shape[:2]
+        tile = settings.processing_tile_size or max(height, width)
+        tiles = [
+            (top, left, min(top + tile, height), min(left + tile, width))
+            for top in range(0, height, tile)
+            for left in range(0, width, tile)
+        ]
         
-        # AGGRESSIVE: Posterize to 4-bit per channel (16 levels)
+        lut, final_palette, counts = self._fit_palette(pixels, colors or self.palette_colors, tiles)
+        
+        result = Image.new('RGB', (width, height))
+        for top, left, bottom, right in tiles:
+            # Tile plus halo, clipped at the image border (where filters replicate edges anyway)
+            y0, x0 = max(top - self.TILE_HALO, 0), max(left - self.TILE_HALO, 0)
+            y1, x1 = min(bottom + self.TILE_HALO, height), min(right + self.TILE_HALO, width)
+            
+            region = self._flatten_gradients(pixels[y0:y1, x0:x1], final_palette, lut)
+            region = self._sharpen_edges(region)
+            region = self._remove_noise(region)
+            result.paste(region.crop((left - x0, top - y0, right - x0, bottom - y0)), (left, top))
+        
+        return result, self._describe_palette(final_palette, counts)
+    
+    def _fit_palette(
+        self,
+        pixels: np.ndarray,
+        colors: int,
+        tiles: List[Tuple[int, int, int, int]]
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Fit the palette and derive the contrast-adjusted, snapped palette
+        Returns (color-bin lookup table, final palette, pixel counts per entry)
+        """
+        # AGGRESSIVE: Posterize to a small k-means palette
         # This brutally collapses gradients into discrete bands
-        posterized = image.quantize(colors=128, method=Image.MEDIANCUT).convert('RGB')
+        palette = self.quantizer.fit(pixels, colors)
+        lut = self.quantizer.build_lut(palette)
         
-        # EXTREME contrast enhancement
-        enhancer = ImageEnhance.Contrast(posterized)
-        result = enhancer.enhance(self.contrast_boost)  # 2.5x contrast!
+        counts = np.zeros(len(palette), dtype=np.int64)
+        for top, left, bottom, right in tiles:
+            indices = self.quantizer.map(pixels[top:bottom, left:right], lut)
+            counts += np.bincount(indices.ravel(), minlength=len(palette))
         
-        return result
+        # EXTREME contrast enhancement pivots on the mean gray level,
+        # computed exactly from the palette histogram (PIL's RGB->L weights)
+        wide = palette.astype(np.int64)
+        luma = (wide[:, 0] * 19595 + wide[:, 1] * 38470 + wide[:, 2] * 7471 + 0x8000) >> 16
+        mean = int(float((luma * counts).sum()) / counts.sum() + 0.5)
+        
+        final_palette = self._binarize_colors(self._contrast_lut(mean))[palette]
+        return lut, final_palette, counts
+    
+    def _flatten_gradients(self, pixels: np.ndarray, final_palette: np.ndarray, lut: np.ndarray) -> Image.Image:
+        """
+        Reduce gradients to solid colors
+        Strategy: Aggressive posterization + extreme contrast + palette snapping
+        
+        Contrast and snapping are per-color operations, so they are already
+        folded into `final_palette`; each pixel costs two table lookups.
+        """
+        logger.debug("→ Flattening gradients (AGGRESSIVE MODE)...")
+        return Image.fromarray(final_palette[self.quantizer.map(pixels, lut)])
+    
+    @staticmethod
+    def _describe_palette(palette: np.ndarray, counts: np.ndarray) -> List[Dict[str, Any]]:
+        """Distinct colors with their pixel share, most used first"""
+        shares: Dict[str, int] = {}
+        for (r, g, b), count in zip(palette.tolist(), counts.tolist()):
+            if count:
+                key = f"#{r:02x}{g:02x}{b:02x}"
+                shares[key] = shares.get(key, 0) + count
+        total = sum(shares.values())
+        return [
+            {"hex": key, "share": round(count / total, 4)}
+            for key, count in sorted(shares.items(), key=lambda item: -item[1])
+        ]
+    
+    def _contrast_lut(self, mean: int) -> np.ndarray:
+        """
+        Contrast lookup table matching ImageEnhance.Contrast (Image.blend with
+        a gray image: clamp, then truncate toward zero)
+        """
+        levels = np.arange(256, dtype=np.float32)
+        blended = np.float32(mean) + np.float32(self.contrast_boost) * (levels - np.float32(mean))
+        return np.clip(blended, 0, 255).astype(np.uint8)
     
-    def _binarize_colors(self, image: Image.Image) -> Image.Image:
+    def _binarize_colors(self, lut: np.ndarray) -> np.ndarray:
         """
         Force colors toward solid values (eliminate ALL bleeding)
-        Strategy: Snap to 16-value color steps (0, 16, 32, 48...240, 255)
+        Strategy: Snap to 16-value color steps (0, 16, 32, 48...240)
+        Applied to a 256-entry lookup table rather than to pixels.
         """
         logger.debug("→ Binarizing colors (SNAPPING TO PALETTE)...")
         
-        # Convert to numpy for aggressive color quantization
-        img_array = np.array(image)
-        pixels = img_array.reshape(-1, 3)
-        
         # AGGRESSIVE: Snap to 16-value steps (ultra clean)
         # This creates pure, vector-like colors with ZERO bleeding
-        quantized = (pixels // 16) * 16
-        quantized = np.clip(quantized, 0, 255).astype(np.uint8)
-        
-        # Reshape back to image
-        result_array = quantized.reshape(img_array.shape)
-        result = Image.fromarray(result_array)
-        
-        return result
+        return (lut // 16) * 16
     
     def _sharpen_edges(self, image: Image.Image) -> Image.Image:
         """
@@ -119,13 +227,40 @@ class ImageProcessor:
         """
         Remove small artifacts and noise
         Strategy: Median filter to smooth small imperfections
+        
+        3x3 median per channel (edges replicated, same output as
+        ImageFilter.MedianFilter(3)) computed with a 19-step min/max sorting
+        network over row strips, in place on one uint8 array.
         """
         logger.debug("→ Removing noise...")
         
         # Median filter removes salt-and-pepper noise while preserving edges
-        result = image.filter(ImageFilter.MedianFilter(size=3))
+        pixels = np.array(image, dtype=np.uint8)
+        padded = np.pad(pixels, ((1, 1), (1, 1), (0, 0)), mode='edge')
+        height, width = pixels.shape[:2]
         
-        return result
+        # Scratch planes are reused for every strip (bounded extra memory)
+        strip = min(self.MEDIAN_STRIP_ROWS, height)
+        planes = [np.empty((strip, width, 3), dtype=np.uint8) for _ in range(10)]
+        
+        for top in range(0, height, strip):
+            rows = min(strip, height - top)
+            window = [plane[:rows] for plane in planes]
+            for i in range(9):
+                dy, dx = divmod(i, 3)
+                np.copyto(window[i], padded[top + dy:top + dy + rows, dx:dx + width])
+            pixels[top:top + rows] = self._median9(window)
+        
+        return Image.fromarray(pixels)
+    
+    def _median9(self, p: list) -> np.ndarray:
+        """Element-wise median of 9 equal-shape arrays (p[9] is scratch space)"""
+        spare = p[9]
+        for a, b in self.MEDIAN9_NETWORK:
+            np.minimum(p[a], p[b], out=spare)
+            np.maximum(p[a], p[b], out=p[b])
+            p[a], spare = spare, p[a]
+        return p[4]
 
 
 # Global processor instance
@@ -0,0 +1,344 @@
+"""
+Pixova AI - Asynchronous Generation Jobs
+Job store, background runner and event stream for POST /api/jobs
+"""
+import asyncio
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from config import settings
+from logger import get_logger
+from models import GenerationStatus
+from exceptions import PixovaException
+from utils import open_sqlite
+
+logger = get_logger(__name__)
+
+# (sequence number, event name, payload)
+JobEvent = Tuple[int, str, Dict[str, Any]]
+
+
+# ===========================================
+# JOB STORES
+# ===========================================
+
+class JobStore:
+    """In-process job store (jobs are only visible to the worker that created them)"""
+
+    name = "memory"
+    blocking = False
+
+    def __init__(self, max_jobs: int):
+        self._max_jobs = max_jobs
+        self._jobs: OrderedDict[str, Dict[str, Any]] = OrderedDict()
+        self._events: Dict[str, List[JobEvent]] = {}
+
+    def create(self, job_id: str, job: Dict[str, Any]):
+        self._jobs[job_id] = job
+        self._events[job_id] = []
+        while len(self._jobs) > self._max_jobs:
+            old_id, _ = self._jobs.popitem(last=False)
+            self._events.pop(old_id, None)
+
+    def save(self, job_id: str, job: Dict[str, Any]):
+        if job_id in self._jobs:
+            self._jobs[job_id] = job
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self._jobs.get(job_id)
+
+    def append_event(self, job_id: str, event: str, data: Dict[str, Any]):
+        events = self._events.get(job_id)
+        if events is not None:
+            events.append((len(events) + 1, event, data))
+
+    def events_after(self, job_id: str, seq: int) -> List[JobEvent]:
+        return [e for e in self._events.get(job_id, []) if e[0] > seq]
+
+    def prune(self, older_than: float):
+        expired = [jid for jid, job in self._jobs.items() if job["created_ts"] < older_than]
+        for job_id in expired:
+            del self._jobs[job_id]
+            self._events.pop(job_id, None)
+
+    def close(self):
+        pass
+
+
+class SQLiteJobStore(JobStore):
+    """
+    SQLite job store shared by all gunicorn workers on the host, so status
+    polling and event streams work whichever worker serves them.
+    Only the worker running a job writes to it.
+    """
+
+    name = "sqlite"
+    blocking = True
+
+    def __init__(self, path: str, max_jobs: int):
+        self._max_jobs = max_jobs
+        self._lock = threading.Lock()
+        self._conn = open_sqlite(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "job_id TEXT PRIMARY KEY, data TEXT NOT NULL, created_ts REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS job_events ("
+            "job_id TEXT NOT NULL, seq INTEGER NOT NULL, event TEXT NOT NULL, data TEXT NOT NULL, "
+            "PRIMARY KEY (job_id, seq))"
+        )
+
+    def create(self, job_id: str, job: Dict[str, Any]):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (job_id, data, created_ts) VALUES (?, ?, ?)",
+                (job_id, json.dumps(job), job["created_ts"])
+            )
+
+    def save(self, job_id: str, job: Dict[str, Any]):
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET data = ? WHERE job_id = ?", (json.dumps(job), job_id))
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def append_event(self, job_id: str, event: str, data: Dict[str, Any]):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO job_events (job_id, seq, event, data) "
+                "SELECT ?, COALESCE(MAX(seq), 0) + 1, ?, ? FROM job_events WHERE job_id = ?",
+                (job_id, event, json.dumps(data), job_id)
+            )
+
+    def events_after(self, job_id: str, seq: int) -> List[JobEvent]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, event, data FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq",
+                (job_id, seq)
+            ).fetchall()
+        return [(row[0], row[1], json.loads(row[2])) for row in rows]
+
+    def prune(self, older_than: float):
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM job_events WHERE job_id IN (SELECT job_id FROM jobs WHERE created_ts < ?)",
+                (older_than,)
+            )
+            self._conn.execute("DELETE FROM jobs WHERE created_ts < ?", (older_than,))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# ===========================================
+# JOB MANAGER
+# ===========================================
+
+FINISHED_STATUSES = {GenerationStatus.COMPLETED.value, GenerationStatus.FAILED.value}
+
+
+class JobManager:
+    """
+    Runs generation jobs in the background and publishes their progress.
+    Each completed variation is appended as an event as soon as it lands,
+    so event streams deliver the first image in first-variation time.
+    """
+
+    PRUNE_EVERY = 100  # Prune expired jobs every N created jobs
+
+    def __init__(self):
+        self._store: Optional[JobStore] = None
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._wakeups: Dict[str, asyncio.Event] = {}
+        self._created = 0
+
+    def _get_store(self) -> JobStore:
+        """Lazy store creation (falls back to memory if SQLite is unavailable)"""
+        if self._store is None:
+            if settings.jobs_backend == "sqlite":
+                try:
+                    self._store = SQLiteJobStore(settings.jobs_sqlite_path, settings.jobs_max_retained)
+                except Exception as e:
+                    logger.warning("SQLite job store unavailable, using memory", error=str(e))
+            if self._store is None:
+                self._store = JobStore(settings.jobs_max_retained)
+            logger.info(f"🗂️ Job store ready ({self._store.name})")
+        return self._store
+
+    async def _call(self, method: str, *args):
+        store = self._get_store()
+        func = getattr(store, method)
+        if store.blocking:
+            return await asyncio.to_thread(func, *args)
+        return func(*args)
+
+    def _notify(self, job_id: str, final: bool = False):
+        """Wake every local event stream waiting on this job (each wait gets a fresh event)"""
+        wakeup = self._wakeups.pop(job_id, None)
+        if wakeup is not None:
+            if not final:
+                self._wakeups[job_id] = asyncio.Event()
+            wakeup.set()
+
+    # ===========================================
+    # LIFECYCLE
+    # ===========================================
+
+    async def submit(
+        self,
+        request_id: str,
+        num_requested: int,
+        runner: Callable[[Callable[[Dict[str, Any]], Awaitable[None]]], Awaitable[Dict[str, Any]]]
+    ) -> Dict[str, Any]:
+        """
+        Create a job and start it in the background.
+        `runner(on_variation)` performs the generation and returns the final result.
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        job = {
+            "job_id": job_id,
+            "request_id": request_id,
+            "status": GenerationStatus.PENDING.value,
+            "num_requested": num_requested,
+            "variations": [],
+            "failed_variations": [],
+            "error": None,
+            "created_ts": now,
+            "created_at": datetime.fromtimestamp(now, timezone.utc).isoformat(),
+            "completed_at": None,
+        }
+        await self._call("create", job_id, job)
+
+        self._created += 1
+        if self._created % self.PRUNE_EVERY == 0:
+            await self._call("prune", now - settings.jobs_ttl_seconds)
+
+        self._wakeups[job_id] = asyncio.Event()
+        task = asyncio.create_task(self._run(job, runner))
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda _t: self._tasks.pop(job_id, None))
+
+        logger.info(f"🧾 Job {job_id[:8]} queued ({num_requested} variation(s))")
+        return job
+
+    async def _run(self, job: Dict[str, Any], runner):
+        job_id = job["job_id"]
+
+        async def on_variation(variation: Dict[str, Any]):
+            job["variations"].append(variation)
+            await self._call("append_event", job_id, "variation", variation)
+            await self._call("save", job_id, job)
+            self._notify(job_id)
+
+        try:
+            job["status"] = GenerationStatus.PROCESSING.value
+            await self._call("save", job_id, job)
+            await self._call("append_event", job_id, "status", {"status": job["status"]})
+            self._notify(job_id)
+
+            result = await runner(on_variation)
+
+            job["variations"] = sorted(result["variations"], key=lambda v: v["variation_number"])
+            job["failed_variations"] = result.get("failed_variations", [])
+            job["status"] = GenerationStatus.COMPLETED.value
+
+        except asyncio.CancelledError:
+            job["status"] = GenerationStatus.FAILED.value
+            job["error"] = {"code": "JOB_CANCELLED", "message": "Job cancelled during shutdown", "details": {}}
+            raise
+
+        except PixovaException as e:
+            logger.warning("Job failed", job_id=job_id, error_code=e.error_code)
+            job["status"] = GenerationStatus.FAILED.value
+            job["error"] = e.to_dict()["error"]
+
+        except Exception as e:
+            logger.error("Job crashed", job_id=job_id, error_type=type(e).__name__)
+            job["status"] = GenerationStatus.FAILED.value
+            job["error"] = {
+                "code": "INTERNAL_ERROR",
+                "message": str(e) if settings.is_development else "An unexpected error occurred",
+                "details": {}
+            }
+
+        finally:
+            if job["status"] in FINISHED_STATUSES:
+                job["completed_at"] = datetime.now(timezone.utc).isoformat()
+                try:
+                    await self._call("save", job_id, job)
+                    await self._call("append_event", job_id, job["status"], self.public_view(job))
+                except Exception as e:
+                    logger.error("Failed to persist job result", job_id=job_id, error=str(e))
+                self._notify(job_id, final=True)
+                logger.info(f"🧾 Job {job_id[:8]} {job['status']}")
+
+    async def shutdown(self):
+        """Cancel running jobs and close the store"""
+        for task in list(self._tasks.values()):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        if self._store is not None:
+            self._store.close()
+            self._store = None
+
+    # ===========================================
+    # QUERIES
+    # ===========================================
+
+    @staticmethod
+    def public_view(job: Dict[str, Any]) -> Dict[str, Any]:
+        return {k: v for k, v in job.items() if k != "created_ts"}
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = await self._call("get", job_id)
+        return self.public_view(job) if job else None
+
+    async def events(self, job_id: str) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Yield (event, data) for every event of the job, replaying past ones first,
+        until the job finishes. Yields ("keepalive", {}) while idle.
+        """
+        last_seq = 0
+        idle_since = time.monotonic()
+
+        while True:
+            # Grab the wakeup before reading so a notify in between is never missed
+            wakeup = self._wakeups.get(job_id)
+
+            for seq, event, data in await self._call("events_after", job_id, last_seq):
+                last_seq = seq
+                idle_since = time.monotonic()
+                yield event, data
+                if event in FINISHED_STATUSES:
+                    return
+
+            # Local jobs wake us immediately; jobs run by other workers are polled
+            if wakeup is not None:
+                try:
+                    await asyncio.wait_for(wakeup.wait(), timeout=settings.jobs_poll_interval * 10)
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                job = await self._call("get", job_id)
+                if job is None:
+                    return
+                await asyncio.sleep(settings.jobs_poll_interval)
+
+            if time.monotonic() - idle_since >= settings.jobs_keepalive_seconds:
+                idle_since = time.monotonic()
+                yield "keepalive", {}
+
+
+# Singleton instance
+job_manager = JobManager()
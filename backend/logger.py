@@ -3,29 +3,61 @@ Pixova AI - Structured Logging
 Production-grade logging with request tracing and context
 """
 import logging
+import queue
 import sys
 import json
+import threading
 from datetime import datetime, timezone
-from typing import Any, Optional
+from typing import Any, Dict, Optional, TextIO
 from contextvars import ContextVar
 import uuid
 
+try:
+    import orjson  # Optional: several times faster than json.dumps
+except ImportError:
+    orjson = None
+
 # Context variable for request tracing
 request_id_ctx: ContextVar[str] = ContextVar("request_id", default="no-request")
 user_id_ctx: ContextVar[str] = ContextVar("user_id", default="anonymous")
 
 
+def _record_context(record: logging.LogRecord) -> tuple[str, str]:
+    """(request_id, user_id) captured when the record was created, else the current context"""
+    return (
+        getattr(record, "request_id", None) or request_id_ctx.get(),
+        getattr(record, "user_id", None) or user_id_ctx.get(),
+    )
+
+
+def _exception_text(formatter: logging.Formatter, record: logging.LogRecord) -> Optional[str]:
+    """Traceback of a record (pre-rendered by QueueLogHandler, or rendered now)"""
+    if record.exc_info:
+        return formatter.formatException(record.exc_info)
+    return record.exc_text
+
+
+def _dumps(data: dict) -> str:
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, default=str).decode("utf-8")
+        except TypeError:
+            pass  # e.g. non-string keys or out-of-range ints: json handles those
+    return json.dumps(data, default=str)
+
+
 class JsonFormatter(logging.Formatter):
     """JSON log formatter for structured logging in production"""
     
     def format(self, record: logging.LogRecord) -> str:
+        request_id, user_id = _record_context(record)
         log_data = {
-            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
             "level": record.levelname,
             "logger": record.name,
             "message": record.getMessage(),
-            "request_id": request_id_ctx.get(),
-            "user_id": user_id_ctx.get(),
+            "request_id": request_id,
+            "user_id": user_id,
         }
         
         # Add extra fields
@@ -33,8 +65,9 @@ class JsonFormatter(logging.Formatter):
             log_data["data"] = record.extra_data
         
         # Add exception info
-        if record.exc_info:
-            log_data["exception"] = self.formatException(record.exc_info)
+        exception = _exception_text(self, record)
+        if exception:
+            log_data["exception"] = exception
         
         # Add source location in debug
         if record.levelno == logging.DEBUG:
@@ -44,7 +77,7 @@ class JsonFormatter(logging.Formatter):
                 "function": record.funcName
             }
         
-        return json.dumps(log_data)
+        return _dumps(log_data)
 
 
 class TextFormatter(logging.Formatter):
@@ -63,7 +96,8 @@ class TextFormatter(logging.Formatter):
     
     def format(self, record: logging.LogRecord) -> str:
         color = self.COLORS.get(record.levelname, "")
-        req_id = request_id_ctx.get()[:8] if request_id_ctx.get() != "no-request" else "--------"
+        request_id, _ = _record_context(record)
+        req_id = request_id[:8] if request_id != "no-request" else "--------"
         
         # Create cleaner message
         msg = record.getMessage()
@@ -96,8 +130,9 @@ class TextFormatter(logging.Formatter):
             if extras:
                 base += f" {self.DIM}({', '.join(extras)}){self.RESET}"
         
-        if record.exc_info:
-            base += f"\n{self.formatException(record.exc_info)}"
+        exception = _exception_text(self, record)
+        if exception:
+            base += f"\n{exception}"
         
         return base
 
@@ -114,11 +149,17 @@ class ContextLogger:
         self._logger = logger
     
     def _log(self, level: int, msg: str, exc_info: bool = False, **kwargs):
+        # handle() skips the level check, so apply it here (and skip building the record)
+        if not self._logger.isEnabledFor(level):
+            return
         record = self._logger.makeRecord(
             self._logger.name, level, "", 0, msg, (), None
         )
         if kwargs:
             record.extra_data = kwargs
+        # Captured here: the record may be formatted later, on another thread
+        record.request_id = request_id_ctx.get()
+        record.user_id = user_id_ctx.get()
         if exc_info:
             record.exc_info = sys.exc_info()
         self._logger.handle(record)
@@ -139,19 +180,199 @@ class ContextLogger:
         self._log(logging.CRITICAL, msg, exc_info=exc_info, **kwargs)
 
 
-def setup_logging(level: str = "INFO", format_type: str = "json"):
+class QueueLogHandler(logging.Handler):
+    """
+    Non-blocking log handler.
+    
+    Callers only capture the record's context (request/user IDs, message
+    arguments, traceback) and put it on a bounded queue. A writer thread
+    formats whatever is queued and writes it to the stream in one batch,
+    so a slow stdout (log shipper back-pressure) never stalls the event loop.
+    
+    When the queue is full, policy "drop" discards the record and "block"
+    waits up to `block_timeout` for space before discarding. Dropped records
+    are counted and reported in the log stream once space is available.
+    """
+    
+    POLICIES = ("drop", "block")
+    
+    def __init__(
+        self,
+        stream: TextIO,
+        queue_size: int = 10000,
+        policy: str = "drop",
+        block_timeout: float = 0.05,
+        batch_size: int = 256
+    ):
+        super().__init__()
+        if policy not in self.POLICIES:
+            raise ValueError(f"policy must be one of {self.POLICIES}")
+        self.stream = stream
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.batch_size = batch_size
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._closed = False
+        
+        self.enqueued = 0
+        self.dropped = 0
+        self.dropped_by_level: Dict[str, int] = {}
+        self.written = 0
+        self.batches = 0
+        self.write_errors = 0
+        self.peak_depth = 0
+        self._reported_drops = 0
+        
+        self._thread = threading.Thread(target=self._writer, name="log-writer", daemon=True)
+        self._thread.start()
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """Resolve everything that depends on the caller before the record changes threads"""
+        if not hasattr(record, "request_id"):
+            record.request_id = request_id_ctx.get()
+            record.user_id = user_id_ctx.get()
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            # Render now: frames and exception state belong to the caller
+            record.exc_text = (self.formatter or logging.Formatter()).formatException(record.exc_info)
+            record.exc_info = None
+        return record
+    
+    def emit(self, record: logging.LogRecord):
+        # Runs under the handler lock, so the counters need no extra locking
+        if self._closed:
+            return
+        try:
+            record = self.prepare(record)
+        except Exception:
+            self.handleError(record)
+            return
+        
+        try:
+            if self.policy == "block":
+                self._queue.put(record, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            self.dropped_by_level[record.levelname] = self.dropped_by_level.get(record.levelname, 0) + 1
+            return
+        
+        self.enqueued += 1
+        self.peak_depth = max(self.peak_depth, self._queue.qsize())
+    
+    def _writer(self):
+        stop = False
+        while not stop:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            
+            lines = []
+            for record in batch:
+                if record is None:  # Sentinel from close()
+                    stop = True
+                    continue
+                try:
+                    lines.append(self.format(record))
+                except Exception:
+                    self.handleError(record)
+            
+            dropped = self.dropped
+            if dropped > self._reported_drops:
+                lines.append(self.format(self._drop_report(dropped - self._reported_drops, dropped)))
+                self._reported_drops = dropped
+            
+            if lines:
+                self._write(lines)
+    
+    def _drop_report(self, count: int, total: int) -> logging.LogRecord:
+        return logging.makeLogRecord({
+            "name": __name__,
+            "levelno": logging.WARNING,
+            "levelname": "WARNING",
+            "msg": f"⚠️ Log queue full, dropped {count} record(s)",
+            "extra_data": {"dropped": count, "dropped_total": total, "policy": self.policy},
+        })
+    
+    def _write(self, lines: list[str]):
+        try:
+            self.stream.write("\n".join(lines) + "\n")
+            self.stream.flush()
+        except Exception:
+            # Nowhere left to report this: count it and keep draining
+            self.write_errors += 1
+            return
+        self.written += len(lines)
+        self.batches += 1
+    
+    def close(self):
+        """Write out everything queued so far, then stop the writer thread"""
+        if not self._closed:
+            self._closed = True
+            try:
+                self._queue.put(None, timeout=1.0)
+            except queue.Full:
+                pass
+            self._thread.join(timeout=5.0)
+        super().close()
+    
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            dropped_by_level = dict(self.dropped_by_level)
+        return {
+            "mode": "queue",
+            "policy": self.policy,
+            "queued": self._queue.qsize(),
+            "capacity": self._queue.maxsize,
+            "peak_depth": self.peak_depth,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "batches": self.batches,
+            "dropped": self.dropped,
+            "dropped_by_level": dropped_by_level,
+            "write_errors": self.write_errors,
+        }
+
+
+def setup_logging(
+    level: str = "INFO",
+    format_type: str = "json",
+    queue_size: int = 0,
+    queue_policy: str = "drop",
+    block_timeout: float = 0.05,
+    batch_size: int = 256
+):
     """
     Initialize application logging.
     Call once at startup.
+    With `queue_size` > 0, records are written by a background thread
+    through a bounded queue (see QueueLogHandler); otherwise synchronously.
     """
     root = logging.getLogger()
     root.setLevel(getattr(logging, level.upper()))
     
-    # Remove existing handlers
-    root.handlers.clear()
+    # Remove existing handlers (a queue handler stops its writer thread)
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+        if isinstance(existing, QueueLogHandler):
+            existing.close()
     
     # Create handler
-    handler = logging.StreamHandler(sys.stdout)
+    if queue_size > 0:
+        handler = QueueLogHandler(
+            sys.stdout,
+            queue_size=queue_size,
+            policy=queue_policy,
+            block_timeout=block_timeout,
+            batch_size=batch_size
+        )
+    else:
+        handler = logging.StreamHandler(sys.stdout)
     
     # Set formatter based on type
     if format_type == "json":
@@ -167,6 +388,14 @@ def setup_logging(level: str = "INFO", format_type: str = "json"):
     logging.getLogger("uvicorn.access").setLevel(logging.WARNING)
 
 
+def logging_stats() -> Dict[str, Any]:
+    """Queue and drop counters of the active log handler"""
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, QueueLogHandler):
+            return handler.stats()
+    return {"mode": "sync"}
+
+
 def get_logger(name: str) -> ContextLogger:
     """Get a context-aware logger instance"""
     return ContextLogger(logging.getLogger(name))
@@ -3,11 +3,15 @@ Production-grade with focus on prompt accuracy + creative excellence
 """
 import asyncio
 import time
+import json
 import base64
 import re
-from typing import Optional
-from openai import OpenAI
+from typing import Awaitable, Callable, Optional
+import httpx
+from openai import AsyncOpenAI
 from openai import APIError, APIConnectionError as OpenAIConnectionError, RateLimitError as OpenAIRateLimitError
+from openai import BadRequestError
+from openai import APITimeoutError as OpenAITimeoutError
 
 from config import settings
 from logger import get_logger
@@ -15,9 +19,17 @@ from exceptions import (
     AllModelsFailedError,
     APIConnectionError,
     APITimeoutError,
-    GenerationError
+    GenerationError,
+    ServiceOverloadedError
 )
 from models import GenerationResult
+from model_health import ModelScoreboard, CircuitBreaker
+from result_cache import result_cache
+from blob_cache import blob_cache, sniff_content_type
+from processing_pool import processing_pool
+from quality_validator import ascore_batch
+from singleflight import SingleFlight
+from scheduler import scheduler, set_caller, caller_ctx
 
 logger = get_logger(__name__)
 
@@ -189,33 +201,134 @@ class PromptAnalyzer:
         return final_prompt
 
 
+class HedgeBudget:
+    """Per-request cap on extra model calls started by hedging"""
+    
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used = 0
+    
+    @property
+    def available(self) -> bool:
+        return self.used < self.limit
+    
+    def try_acquire(self) -> bool:
+        if not self.available:
+            return False
+        self.used += 1
+        return True
+
+
+class ValidationBudget:
+    """
+    Per-request limits on validation-driven regeneration: a deadline
+    (measured from request start) and a cap on extra model calls
+    """
+    
+    def __init__(self, prompt: str, threshold: float, latency_budget: float, limit: int):
+        self.prompt = prompt
+        self.threshold = threshold
+        self.deadline = time.monotonic() + latency_budget
+        self.limit = limit
+        self.used = 0
+    
+    @property
+    def remaining_seconds(self) -> float:
+        return max(self.deadline - time.monotonic(), 0.0)
+    
+    def try_acquire(self, expected_seconds: float) -> bool:
+        """Claim one regeneration if the cap allows it and it should finish before the deadline"""
+        if self.used >= self.limit or expected_seconds > self.remaining_seconds:
+            return False
+        self.used += 1
+        return True
+
+
+class GenerationContext:
+    """Per-request options and budgets shared by all variations of one request"""
+    
+    def __init__(
+        self,
+        size: str,
+        bypass_cache: bool = False,
+        on_variation: Optional[Callable[[dict], Awaitable[None]]] = None,
+        post_process: bool = False,
+        palette_colors: int = 128,
+        validation: Optional[ValidationBudget] = None
+    ):
+        self.size = size
+        self.bypass_cache = bypass_cache
+        self.on_variation = on_variation
+        self.post_process = post_process
+        self.palette_colors = palette_colors
+        self.validation = validation
+        self.hedge_budget = HedgeBudget(settings.max_hedges_per_request) if settings.hedging_enabled else None
+        self.cache_hits = 0
+
+
 class LogoGenerator:
     """Production Logo Generation Engine with Intelligent Prompting"""
     
     def __init__(self):
-        self._client: Optional[OpenAI] = None
+        self._client: Optional[AsyncOpenAI] = None
+        self._http_client: Optional[httpx.AsyncClient] = None
         self._models = settings.all_models
         self._initialized = False
-        self._enable_processing = False
-        self._enable_validation = False
+        self._in_flight = 0
+        self._peak_in_flight = 0
+        self.scoreboard = ModelScoreboard(self._models)
+        self._breakers = {model: CircuitBreaker(model) for model in self._models}
+        self._single_flight = SingleFlight()
+        self._url_only_models: set[str] = set()  # Models that rejected b64_json at runtime
+        self._enable_processing = settings.processing_enabled
+        self._enable_validation = settings.validated_generation_enabled
         self.analyzer = PromptAnalyzer()
         
-    def _get_client(self) -> OpenAI:
-        """Lazy initialization of OpenAI client"""
+    def _get_client(self) -> AsyncOpenAI:
+        """Lazy initialization of the async OpenAI client over a shared connection pool"""
         if self._client is None:
-            self._client = OpenAI(
+            self._http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=settings.http_max_connections,
+                    max_keepalive_connections=settings.http_max_keepalive,
+                    keepalive_expiry=settings.http_keepalive_expiry
+                ),
+                timeout=httpx.Timeout(settings.api_timeout, connect=settings.http_connect_timeout)
+            )
+            self._client = AsyncOpenAI(
                 api_key=settings.a4f_api_key,
                 base_url=settings.a4f_base_url,
-                timeout=settings.api_timeout
+                timeout=settings.api_timeout,
+                http_client=self._http_client
             )
             self._initialized = True
             logger.info(
                 "LogoGenerator initialized with intelligent prompting",
                 base_url=settings.a4f_base_url,
-                models_count=len(self._models)
+                models_count=len(self._models),
+                max_connections=settings.http_max_connections
             )
         return self._client
     
+    async def aclose(self):
+        """Close pooled connections (call on shutdown)"""
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+            self._http_client = None
+            self._initialized = False
+    
+    def pool_stats(self) -> dict:
+        """Connection pool usage: in-flight requests vs configured socket limit"""
+        limit = settings.http_max_connections
+        return {
+            "in_flight": self._in_flight,
+            "peak_in_flight": self._peak_in_flight,
+            "max_connections": limit,
+            "max_keepalive": settings.http_max_keepalive,
+            "saturation": round(self._in_flight / limit, 3)
+        }
+    
     async def generate(
         self,
         user_id: str,
@@ -224,13 +337,58 @@ class LogoGenerator:
         width: int = 1024,
         height: int = 1024,
         num_variations: int = 1,
-        include_text_in_ai: bool = False
+        include_text_in_ai: bool = False,
+        bypass_cache: bool = False,
+        on_variation: Optional[Callable[[dict], Awaitable[None]]] = None,
+        plan: str = "free",
+        post_process: bool = False,
+        validate_quality: bool = False
     ) -> dict:
         """
-        Generate logo(s) with intelligent prompt analysis and enhancement
+        Generate logo(s) with intelligent prompt analysis and enhancement.
+        `on_variation` is awaited with each variation as soon as it completes.
+        With `validate_quality`, each variation is scored as it lands and low
+        scorers are regenerated while the request's validation budget lasts.
         """
+        caller_token = set_caller(user_id, plan)
+        try:
+            return await self._generate(
+                prompt, style, width, height, num_variations,
+                include_text_in_ai, bypass_cache, on_variation, post_process, validate_quality
+            )
+        finally:
+            caller_ctx.reset(caller_token)
+    
+    async def _generate(
+        self,
+        prompt: str,
+        style: str,
+        width: int,
+        height: int,
+        num_variations: int,
+        include_text_in_ai: bool,
+        bypass_cache: bool,
+        on_variation: Optional[Callable[[dict], Awaitable[None]]],
+        post_process: bool = False,
+        validate_quality: bool = False
+    ) -> dict:
         overall_start = time.perf_counter()
-        size = f"{width}x{height}"
+        validation = None
+        if validate_quality and self._enable_validation:
+            validation = ValidationBudget(
+                prompt=prompt,
+                threshold=settings.validation_threshold,
+                latency_budget=settings.validation_latency_budget,
+                limit=settings.validation_max_regenerations
+            )
+        ctx = GenerationContext(
+            size=f"{width}x{height}",
+            bypass_cache=bypass_cache,
+            on_variation=on_variation,
+            post_process=post_process and self._enable_processing,
+            palette_colors=settings.palette_colors(style),
+            validation=validation
+        )
         
         # STEP 1: Analyze what user REALLY wants
         logger.info(f"🔍 Analyzing prompt: '{prompt[:60]}...'")
@@ -251,37 +409,30 @@ class LogoGenerator:
         logger.info(f"🎨 Generating {num_variations} variation(s)")
         
         # STEP 3: Generate variations with diversity
-        variations = []
-        for i in range(num_variations):
-            if num_variations > 1:
-                logger.info(f"🔹 Variation {i + 1}/{num_variations}")
-            
-            # For multiple variations, add creative diversity WITHOUT losing user intent
-            variation_prompt = enhanced_prompt
-            if num_variations > 1 and i > 0:
-                diversity_angles = [
-                    "alternative visual interpretation, different compositional approach",
-                    "reimagined concept, fresh creative angle",
-                    "distinct aesthetic direction, varied mood",
-                    "unique geometric arrangement, alternative symbolism",
-                    "different design language, creative reframing"
-                ]
-                diversity = diversity_angles[i % len(diversity_angles)]
-                variation_prompt = f"{enhanced_prompt}, {diversity}, MAINTAIN core concept"
-            
-            result = await self._generate_single(
-                prompt=variation_prompt,
-                size=size,
-                variation_number=i + 1
-            )
-            variations.append(result)
+        variation_prompts = [
+            self._build_variation_prompt(enhanced_prompt, i, num_variations)
+            for i in range(num_variations)
+        ]
+        
+        if settings.concurrent_variations and num_variations > 1:
+            variations, failed = await self._generate_concurrent(variation_prompts, ctx)
+        else:
+            variations, failed = await self._generate_sequential(variation_prompts, ctx), []
         
         total_time = int((time.perf_counter() - overall_start) * 1000)
         
-        logger.info(f"✅ Generated {num_variations} logo(s) in {total_time/1000:.1f}s")
+        logger.info(
+            f"✅ Generated {len(variations)}/{num_variations} logo(s) in {total_time/1000:.1f}s",
+            cache_hits=ctx.cache_hits,
+            **({"hedges_used": ctx.hedge_budget.used} if ctx.hedge_budget else {}),
+            **({"regenerations": ctx.validation.used} if ctx.validation else {})
+        )
         
         return {
             "variations": variations,
+            "failed_variations": failed,
+            "cache_hits": ctx.cache_hits,
+            "regeneration_attempts": ctx.validation.used if ctx.validation else 0,
             "total_time_ms": total_time,
             "num_generated": len(variations),
             "prompt_analysis": {
@@ -291,15 +442,290 @@ class LogoGenerator:
             }
         }
     
+    @staticmethod
+    def _build_variation_prompt(enhanced_prompt: str, index: int, num_variations: int) -> str:
+        """Add creative diversity to variations after the first WITHOUT losing user intent"""
+        if num_variations <= 1 or index == 0:
+            return enhanced_prompt
+        
+        diversity_angles = [
+            "alternative visual interpretation, different compositional approach",
+            "reimagined concept, fresh creative angle",
+            "distinct aesthetic direction, varied mood",
+            "unique geometric arrangement, alternative symbolism",
+            "different design language, creative reframing"
+        ]
+        diversity = diversity_angles[index % len(diversity_angles)]
+        return f"{enhanced_prompt}, {diversity}, MAINTAIN core concept"
+    
+    async def _generate_sequential(
+        self,
+        variation_prompts: list[str],
+        ctx: GenerationContext
+    ) -> list[dict]:
+        """Generate variations one after another (any failure fails the request)"""
+        variations = []
+        for i, variation_prompt in enumerate(variation_prompts):
+            if len(variation_prompts) > 1:
+                logger.info(f"🔹 Variation {i + 1}/{len(variation_prompts)}")
+            
+            result = await self._generate_variation(variation_prompt, i + 1, ctx)
+            variations.append(result)
+        
+        return variations
+    
+    async def _generate_concurrent(
+        self,
+        variation_prompts: list[str],
+        ctx: GenerationContext
+    ) -> tuple[list[dict], list[int]]:
+        """
+        Generate variations in parallel, capped by max_concurrent_variations.
+        Returns (successful variations ordered by variation_number, failed variation numbers).
+        Raises the first failure only if every variation failed.
+        """
+        semaphore = asyncio.Semaphore(settings.max_concurrent_variations)
+        total = len(variation_prompts)
+        
+        async def run(index: int, variation_prompt: str) -> dict:
+            async with semaphore:
+                logger.info(f"🔹 Variation {index + 1}/{total}")
+                return await self._generate_variation(variation_prompt, index + 1, ctx)
+        
+        results = await asyncio.gather(
+            *(run(i, p) for i, p in enumerate(variation_prompts)),
+            return_exceptions=True
+        )
+        
+        variations = []
+        failed: list[int] = []
+        errors: list[BaseException] = []
+        for i, result in enumerate(results):
+            if isinstance(result, BaseException):
+                failed.append(i + 1)
+                errors.append(result)
+            else:
+                variations.append(result)
+        
+        if not variations:
+            raise errors[0]
+        
+        if failed:
+            logger.warning(
+                "Some variations failed, returning partial results",
+                failed_variations=failed,
+                succeeded=len(variations)
+            )
+        
+        variations.sort(key=lambda v: v["variation_number"])
+        return variations, failed
+    
+    async def _generate_variation(
+        self,
+        prompt: str,
+        variation_number: int,
+        ctx: GenerationContext
+    ) -> dict:
+        """Generate one variation and publish it to the request's listener"""
+        result = await self._produce_variation(prompt, variation_number, ctx)
+        
+        # Scored as soon as this variation lands, while the others are still generating
+        if ctx.validation is not None:
+            result = await self._validate_variation(result, prompt, ctx)
+        
+        if ctx.post_process:
+            result = await self._post_process(result, ctx.palette_colors)
+        
+        if ctx.on_variation is not None:
+            try:
+                await ctx.on_variation(result)
+            except Exception as e:
+                logger.warning("Variation listener failed", error=str(e), variation=variation_number)
+        
+        return result
+    
+    async def _produce_variation(
+        self,
+        prompt: str,
+        variation_number: int,
+        ctx: GenerationContext
+    ) -> dict:
+        """Generate one variation, served from the result cache when possible"""
+        use_cache = result_cache.enabled and not ctx.bypass_cache
+        cache_key = result_cache.make_key(prompt, ctx.size, ",".join(self._models), variation_number)
+        
+        if use_cache:
+            cached = await result_cache.get(cache_key)
+            if cached is not None:
+                ctx.cache_hits += 1
+                logger.info(f"⚡ Cache hit for variation {variation_number}")
+                return {**cached, "variation_number": variation_number, "cached": True}
+        
+        # Identical prompt+size already generating (double-submit, second tab): share it
+        flight_key = SingleFlight.make_key(prompt, ctx.size)
+        if self._single_flight.is_inflight(flight_key):
+            logger.info(f"🔗 Joining in-flight generation for variation {variation_number}")
+        
+        result = await self._single_flight.do(
+            flight_key,
+            lambda: self._generate_single(
+                prompt=prompt,
+                size=ctx.size,
+                variation_number=variation_number,
+                hedge_budget=ctx.hedge_budget
+            )
+        )
+        result = {**result, "variation_number": variation_number}
+        
+        # Always refresh the cache, even when this request bypassed the lookup
+        # (image bytes stay out of the cache; the stored image URL is enough)
+        if result_cache.enabled:
+            await result_cache.set(cache_key, {k: v for k, v in result.items() if k != "image_bytes"})
+        
+        return {**result, "cached": False}
+    
+    async def _validate_variation(self, variation: dict, prompt: str, ctx: GenerationContext) -> dict:
+        """
+        Pipeline stage: score a variation against the user's prompt and, while it
+        scores below the threshold and the request's validation budget allows,
+        regenerate it (leading with a different model). Keeps the best-scoring image.
+        Unscored images (validator unavailable) are never regenerated.
+        """
+        budget = ctx.validation
+        variation_number = variation["variation_number"]
+        best, best_score = variation, await self._score(variation, budget.prompt)
+        attempts = 0
+        
+        while best_score is not None and best_score < budget.threshold:
+            models = self._regeneration_chain(best["model_used"])
+            if not budget.try_acquire(self._expected_seconds(models[0])):
+                logger.info(f"⏳ Validation budget spent, keeping variation {variation_number} (score {best_score:.3f})")
+                break
+            
+            attempts += 1
+            logger.info(
+                f"🔁 Variation {variation_number} scored {best_score:.3f} < {budget.threshold}, "
+                f"regenerating with {models[0]}"
+            )
+            try:
+                candidate = await asyncio.wait_for(
+                    self._generate_single(
+                        prompt=prompt,
+                        size=ctx.size,
+                        variation_number=variation_number,
+                        hedge_budget=ctx.hedge_budget,
+                        models=models
+                    ),
+                    timeout=budget.remaining_seconds
+                )
+            except (GenerationError, ServiceOverloadedError, asyncio.TimeoutError) as e:
+                logger.warning(
+                    "Regeneration failed, keeping previous image",
+                    variation=variation_number,
+                    error=getattr(e, "message", None) or type(e).__name__
+                )
+                break
+            
+            candidate = {**candidate, "cached": False}
+            score = await self._score(candidate, budget.prompt)
+            if score is not None and score > best_score:
+                best, best_score = candidate, score
+        
+        # Later identical requests get the better image straight from the cache
+        if best is not variation and result_cache.enabled:
+            cache_key = result_cache.make_key(prompt, ctx.size, ",".join(self._models), variation_number)
+            await result_cache.set(cache_key, {k: v for k, v in best.items() if k not in ("image_bytes", "cached")})
+        
+        return {**best, "quality_score": best_score, "regeneration_attempts": attempts}
+    
+    @staticmethod
+    async def _score(variation: dict, prompt: str) -> Optional[float]:
+        """CLIP score of a variation, or None if it could not be scored"""
+        scores = await ascore_batch([variation["image_url"]], prompt, [variation.get("image_bytes")])
+        return scores[0]
+    
+    def _regeneration_chain(self, low_scoring_model: str) -> list[str]:
+        """Model chain for a regeneration: the model that produced the low scorer goes last"""
+        chain = self._model_chain()
+        return [m for m in chain if m != low_scoring_model] + [m for m in chain if m == low_scoring_model]
+    
+    def _expected_seconds(self, model: str) -> float:
+        """Typical duration of one call to a model: its median latency, or the default"""
+        median_ms = self.scoreboard.latency_quantile(model, 0.5, min_samples=settings.hedge_min_samples)
+        if median_ms is None:
+            return settings.scheduler_default_service_seconds
+        return median_ms / 1000
+    
+    async def _post_process(self, variation: dict, colors: int) -> dict:
+        """
+        Pipeline stage: post-process a variation in the process pool and store
+        the output (and its palette) locally. Failures leave the variation unprocessed.
+        """
+        source_url = variation["image_url"]
+        processed_key = f"processed:{colors}:{source_url}"
+        palette_key = f"palette:{colors}:{source_url}"
+        
+        # Same source image already processed at this palette size (cache hit, repeat request)
+        known = await asyncio.to_thread(self._load_processed, processed_key, palette_key)
+        if known is not None:
+            blob_hash, palette = known
+            return {**variation, "processed_image_url": blob_cache.image_url(blob_hash), "palette": palette}
+        
+        try:
+            image_bytes = variation.get("image_bytes")
+            if image_bytes is None:
+                image_bytes = await asyncio.to_thread(blob_cache.fetch, source_url)
+        except Exception as e:
+            logger.warning("Could not load image for post-processing", error=str(e)[:200])
+            return variation
+        
+        processed = await processing_pool.process(image_bytes, colors)
+        if processed is None:
+            return variation
+        
+        processed_bytes, palette = processed
+        try:
+            blob_hash = await asyncio.to_thread(
+                self._store_processed, processed_bytes, palette, processed_key, palette_key
+            )
+        except Exception as e:
+            processing_pool.failed += 1
+            logger.warning("Could not store post-processed image", error_type=type(e).__name__, error=str(e)[:200])
+            return variation
+        logger.info(f"🧪 Post-processed variation {variation['variation_number']} ({len(palette)} colors)")
+        return {**variation, "processed_image_url": blob_cache.image_url(blob_hash), "palette": palette}
+    
+    @staticmethod
+    def _load_processed(processed_key: str, palette_key: str) -> Optional[tuple[str, list]]:
+        """(blob hash, palette) of an earlier post-processing result, if both are still cached"""
+        processed = blob_cache.lookup(processed_key)
+        palette = blob_cache.lookup(palette_key)
+        if processed is None or palette is None:
+            return None
+        try:
+            return processed[0], json.loads(blob_cache.read(palette[0]))
+        except (FileNotFoundError, ValueError):
+            return None
+    
+    @staticmethod
+    def _store_processed(processed_bytes: bytes, palette: list, processed_key: str, palette_key: str) -> str:
+        blob_cache.put(json.dumps(palette).encode("utf-8"), palette_key, "application/json")
+        return blob_cache.put(processed_bytes, processed_key, "image/png")
+    
     async def _generate_single(
         self,
         prompt: str,
         size: str,
-        variation_number: int = 1
+        variation_number: int = 1,
+        hedge_budget: Optional[HedgeBudget] = None,
+        models: Optional[list[str]] = None
     ) -> dict:
-        """Generate single variation with model fallback"""
+        """Generate single variation with model fallback (`models` overrides the chain)"""
+        if hedge_budget is not None:
+            return await self._generate_hedged(prompt, size, variation_number, hedge_budget, models)
+        
         start_time = time.perf_counter()
-        models_to_try = self._models
+        models_to_try = models or self._model_chain()
         errors: list[dict] = []
         
         for model_idx, model in enumerate(models_to_try):
@@ -311,35 +737,176 @@ class LogoGenerator:
             )
             
             if model_result["success"]:
-                generation_time = int((time.perf_counter() - start_time) * 1000)
-                
-                logger.info(f"✅ Generated in {model_result['time_ms']/1000:.1f}s using {model}")
-                
-                return {
-                    "image_url": model_result["image_url"],
-                    "model_used": model,
-                    "generation_time_ms": model_result["time_ms"],
-                    "variation_number": variation_number
-                }
+                return self._variation_result(model, model_result, variation_number)
             
             errors.append({"model": model, "error": model_result["error"]})
         
-        # All models failed
+        self._raise_all_failed(errors, len(models_to_try), start_time)
+    
+    async def _generate_hedged(
+        self,
+        prompt: str,
+        size: str,
+        variation_number: int,
+        hedge_budget: HedgeBudget,
+        models: Optional[list[str]] = None
+    ) -> dict:
+        """
+        Generate single variation, starting the next model in parallel whenever
+        the newest in-flight model exceeds its latency quantile. First success
+        wins; remaining calls are cancelled.
+        """
+        start_time = time.perf_counter()
+        models_to_try = models or self._model_chain()
+        errors: list[dict] = []
+        pending: dict[asyncio.Task, str] = {}
+        next_idx = 0
+        newest_model = models_to_try[0]
+        
+        def launch():
+            nonlocal next_idx, newest_model
+            model = models_to_try[next_idx]
+            task = asyncio.create_task(self._try_model(
+                model=model,
+                prompt=prompt,
+                size=size,
+                model_idx=next_idx
+            ))
+            pending[task] = model
+            newest_model = model
+            next_idx += 1
+        
+        try:
+            launch()
+            while pending:
+                can_hedge = next_idx < len(models_to_try) and hedge_budget.available
+                timeout = self._hedge_delay(newest_model) if can_hedge else None
+                
+                done, _ = await asyncio.wait(
+                    pending.keys(),
+                    timeout=timeout,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                
+                if not done:
+                    if hedge_budget.try_acquire():
+                        logger.info(
+                            f"⏱️ {newest_model} slower than {timeout:.1f}s, hedging with "
+                            f"{models_to_try[next_idx]}"
+                        )
+                        launch()
+                    continue
+                
+                for task in done:
+                    model = pending.pop(task)
+                    model_result = task.result()
+                    if model_result["success"]:
+                        return self._variation_result(model, model_result, variation_number)
+                    errors.append({"model": model, "error": model_result["error"]})
+                
+                # Plain fallback: nothing left in flight, move down the chain
+                if not pending and next_idx < len(models_to_try):
+                    launch()
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+        
+        self._raise_all_failed(errors, next_idx, start_time)
+    
+    def _variation_result(self, model: str, model_result: dict, variation_number: int) -> dict:
+        """Shape a successful model call as a variation"""
+        logger.info(f"✅ Generated in {model_result['time_ms']/1000:.1f}s using {model}")
+        
+        return {
+            "image_url": model_result["image_url"],
+            "image_bytes": model_result.get("image_bytes"),  # Internal: inline b64_json image
+            "model_used": model,
+            "generation_time_ms": model_result["time_ms"],
+            "variation_number": variation_number
+        }
+    
+    def _raise_all_failed(self, errors: list[dict], models_tried: int, start_time: float):
+        """Log and raise once the whole fallback chain has failed"""
         total_time = int((time.perf_counter() - start_time) * 1000)
         last_error = errors[-1]["error"] if errors else "Unknown error"
         
         logger.error(
             "All models failed",
-            models_tried=len(models_to_try),
+            models_tried=models_tried,
             last_error=last_error,
             total_time_ms=total_time
         )
         
         raise AllModelsFailedError(
-            models_tried=len(models_to_try),
+            models_tried=models_tried,
             last_error=last_error
         )
     
+    def _model_chain(self) -> list[str]:
+        """Fallback chain for the next generation, reordered by live stats when enabled"""
+        if not settings.adaptive_model_order:
+            return self._models
+        
+        chain = self.scoreboard.ordered(self._models)
+        if chain[0] != self._models[0]:
+            logger.debug(f"Model chain reordered, leading with {chain[0]}")
+        return chain
+    
+    def _record_success(self, model: str, latency_ms: int):
+        """Feed a successful call into the scoreboard and circuit breaker"""
+        self.scoreboard.record_success(model, latency_ms)
+        if not settings.circuit_breaker_enabled:
+            return
+        breaker = self._breakers.get(model)
+        if breaker and breaker.record_success():
+            logger.info(f"🟢 Circuit closed for {model}")
+    
+    def _record_failure(self, model: str, error_class: str, error: Optional[str] = None):
+        """Feed a failed call into the scoreboard and circuit breaker"""
+        self.scoreboard.record_failure(model, error_class, error)
+        if not settings.circuit_breaker_enabled:
+            return
+        breaker = self._breakers.get(model)
+        if breaker and breaker.record_failure():
+            logger.warning(
+                f"🔴 Circuit opened for {model}",
+                consecutive_failures=breaker.consecutive_failures,
+                cooldown_s=settings.circuit_cooldown_seconds
+            )
+    
+    def circuit_health(self) -> dict:
+        """Circuit breaker summary for /health"""
+        if not settings.circuit_breaker_enabled:
+            return {"status": "healthy", "message": "Circuit breakers disabled", "details": {}}
+        
+        states = {model: breaker.snapshot() for model, breaker in self._breakers.items()}
+        not_closed = [m for m, snap in states.items() if snap["state"] != CircuitBreaker.CLOSED]
+        open_models = [m for m, snap in states.items() if snap["state"] == CircuitBreaker.OPEN]
+        
+        if len(open_models) == len(states):
+            status = "unhealthy"
+        elif not_closed:
+            status = "degraded"
+        else:
+            status = "healthy"
+        
+        return {
+            "status": status,
+            "message": f"{len(not_closed)}/{len(states)} circuits not closed: {', '.join(not_closed)}" if not_closed else None,
+            "details": states
+        }
+    
+    def _hedge_delay(self, model: str) -> float:
+        """Seconds to wait on a model before hedging: its latency quantile, or the default"""
+        quantile_ms = self.scoreboard.latency_quantile(
+            model, settings.hedge_quantile, min_samples=settings.hedge_min_samples
+        )
+        if quantile_ms is None:
+            return settings.hedge_default_delay
+        return quantile_ms / 1000
+    
     async def _try_model(
         self,
         model: str,
@@ -349,53 +916,88 @@ class LogoGenerator:
     ) -> dict:
         """Try single model with retries"""
         max_retries = settings.max_retries_per_model
+        breaker = self._breakers.get(model)
         
         for retry in range(max_retries):
+            # Skip models whose circuit is open (no retries, no backoff)
+            if settings.circuit_breaker_enabled and breaker and not breaker.allow_request():
+                logger.debug(f"Skipping {model}: circuit {breaker.state}")
+                return {"success": False, "error": f"Circuit {breaker.state} for {model}", "error_class": "circuit_open"}
+            
             try:
                 logger.debug(f"Trying {model} (attempt {retry + 1}/{max_retries})")
                 
-                start = time.perf_counter()
-                
-                loop = asyncio.get_event_loop()
-                response = await loop.run_in_executor(
-                    None,
-                    lambda: self._get_client().images.generate(
-                        model=model,
-                        prompt=prompt,
-                        n=1,
-                        size=size
-                    )
-                )
+                # Queue wait for a slot is not model latency
+                async with scheduler.slot():
+                    start = time.perf_counter()
+                    self._in_flight += 1
+                    self._peak_in_flight = max(self._peak_in_flight, self._in_flight)
+                    try:
+                        response = await self._request_image(model, prompt, size)
+                    finally:
+                        self._in_flight -= 1
                 
                 elapsed_ms = int((time.perf_counter() - start) * 1000)
                 
-                if not response.data or len(response.data) == 0:
+                image = response.data[0] if response.data else None
+                if image is None or not (image.b64_json or image.url):
                     logger.warning("Empty response", model=model)
-                    return {"success": False, "error": "No image data"}
+                    self._record_failure(model, "empty_response")
+                    return {"success": False, "error": "No image data", "error_class": "empty_response"}
+                
+                self._record_success(model, elapsed_ms)
+                
+                if image.b64_json:
+                    image_bytes, image_url = await self._store_inline_image(image.b64_json)
+                    return {
+                        "success": True,
+                        "image_url": image_url,
+                        "image_bytes": image_bytes,
+                        "time_ms": elapsed_ms
+                    }
+                
+                if blob_cache.enabled:
+                    # Lets /api/download cache images from this provider host
+                    await asyncio.to_thread(blob_cache.remember_host, image.url)
                 
                 return {
                     "success": True,
-                    "image_url": response.data[0].url,
+                    "image_url": image.url,
                     "time_ms": elapsed_ms
                 }
                 
             except OpenAIRateLimitError as e:
                 logger.warning("Rate limited", model=model, retry=retry + 1)
+                self._record_failure(model, "rate_limit", str(e))
                 await self._backoff(retry, multiplier=2.0)
                 
+            except OpenAITimeoutError as e:
+                logger.warning("Timeout", model=model, retry=retry + 1)
+                self._record_failure(model, "timeout", str(e))
+                await self._backoff(retry)
+                
             except OpenAIConnectionError as e:
                 logger.warning("Connection error", model=model, retry=retry + 1)
+                self._record_failure(model, "connection", str(e))
                 await self._backoff(retry)
                 
             except APIError as e:
                 error_msg = str(e)
                 if "timeout" in error_msg.lower():
                     logger.warning("Timeout", model=model)
+                    self._record_failure(model, "timeout", error_msg)
                     await self._backoff(retry)
                 else:
                     logger.warning("API error", model=model, error=error_msg[:200])
-                    return {"success": False, "error": error_msg[:200]}
+                    self._record_failure(model, "api_error", error_msg)
+                    return {"success": False, "error": error_msg[:200], "error_class": "api_error"}
                     
+            except (asyncio.CancelledError, ServiceOverloadedError):
+                # Hedge loser, cancelled request or queue timeout: no model outcome, free a half-open probe
+                if breaker:
+                    breaker.release_probe()
+                raise
+                
             except Exception as e:
                 logger.error(
                     "Unexpected error",
@@ -403,12 +1005,54 @@ class LogoGenerator:
                     error_type=type(e).__name__,
                     error=str(e)[:200]
                 )
+                self._record_failure(model, "unexpected", f"{type(e).__name__}: {e}")
                 return {
                     "success": False,
-                    "error": f"{type(e).__name__}: {str(e)[:150]}"
+                    "error": f"{type(e).__name__}: {str(e)[:150]}",
+                    "error_class": "unexpected"
                 }
         
-        return {"success": False, "error": f"Exhausted {max_retries} retries"}
+        return {"success": False, "error": f"Exhausted {max_retries} retries", "error_class": "retries_exhausted"}
+    
+    def _wants_b64(self, model: str) -> bool:
+        """Ask this model for inline image bytes instead of a URL?"""
+        if settings.image_response_format != "b64_json" or model in self._url_only_models:
+            return False
+        supported = settings.b64_json_models_list
+        return "*" in supported or model in supported
+    
+    async def _request_image(self, model: str, prompt: str, size: str):
+        """Call the image API, falling back to URLs for models that reject b64_json"""
+        if self._wants_b64(model):
+            try:
+                return await self._get_client().images.generate(
+                    model=model,
+                    prompt=prompt,
+                    n=1,
+                    size=size,
+                    response_format="b64_json"
+                )
+            except BadRequestError as e:
+                if "response_format" not in str(e) and "b64" not in str(e):
+                    raise
+                self._url_only_models.add(model)
+                logger.warning(f"🔁 {model} rejected b64_json, using URLs for it from now on")
+        
+        return await self._get_client().images.generate(
+            model=model,
+            prompt=prompt,
+            n=1,
+            size=size
+        )
+    
+    async def _store_inline_image(self, b64_data: str) -> tuple[bytes, str]:
+        """Decode a b64_json image and store it locally; returns (bytes, public URL)"""
+        def decode_and_store():
+            image_bytes = base64.b64decode(b64_data)
+            blob_hash = blob_cache.put(image_bytes, content_type=sniff_content_type(image_bytes[:16]))
+            return image_bytes, blob_cache.image_url(blob_hash)
+        
+        return await asyncio.to_thread(decode_and_store)
     
     async def _backoff(self, retry: int, multiplier: float = 1.0):
         """Exponential backoff with jitter"""
@@ -423,18 +1067,57 @@ class LogoGenerator:
         logger.debug(f"Backing off for {delay:.2f}s")
         await asyncio.sleep(delay)
     
+    def model_report(self) -> dict:
+        """Current model order and the statistics behind it"""
+        return {
+            "adaptive": settings.adaptive_model_order,
+            "static_order": self._models,
+            "order": self._model_chain(),
+            "models": [
+                {**entry, "circuit": self._breakers[entry["model"]].state}
+                for entry in self.scoreboard.explain(self._models)
+            ]
+        }
+    
     async def health_check(self) -> dict:
         """Health check endpoint"""
         try:
             start = time.perf_counter()
             self._get_client()
             latency = int((time.perf_counter() - start) * 1000)
+            pool = self.pool_stats()
+            
+            circuits = self.circuit_health()
+            
+            # No model reachable = unhealthy; a saturated pool means generations queue for a socket
+            if circuits["status"] == "unhealthy":
+                status = "unhealthy"
+            elif pool["saturation"] >= 1.0:
+                status = "degraded"
+            else:
+                status = "healthy"
             
             return {
-                "status": "healthy",
+                "status": status,
                 "latency_ms": latency,
                 "models_available": len(self._models),
-                "features": ["intelligent_prompting", "subject_detection", "emotion_analysis"]
+                "details": {
+                    "pool": pool,
+                    "model_order": self._model_chain(),
+                    "result_cache": result_cache.stats(),
+                    "single_flight": self._single_flight.stats(),
+                    "processing": processing_pool.stats(),
+                    "scoreboard": {
+                        m["model"]: {
+                            "tier": m["tier"],
+                            "success_rate": m["success_rate"],
+                            "ewma_latency_ms": m["ewma_latency_ms"]
+                        }
+                        for m in self.scoreboard.explain(self._models)
+                    }
+                },
+                "features": ["intelligent_prompting", "subject_detection", "emotion_analysis"],
+                **({"error": circuits["message"]} if status == "unhealthy" else {})
             }
         except Exception as e:
             return {"status": "unhealthy", "error": str(e)}
@@ -2,34 +2,52 @@
 Pixova AI Design Tool - Main Application
 Production-grade FastAPI backend
 """
+import asyncio
+import json
+import re
 import time
 from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Optional
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, StreamingResponse
 
 from config import settings
-from logger import setup_logging, get_logger
+from logger import setup_logging, get_logger, logging_stats
 from models import (
     GenerateRequest,
     GenerateResponse,
     DesignVariation,
     HealthResponse,
     ServiceHealth,
-    ErrorResponse
+    ErrorResponse,
+    JobCreatedResponse,
+    JobStatusResponse
 )
-from exceptions import UnsupportedDesignTypeError
+from exceptions import UnsupportedDesignTypeError, JobNotFoundError, ImageNotFoundError
 from middleware import (
     RequestTrackingMiddleware,
     RateLimitMiddleware,
-    ErrorHandlingMiddleware
+    ErrorHandlingMiddleware,
+    charge_rate_limit
 )
 from logo_generator import logo_generator
-from utils import proxy_image_download
+from jobs import job_manager
+from scheduler import scheduler, resolve_plan, PLAN_HEADER, GATEWAY_SECRET_HEADER
+from rate_limiter import rate_limiter, variation_cost
+from result_cache import result_cache
+from processing_pool import processing_pool
+from blob_cache import blob_cache
+from utils import proxy_image_download, init_download_client, close_download_client
 
 # Initialize logging
 setup_logging(
     level=settings.log_level,
-    format_type="text" if settings.is_development else "json"
+    format_type="text" if settings.is_development else "json",
+    queue_size=settings.log_queue_size if settings.log_async else 0,
+    queue_policy=settings.log_queue_policy,
+    block_timeout=settings.log_block_timeout,
+    batch_size=settings.log_batch_size
 )
 
 logger = get_logger(__name__)
@@ -50,11 +68,19 @@ async def lifespan(app: FastAPI):
     logger.info(f"🚀 {settings.app_name} v{settings.app_version} starting in {settings.environment} mode")
     logger.info(f"🤖 Configured with {len(settings.all_models)} AI models (primary: {settings.primary_model})")
     logger.info(f"🛡️  Rate limit: {settings.rate_limit_requests} requests per {settings.rate_limit_window//60} minutes")
+    init_download_client()
     
     yield
     
     # Shutdown
     logger.info("Application shutting down")
+    await job_manager.shutdown()
+    await logo_generator.aclose()
+    await close_download_client()
+    result_cache.close()
+    blob_cache.close()
+    processing_pool.shutdown()
+    rate_limiter.close()
 
 
 # ===========================================
@@ -100,6 +126,74 @@ app.add_middleware(
 )
 
 
+# ===========================================
+# GENERATION HELPERS
+# ===========================================
+
+def request_plan(req: Request) -> str:
+    """Caller's plan from the gateway headers (never from the request body)"""
+    return resolve_plan(req.headers.get(PLAN_HEADER), req.headers.get(GATEWAY_SECRET_HEADER))
+
+
+async def run_generation(
+    request: GenerateRequest,
+    plan: str,
+    on_variation: Optional[Callable[[dict], Awaitable[None]]] = None
+) -> dict:
+    """Route a generation request to the right generator (shared by sync and job APIs)"""
+    # DEBUG: Log incoming style to catch frontend/backend mismatch
+    logger.info(f"🎨 New {request.design_type.value} request: '{request.prompt[:60]}{'...' if len(request.prompt) > 60 else ''}'")
+    logger.info(f"🎨 STYLE SELECTED: {request.style.value} (raw: {request.style})")
+    logger.debug(
+        "Request details",
+        style=request.style.value,
+        quality=request.quality.value,
+        size=f"{request.width}x{request.height}",
+        user_id=request.user_id
+    )
+    
+    # Apply quality preset to dimensions
+    # Note: Most AI models only support 1024x1024, so we use that for all qualities
+    # Quality will affect prompt enhancement and post-processing instead
+    quality_sizes = {
+        "standard": (1024, 1024),
+        "high": (1024, 1024),      # Changed from 1536 - most models don't support it
+        "ultra": (1024, 1024)       # Changed from 2048 - most models don't support it
+    }
+    width, height = quality_sizes.get(request.quality.value, (1024, 1024))
+    logger.info(f"📐 Quality: {request.quality.value} → {width}x{height} pixels")
+    
+    # Route to appropriate generator
+    if request.design_type.value == "logo":
+        result = await logo_generator.generate(
+            user_id=request.user_id,
+            prompt=request.prompt,
+            style=request.style.value,
+            width=width,
+            height=height,
+            num_variations=request.num_variations,
+            include_text_in_ai=request.include_text_in_ai,
+            bypass_cache=request.bypass_cache,
+            on_variation=on_variation,
+            plan=plan,
+            post_process=request.post_process,
+            validate_quality=request.validate_quality
+        )
+    else:
+        # This shouldn't happen due to Pydantic validation, but just in case
+        raise UnsupportedDesignTypeError(
+            design_type=request.design_type.value,
+            supported=["logo"]
+        )
+    
+    return result
+
+
+def _public_variation(variation: dict) -> dict:
+    """JSON-safe public view of a generated variation"""
+    return DesignVariation(**variation).model_dump(mode="json")
+
+
 # ===========================================
 # ROUTES
 # ===========================================
@@ -114,7 +208,10 @@ async def root():
         "environment": settings.environment,
         "endpoints": {
             "generate": "POST /api/generate",
-            "health": "GET /health"
+            "jobs": "POST /api/jobs",
+            "health": "GET /health",
+            "models": "GET /api/debug/models",
+            "logging": "GET /api/debug/logging"
         }
     }
 
@@ -135,10 +232,27 @@ async def health_check():
         "logo_generator": ServiceHealth(
             status=generator_health.get("status", "unknown"),
             latency_ms=generator_health.get("latency_ms"),
-            message=generator_health.get("error")
+            message=generator_health.get("error"),
+            details=generator_health.get("details")
         )
     }
     
+    # Per-model circuit breakers (open circuits = degraded capacity)
+    circuits = logo_generator.circuit_health()
+    services["model_circuits"] = ServiceHealth(
+        status=circuits["status"],
+        message=circuits["message"],
+        details=circuits["details"]
+    )
+    
+    # Upstream call queue (degraded while low-priority requests are rejected)
+    queue_health = scheduler.health()
+    services["scheduler"] = ServiceHealth(
+        status=queue_health["status"],
+        message=queue_health["message"],
+        details=queue_health["details"]
+    )
+    
     all_healthy = all(s.status == "healthy" for s in services.values())
     any_unhealthy = any(s.status == "unhealthy" for s in services.values())
     
@@ -158,13 +272,32 @@ async def health_check():
     )
 
 
+@app.get("/api/debug/models", tags=["System"])
+async def debug_models():
+    """
+    Model scoreboard: live order of the fallback chain and why each
+    model holds its position (success rate, EWMA latency, error classes).
+    """
+    return logo_generator.model_report()
+
+
+@app.get("/api/debug/logging", tags=["System"])
+async def debug_logging():
+    """
+    Log writer state: queue depth, records written and records dropped
+    because the queue was full (stdout could not keep up).
+    """
+    return logging_stats()
+
+
 @app.post(
     "/api/generate",
     response_model=GenerateResponse,
     responses={
         400: {"model": ErrorResponse, "description": "Validation error"},
         429: {"model": ErrorResponse, "description": "Rate limit exceeded"},
-        500: {"model": ErrorResponse, "description": "Generation failed"}
+        500: {"model": ErrorResponse, "description": "Generation failed"},
+        503: {"model": ErrorResponse, "description": "Generation queue full"}
     },
     tags=["Generation"]
 )
@@ -183,45 +316,14 @@ async def generate_design(request: GenerateRequest, req: Request):
     request_id = getattr(req.state, "request_id", "unknown")
     start_time = time.perf_counter()
     
-    # DEBUG: Log incoming style to catch frontend/backend mismatch
-    logger.info(f"🎨 New {request.design_type.value} request: '{request.prompt[:60]}{'...' if len(request.prompt) > 60 else ''}'")
-    logger.info(f"🎨 STYLE SELECTED: {request.style.value} (raw: {request.style})")
-    logger.debug(
-        "Request details",
-        style=request.style.value,
-        quality=request.quality.value,
-        size=f"{request.width}x{request.height}",
-        user_id=request.user_id
-    )
+    # Extra variations cost extra rate limit quota
+    await charge_rate_limit(req, variation_cost(request.num_variations))
     
-    # Apply quality preset to dimensions
-    # Note: Most AI models only support 1024x1024, so we use that for all qualities
-    # Quality will affect prompt enhancement and post-processing instead
-    quality_sizes = {
-        "standard": (1024, 1024),
-        "high": (1024, 1024),      # Changed from 1536 - most models don't support it
-        "ultra": (1024, 1024)       # Changed from 2048 - most models don't support it
-    }
-    width, height = quality_sizes.get(request.quality.value, (1024, 1024))
-    logger.info(f"📐 Quality: {request.quality.value} → {width}x{height} pixels")
+    # Fail fast with 503 + Retry-After instead of timing out in the queue
+    plan = request_plan(req)
+    scheduler.admit(plan, cost=request.num_variations)
     
-    # Route to appropriate generator
-    if request.design_type.value == "logo":
-        result = await logo_generator.generate(
-            user_id=request.user_id,
-            prompt=request.prompt,
-            style=request.style.value,
-            width=width,
-            height=height,
-            num_variations=request.num_variations,
-            include_text_in_ai=request.include_text_in_ai
-        )
-    else:
-        # This shouldn't happen due to Pydantic validation, but just in case
-        raise UnsupportedDesignTypeError(
-            design_type=request.design_type.value,
-            supported=["logo"]
-        )
+    result = await run_generation(request, plan)
     
     total_time_ms = int((time.perf_counter() - start_time) * 1000)
     
@@ -232,15 +334,105 @@ async def generate_design(request: GenerateRequest, req: Request):
         prompt=request.prompt,
         num_generated=result["num_generated"],
         variations=result["variations"],
+        failed_variations=result["failed_variations"],
+        cache_hits=result["cache_hits"],
+        regeneration_attempts=result["regeneration_attempts"],
         total_time_ms=result["total_time_ms"]
     )
 
 
+@app.post(
+    "/api/jobs",
+    response_model=JobCreatedResponse,
+    status_code=202,
+    responses={
+        400: {"model": ErrorResponse, "description": "Validation error"},
+        429: {"model": ErrorResponse, "description": "Rate limit exceeded"},
+        503: {"model": ErrorResponse, "description": "Generation queue full"}
+    },
+    tags=["Generation"]
+)
+async def create_generation_job(request: GenerateRequest, req: Request):
+    """
+    Start a generation in the background and return immediately.
+    
+    Poll `status_url` or subscribe to `events_url` (server-sent events),
+    which emits a `variation` event as soon as each design is ready and a
+    final `completed` or `failed` event.
+    """
+    request_id = getattr(req.state, "request_id", "unknown")
+    
+    await charge_rate_limit(req, variation_cost(request.num_variations))
+    plan = request_plan(req)
+    scheduler.admit(plan, cost=request.num_variations)
+    
+    async def runner(publish: Callable[[dict], Awaitable[None]]) -> dict:
+        async def on_variation(variation: dict):
+            await publish(_public_variation(variation))
+        
+        result = await run_generation(request, plan, on_variation=on_variation)
+        return {**result, "variations": [_public_variation(v) for v in result["variations"]]}
+    
+    job = await job_manager.submit(request_id, request.num_variations, runner)
+    job_id = job["job_id"]
+    
+    return JobCreatedResponse(
+        job_id=job_id,
+        request_id=request_id,
+        status=job["status"],
+        status_url=f"/api/jobs/{job_id}",
+        events_url=f"/api/jobs/{job_id}/events"
+    )
+
+
+@app.get(
+    "/api/jobs/{job_id}",
+    response_model=JobStatusResponse,
+    responses={404: {"model": ErrorResponse, "description": "Job not found"}},
+    tags=["Generation"]
+)
+async def get_generation_job(job_id: str):
+    """Current status of a generation job, including variations finished so far"""
+    job = await job_manager.get(job_id)
+    if job is None:
+        raise JobNotFoundError(job_id)
+    
+    return JobStatusResponse(num_completed=len(job["variations"]), **job)
+
+
+@app.get(
+    "/api/jobs/{job_id}/events",
+    responses={404: {"model": ErrorResponse, "description": "Job not found"}},
+    tags=["Generation"]
+)
+async def stream_generation_job(job_id: str):
+    """
+    Server-sent event stream for a job.
+    Past events are replayed first, so late subscribers miss nothing.
+    """
+    if await job_manager.get(job_id) is None:
+        raise JobNotFoundError(job_id)
+    
+    async def event_stream():
+        async for event, data in job_manager.events(job_id):
+            if event == "keepalive":
+                yield ": keep-alive\n\n"
+            else:
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @app.get("/api/download", tags=["Utility"])
-async def download_image(url: str):
+async def download_image(url: str, req: Request):
     """
     Proxy endpoint for downloading generated images.
-    Adds proper CORS and download headers.
+    Adds proper CORS and download headers. Streams the image and
+    supports Range requests (resumable / partial downloads).
     
     Args:
         url: The image URL to download
@@ -248,7 +440,33 @@ async def download_image(url: str):
     Returns:
         Image file with download headers
     """
-    return await proxy_image_download(url)
+    return await proxy_image_download(url, range_header=req.headers.get("range"))
+
+
+@app.get("/api/images/{image_id}", tags=["Utility"])
+async def get_image(image_id: str):
+    """
+    Serve an image stored by this API (b64_json generations).
+    Images are content-addressed, so responses are cacheable forever.
+    """
+    if not re.fullmatch(r"[0-9a-f]{64}", image_id):
+        raise ImageNotFoundError(image_id)
+    
+    # Existence check and content sniffing touch the disk: keep them off the loop
+    cached = await asyncio.to_thread(blob_cache.lookup, blob_cache.image_url(image_id))
+    if cached is None:
+        raise ImageNotFoundError(image_id)
+    _, content_type = cached
+    
+    return FileResponse(
+        blob_cache.blob_path(image_id),
+        media_type=content_type,
+        headers={
+            "ETag": f'"{image_id}"',
+            "Access-Control-Allow-Origin": "*",
+            "Cache-Control": "public, max-age=31536000, immutable"
+        }
+    )
 
 
 # ===========================================
@@ -3,11 +3,10 @@ Pixova AI - Middleware
 Request tracking, rate limiting, and error handling
 """
 import time
-from typing import Callable, Dict
-from collections import defaultdict
-from fastapi import Request, Response
+from fastapi import Request
 from fastapi.responses import JSONResponse
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
 from config import settings
 from logger import (
@@ -17,19 +16,37 @@ from logger import (
     clear_request_context
 )
 from exceptions import PixovaException, RateLimitError
+from rate_limiter import rate_limiter, route_cost
 
 logger = get_logger(__name__)
 
+# Paths exempt from rate limiting
+RATE_LIMIT_SKIP_PATHS = {"/", "/health", "/docs", "/openapi.json"}
 
-class RequestTrackingMiddleware(BaseHTTPMiddleware):
+
+# Pure ASGI middleware: no extra task or response-body stream per request
+# (unlike BaseHTTPMiddleware), so streaming responses pass straight through.
+# Headers are added by wrapping `send` at "http.response.start".
+
+
+class RequestTrackingMiddleware:
     """
     Adds request ID tracking and logging to all requests.
     Sets up logging context for the entire request lifecycle.
     """
     
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        request = Request(scope)
+        
         # Generate request ID
-        request_id = request.headers.get("X-Request-ID", generate_request_id())
+        request_id = request.headers.get("X-Request-ID") or generate_request_id()
         
         # Extract user ID if present
         user_id = request.headers.get("X-User-ID", "anonymous")
@@ -38,8 +55,9 @@ class RequestTrackingMiddleware(BaseHTTPMiddleware):
         set_request_context(request_id, user_id)
         
         # Store on request state for access in routes
+        start_time = time.perf_counter()
         request.state.request_id = request_id
-        request.state.start_time = time.perf_counter()
+        request.state.start_time = start_time
         
         # Log incoming request
         logger.info(
@@ -50,25 +68,29 @@ class RequestTrackingMiddleware(BaseHTTPMiddleware):
             request_id=request_id
         )
         
-        try:
-            response = await call_next(request)
-            
-            # Calculate duration
-            duration_ms = int((time.perf_counter() - request.state.start_time) * 1000)
+        async def send_with_tracking(message: Message):
+            if message["type"] == "http.response.start":
+                # Calculate duration (time to response headers)
+                duration_ms = int((time.perf_counter() - start_time) * 1000)
+                status_code = message["status"]
+                
+                # Add tracking headers to response
+                headers = MutableHeaders(scope=message)
+                headers["X-Request-ID"] = request_id
+                headers["X-Response-Time-Ms"] = str(duration_ms)
+                
+                # Log completion
+                status_emoji = "✅" if status_code < 400 else "⚠️" if status_code < 500 else "❌"
+                logger.info(
+                    f"{status_emoji} Completed in {duration_ms}ms (Status: {status_code})")
             
-            # Add tracking headers to response
-            response.headers["X-Request-ID"] = request_id
-            response.headers["X-Response-Time-Ms"] = str(duration_ms)
-            
-            # Log completion
-            status_emoji = "✅" if response.status_code < 400 else "⚠️" if response.status_code < 500 else "❌"
-            logger.info(
-                f"{status_emoji} Completed in {duration_ms}ms (Status: {response.status_code})")
-            
-            return response
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_with_tracking)
             
         except Exception as e:
-            duration_ms = int((time.perf_counter() - request.state.start_time) * 1000)
+            duration_ms = int((time.perf_counter() - start_time) * 1000)
             logger.error(
                 "Request failed with unhandled exception",
                 duration_ms=duration_ms,
@@ -79,76 +101,112 @@ class RequestTrackingMiddleware(BaseHTTPMiddleware):
             clear_request_context()
 
 
-class RateLimitMiddleware(BaseHTTPMiddleware):
+class RateLimitMiddleware:
     """
-    Simple in-memory rate limiting.
-    For production, use Redis-based rate limiting.
+    Per-client rate limiting with a GCRA limiter (O(1), bounded memory).
+    Each route has a cost; generation routes charge extra per variation
+    via charge_rate_limit().
     """
     
-    def __init__(self, app):
-        super().__init__(app)
-        self._requests: Dict[str, list] = defaultdict(list)
-        self._limit = settings.rate_limit_requests
-        self._window = settings.rate_limit_window
+    def __init__(self, app: ASGIApp):
+        self.app = app
     
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
         # Skip rate limiting for health checks
-        if request.url.path in ["/", "/health", "/docs", "/openapi.json"]:
-            return await call_next(request)
+        if scope["type"] != "http" or scope["path"] in RATE_LIMIT_SKIP_PATHS:
+            await self.app(scope, receive, send)
+            return
+        
+        request = Request(scope)
         
         # Get client identifier (IP or user ID)
         client_id = request.headers.get(
             "X-User-ID",
             request.client.host if request.client else "unknown"
         )
+        request.state.rate_limit_client = client_id
         
-        current_time = time.time()
-        window_start = current_time - self._window
-        
-        # Clean old requests
-        self._requests[client_id] = [
-            t for t in self._requests[client_id] if t > window_start
-        ]
+        result = await rate_limiter.acheck(client_id, cost=route_cost(scope["path"]))
+        request.state.rate_limit_result = result
         
         # Check limit
-        if len(self._requests[client_id]) >= self._limit:
+        if not result.allowed:
             logger.warning(
                 "Rate limit exceeded",
                 client_id=client_id,
-                requests_in_window=len(self._requests[client_id])
+                retry_after=result.retry_after
             )
             
-            retry_after = int(self._requests[client_id][0] - window_start) + 1
-            error = RateLimitError(retry_after=retry_after)
+            error = RateLimitError(retry_after=result.retry_after)
             
-            return JSONResponse(
+            response = JSONResponse(
                 status_code=error.status_code,
                 content=error.to_dict(),
-                headers={"Retry-After": str(retry_after)}
+                headers={"Retry-After": str(result.retry_after)}
             )
+            await response(scope, receive, send)
+            return
         
-        # Record request
-        self._requests[client_id].append(current_time)
-        
-        response = await call_next(request)
-        
-        # Add rate limit headers
-        remaining = self._limit - len(self._requests[client_id])
-        response.headers["X-RateLimit-Limit"] = str(self._limit)
-        response.headers["X-RateLimit-Remaining"] = str(remaining)
-        response.headers["X-RateLimit-Reset"] = str(int(window_start + self._window))
+        async def send_with_quota(message: Message):
+            if message["type"] == "http.response.start":
+                # Add rate limit headers from the latest check, including any extra
+                # charges made by the route (no second store lookup)
+                quota = request.state.rate_limit_result
+                headers = MutableHeaders(scope=message)
+                headers["X-RateLimit-Limit"] = str(quota.limit)
+                headers["X-RateLimit-Remaining"] = str(quota.remaining)
+                headers["X-RateLimit-Reset"] = str(quota.reset_at)
+            
+            await send(message)
         
-        return response
+        await self.app(scope, receive, send_with_quota)
+
+
+async def charge_rate_limit(request: Request, cost: int):
+    """
+    Charge extra rate limit cost from inside a route (e.g. per extra variation).
+    Raises RateLimitError if the client's quota cannot cover it.
+    """
+    client_id = getattr(request.state, "rate_limit_client", None)
+    if client_id is None or cost <= 0:
+        return
+    
+    result = await rate_limiter.acheck(client_id, cost=cost)
+    request.state.rate_limit_result = result
+    if not result.allowed:
+        logger.warning(
+            "Rate limit exceeded",
+            client_id=client_id,
+            cost=cost,
+            retry_after=result.retry_after
+        )
+        raise RateLimitError(retry_after=result.retry_after)
 
 
-class ErrorHandlingMiddleware(BaseHTTPMiddleware):
+class ErrorHandlingMiddleware:
     """
     Catches all exceptions and converts to proper JSON responses.
     """
     
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        response_started = False
+        
+        async def send_tracking_start(message: Message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+        
         try:
-            return await call_next(request)
+            await self.app(scope, receive, send_tracking_start)
+            return
             
         except PixovaException as e:
             # Our custom exceptions
@@ -157,13 +215,20 @@ class ErrorHandlingMiddleware(BaseHTTPMiddleware):
                 error_code=e.error_code,
                 message=e.message
             )
+            if response_started:
+                raise
             
             response_data = e.to_dict()
-            response_data["request_id"] = getattr(request.state, "request_id", None)
+            response_data["request_id"] = scope.get("state", {}).get("request_id")
             
-            return JSONResponse(
+            # Rate limit / overload errors tell clients when to come back
+            retry_after = getattr(e, "retry_after", None)
+            headers = {"Retry-After": str(retry_after)} if retry_after else None
+            
+            response = JSONResponse(
                 status_code=e.status_code,
-                content=response_data
+                content=response_data,
+                headers=headers
             )
             
         except Exception as e:
@@ -173,11 +238,14 @@ class ErrorHandlingMiddleware(BaseHTTPMiddleware):
                 error_type=type(e).__name__,
                 error=str(e)
             )
+            # Too late for an error response once the body is streaming
+            if response_started:
+                raise
             
             # Don't expose internal errors in production
             message = str(e) if settings.is_development else "An unexpected error occurred"
             
-            return JSONResponse(
+            response = JSONResponse(
                 status_code=500,
                 content={
                     "success": False,
@@ -186,6 +254,8 @@ class ErrorHandlingMiddleware(BaseHTTPMiddleware):
                         "message": message,
                         "details": {}
                     },
-                    "request_id": getattr(request.state, "request_id", None)
+                    "request_id": scope.get("state", {}).get("request_id")
                 }
-            )
\ No newline at end of file
+            )
+        
+        await response(scope, receive, send)
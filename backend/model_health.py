@@ -0,0 +1,258 @@
+"""
+Pixova AI - Model Health Tracking
+Live per-model statistics used to order the fallback chain at runtime
+"""
+import time
+from collections import deque
+from typing import Optional, List, Dict, Any
+
+from config import settings
+
+
+class ModelStats:
+    """Rolling statistics for a single model"""
+
+    def __init__(self, window: int, latency_samples: int = 100):
+        self.outcomes: deque = deque(maxlen=window)          # True = success
+        self.latencies: deque = deque(maxlen=latency_samples)  # Successful call latencies (ms)
+        self.ewma_latency_ms: Optional[float] = None
+        self.error_counts: Dict[str, int] = {}
+        self.total_calls = 0
+        self.last_error: Optional[str] = None
+        self.last_success_at: Optional[float] = None
+        self.last_failure_at: Optional[float] = None
+
+    @property
+    def samples(self) -> int:
+        return len(self.outcomes)
+
+    @property
+    def success_rate(self) -> Optional[float]:
+        if not self.outcomes:
+            return None
+        return sum(self.outcomes) / len(self.outcomes)
+
+
+class ModelScoreboard:
+    """
+    Tracks success rate, EWMA latency and error classes per model and
+    reorders the fallback chain so failing or slow models drop to the back.
+
+    Ordering tiers (static chain order breaks ties):
+        0 healthy   - enough samples, success rate and latency within bounds
+        1 unscored  - not enough samples yet (or failures old enough to retry)
+        2 slow      - EWMA latency above scoreboard_slow_ms
+        3 failing   - success rate below scoreboard_min_success_rate
+    """
+
+    TIERS = ("healthy", "unscored", "slow", "failing")
+
+    def __init__(self, models: List[str]):
+        self._static_order = list(models)
+        self._stats: Dict[str, ModelStats] = {}
+
+    def _get(self, model: str) -> ModelStats:
+        stats = self._stats.get(model)
+        if stats is None:
+            stats = self._stats[model] = ModelStats(window=settings.scoreboard_window)
+        return stats
+
+    # ===========================================
+    # RECORDING
+    # ===========================================
+
+    def record_success(self, model: str, latency_ms: int):
+        stats = self._get(model)
+        stats.total_calls += 1
+        stats.outcomes.append(True)
+        stats.latencies.append(latency_ms)
+        stats.last_success_at = time.time()
+
+        alpha = settings.scoreboard_ewma_alpha
+        if stats.ewma_latency_ms is None:
+            stats.ewma_latency_ms = float(latency_ms)
+        else:
+            stats.ewma_latency_ms = alpha * latency_ms + (1 - alpha) * stats.ewma_latency_ms
+
+    def record_failure(self, model: str, error_class: str, error: Optional[str] = None):
+        stats = self._get(model)
+        stats.total_calls += 1
+        stats.outcomes.append(False)
+        stats.error_counts[error_class] = stats.error_counts.get(error_class, 0) + 1
+        stats.last_error = error[:200] if error else error_class
+        stats.last_failure_at = time.time()
+
+    # ===========================================
+    # QUERIES
+    # ===========================================
+
+    def latency_quantile(self, model: str, quantile: float, min_samples: int = 1) -> Optional[float]:
+        """Latency (ms) at the given quantile, or None without enough samples"""
+        stats = self._stats.get(model)
+        if stats is None or len(stats.latencies) < min_samples:
+            return None
+
+        ordered = sorted(stats.latencies)
+        idx = min(int(quantile * len(ordered)), len(ordered) - 1)
+        return ordered[idx]
+
+    def _classify(self, stats: Optional[ModelStats]) -> tuple[int, str]:
+        """Return (tier, reason) for a model"""
+        if stats is None or stats.samples < settings.scoreboard_min_samples:
+            return 1, "not enough samples yet"
+
+        rate = stats.success_rate
+        if rate < settings.scoreboard_min_success_rate:
+            # Give failing models another chance once their failures have aged out
+            if stats.last_failure_at and time.time() - stats.last_failure_at > settings.scoreboard_recovery_seconds:
+                return 1, f"success rate {rate:.0%} but no failures for {settings.scoreboard_recovery_seconds}s, retrying"
+            return 3, f"success rate {rate:.0%} below {settings.scoreboard_min_success_rate:.0%}"
+
+        if stats.ewma_latency_ms is not None and stats.ewma_latency_ms > settings.scoreboard_slow_ms:
+            return 2, f"EWMA latency {stats.ewma_latency_ms:.0f}ms above {settings.scoreboard_slow_ms}ms"
+
+        return 0, f"success rate {rate:.0%}, EWMA latency {stats.ewma_latency_ms or 0:.0f}ms"
+
+    def _sort_key(self, model: str) -> tuple:
+        stats = self._stats.get(model)
+        tier, _ = self._classify(stats)
+
+        # Expected time to a success among healthy models: latency / success rate
+        expected_ms = 0.0
+        if tier == 0:
+            expected_ms = (stats.ewma_latency_ms or 0.0) / max(stats.success_rate, 0.05)
+
+        static_idx = self._static_order.index(model) if model in self._static_order else len(self._static_order)
+        return (tier, expected_ms, static_idx)
+
+    def ordered(self, models: Optional[List[str]] = None) -> List[str]:
+        """Fallback chain ordered by live statistics"""
+        return sorted(models if models is not None else self._static_order, key=self._sort_key)
+
+    def explain(self, models: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Per-model statistics and the reason for its position in the chain"""
+        chain = self.ordered(models)
+        result = []
+        for rank, model in enumerate(chain):
+            stats = self._stats.get(model)
+            tier, reason = self._classify(stats)
+            rate = stats.success_rate if stats else None
+            result.append({
+                "model": model,
+                "rank": rank + 1,
+                "static_rank": self._static_order.index(model) + 1 if model in self._static_order else None,
+                "tier": self.TIERS[tier],
+                "reason": reason,
+                "samples": stats.samples if stats else 0,
+                "total_calls": stats.total_calls if stats else 0,
+                "success_rate": round(rate, 3) if rate is not None else None,
+                "ewma_latency_ms": int(stats.ewma_latency_ms) if stats and stats.ewma_latency_ms is not None else None,
+                "errors": dict(stats.error_counts) if stats else {},
+                "last_error": stats.last_error if stats else None,
+            })
+        return result
+
+
+class CircuitBreaker:
+    """
+    Per-model circuit breaker.
+
+    closed    - calls flow; trips on consecutive failures or windowed error rate
+    open      - calls are skipped immediately until the cooldown elapses
+    half_open - a single probe call is let through; success closes, failure re-opens
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, model: str):
+        self.model = model
+        self._state = self.CLOSED
+        self._outcomes: deque = deque(maxlen=settings.circuit_window)
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.times_opened = 0
+        self._probe_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and self._cooldown_elapsed():
+            return self.HALF_OPEN
+        return self._state
+
+    def _cooldown_elapsed(self) -> bool:
+        return self.opened_at is not None and time.monotonic() - self.opened_at >= settings.circuit_cooldown_seconds
+
+    def allow_request(self) -> bool:
+        """Whether a call may go to this model now (claims the probe slot when half-open)"""
+        if self._state == self.OPEN and self._cooldown_elapsed():
+            self._state = self.HALF_OPEN
+            self._probe_in_flight = False
+
+        if self._state == self.CLOSED:
+            return True
+        if self._state == self.HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def release_probe(self):
+        """Give back the probe slot when a probe ends without an outcome (e.g. cancelled)"""
+        self._probe_in_flight = False
+
+    def record_success(self) -> bool:
+        """Record a successful call; returns True if this success closed the circuit"""
+        if self._state != self.CLOSED:
+            self._close()
+            return True
+        self.consecutive_failures = 0
+        self._outcomes.append(True)
+        return False
+
+    def record_failure(self) -> bool:
+        """Record a failed call; returns True if this failure opened the circuit"""
+        if self._state == self.HALF_OPEN:
+            self._open()
+            return True
+        if self._state == self.OPEN:
+            return False
+
+        self.consecutive_failures += 1
+        self._outcomes.append(False)
+
+        if self.consecutive_failures >= settings.circuit_failure_threshold or self._error_rate_tripped():
+            self._open()
+            return True
+        return False
+
+    def _error_rate_tripped(self) -> bool:
+        if len(self._outcomes) < settings.circuit_min_calls:
+            return False
+        failures = len(self._outcomes) - sum(self._outcomes)
+        return failures / len(self._outcomes) >= settings.circuit_error_rate_threshold
+
+    def _open(self):
+        self._state = self.OPEN
+        self.opened_at = time.monotonic()
+        self.times_opened += 1
+        self._probe_in_flight = False
+
+    def _close(self):
+        self._state = self.CLOSED
+        self.opened_at = None
+        self.consecutive_failures = 0
+        self._outcomes.clear()
+        self._probe_in_flight = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        state = self.state
+        retry_in = None
+        if state == self.OPEN and self.opened_at is not None:
+            retry_in = round(settings.circuit_cooldown_seconds - (time.monotonic() - self.opened_at), 1)
+        return {
+            "state": state,
+            "consecutive_failures": self.consecutive_failures,
+            "times_opened": self.times_opened,
+            "probe_in_seconds": retry_in,
+        }
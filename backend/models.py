@@ -98,6 +98,18 @@ class GenerateRequest(BaseModel):
         default=False,
         description="Whether to let AI generate text (False = cleaner results, use brand_text overlay instead)"
     )
+    bypass_cache: bool = Field(
+        default=False,
+        description="Skip the result cache and force a fresh generation"
+    )
+    post_process: bool = Field(
+        default=False,
+        description="Also return a post-processed version (flattened colors, crisp edges)"
+    )
+    validate_quality: bool = Field(
+        default=False,
+        description="Score each variation with CLIP and regenerate low scorers while the latency budget lasts"
+    )
     
     @field_validator("prompt")
     @classmethod
@@ -156,12 +168,32 @@ class GenerationMetrics(BaseModel):
     total_time_ms: int
 
 
+class PaletteColor(BaseModel):
+    """One color of a post-processed design's palette"""
+    hex: str = Field(..., description="Color as #rrggbb")
+    share: float = Field(..., description="Fraction of the image covered by this color")
+
+
 class DesignVariation(BaseModel):
     """Single design variation"""
     image_url: str = Field(..., description="Generated image URL")
     variation_number: int = Field(..., description="Variation number (1, 2, 3, etc.)")
     model_used: str = Field(..., description="AI model that generated this")
     generation_time_ms: int = Field(..., description="Time taken to generate")
+    cached: bool = Field(default=False, description="Served from the result cache")
+    processed_image_url: Optional[str] = Field(
+        default=None,
+        description="Post-processed image URL (when post_process was requested and succeeded)"
+    )
+    palette: Optional[List[PaletteColor]] = Field(
+        default=None,
+        description="Colors of the post-processed image, most used first"
+    )
+    quality_score: Optional[float] = Field(
+        default=None,
+        description="CLIP prompt similarity (when validate_quality was requested and scoring succeeded)"
+    )
+    regeneration_attempts: int = Field(default=0, description="Extra generations made because of a low quality score")
 
 
 class GenerateResponse(BaseModel):
@@ -172,7 +204,13 @@ class GenerateResponse(BaseModel):
     prompt: str
     num_generated: int = Field(..., description="Number of variations generated")
     variations: List[DesignVariation] = Field(..., description="Generated design variations")
+    failed_variations: List[int] = Field(
+        default_factory=list,
+        description="Variation numbers that failed (partial results)"
+    )
     total_time_ms: int = Field(..., description="Total generation time")
+    cache_hits: int = Field(default=0, description="Variations served from the result cache")
+    regeneration_attempts: int = Field(default=0, description="Regenerations across all variations (validate_quality)")
     created_at: datetime = Field(default_factory=datetime.utcnow)
     
     # API documentation example - shows what response looks like
@@ -194,6 +232,31 @@ class GenerateResponse(BaseModel):
     }
 
 
+class JobCreatedResponse(BaseModel):
+    """Accepted asynchronous generation job"""
+    success: Literal[True] = True
+    job_id: str
+    request_id: str
+    status: GenerationStatus
+    status_url: str = Field(..., description="Poll for job status")
+    events_url: str = Field(..., description="Server-sent events: one 'variation' event per finished design")
+
+
+class JobStatusResponse(BaseModel):
+    """Asynchronous generation job status"""
+    success: Literal[True] = True
+    job_id: str
+    request_id: str
+    status: GenerationStatus
+    num_requested: int = Field(..., description="Variations requested")
+    num_completed: int = Field(..., description="Variations finished so far")
+    variations: List[DesignVariation] = Field(default_factory=list, description="Finished variations")
+    failed_variations: List[int] = Field(default_factory=list, description="Variation numbers that failed")
+    error: Optional[ErrorDetail] = None
+    created_at: datetime
+    completed_at: Optional[datetime] = None
+
+
 # ===========================================
 # INTERNAL MODELS
 # ===========================================
@@ -217,6 +280,7 @@ class ServiceHealth(BaseModel):
     status: Literal["healthy", "degraded", "unhealthy"]
     latency_ms: Optional[int] = None
     message: Optional[str] = None
+    details: Optional[dict] = None
 
 
 class HealthResponse(BaseModel):
@@ -0,0 +1,153 @@
+"""
+Pixova AI - Post-Processing Pool
+Runs CPU-bound ImageProcessor work in worker processes, off the event loop
+"""
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import settings
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def _process_in_worker(image_bytes: bytes, colors: int) -> Optional[Tuple[bytes, List[Dict[str, Any]]]]:
+    """Entry point inside a pool process (imports stay local to the worker)"""
+    from image_processor import processor
+    return processor.process_with_palette(image_bytes, colors)
+
+
+class ProcessingPool:
+    """
+    Process pool for image post-processing with back-pressure.
+
+    - Pool size defaults to the number of cores divided among the API
+      workers (`workers`), so one host runs about one process per core.
+    - At most workers + `processing_max_queued` jobs are admitted; callers wait
+      up to `processing_queue_wait` seconds for a permit and are otherwise
+      turned away (the variation is returned unprocessed).
+    - A job that exceeds `processing_timeout` is abandoned by the caller, but
+      its permit is only released once the worker actually finishes, so
+      stuck jobs keep counting against capacity.
+    """
+
+    def __init__(self):
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._permits: Optional[asyncio.Semaphore] = None
+        self._workers = settings.processing_workers or max((os.cpu_count() or 1) // settings.workers, 1)
+        self._active = 0
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.rejected = 0
+
+    @property
+    def enabled(self) -> bool:
+        return settings.processing_enabled
+
+    @property
+    def capacity(self) -> int:
+        return self._workers + settings.processing_max_queued
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: never fork a process that is running an event loop and threads
+            self._executor = ProcessPoolExecutor(
+                max_workers=self._workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+            logger.info(f"🏭 Processing pool started ({self._workers} workers)")
+        return self._executor
+
+    def _get_permits(self) -> asyncio.Semaphore:
+        if self._permits is None:
+            self._permits = asyncio.Semaphore(self.capacity)
+        return self._permits
+
+    async def process(self, image_bytes: bytes, colors: int) -> Optional[Tuple[bytes, List[Dict[str, Any]]]]:
+        """
+        Post-process an image in the pool with a palette of at most `colors` colors.
+        Returns (processed PNG bytes, palette), or None when busy, timed out or failed
+        (never raises: post-processing must not fail a generated variation).
+        """
+        permits = self._get_permits()
+        try:
+            await asyncio.wait_for(permits.acquire(), timeout=settings.processing_queue_wait)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            logger.warning("Processing pool saturated, skipping post-processing", active=self._active)
+            return None
+
+        loop = asyncio.get_running_loop()
+        try:
+            future = loop.run_in_executor(self._get_executor(), _process_in_worker, image_bytes, colors)
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                self._reset()
+            permits.release()
+            self.failed += 1
+            logger.warning("Could not submit post-processing job", error_type=type(e).__name__, error=str(e)[:200])
+            return None
+
+        self._active += 1
+
+        def release(_):
+            self._active -= 1
+            permits.release()
+
+        future.add_done_callback(release)
+
+        try:
+            result = await asyncio.wait_for(asyncio.shield(future), timeout=settings.processing_timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            logger.warning("Post-processing timed out", timeout_s=settings.processing_timeout)
+            return None
+        except BrokenProcessPool:
+            self.failed += 1
+            logger.error("Processing pool crashed, restarting", exc_info=False)
+            self._reset()
+            return None
+        except Exception as e:
+            # Raised in (or on the way to) the worker: import errors, pickling errors, bugs
+            self.failed += 1
+            logger.warning("Post-processing failed", error_type=type(e).__name__, error=str(e)[:200])
+            return None
+
+        if result is None:
+            self.failed += 1
+        else:
+            self.completed += 1
+        return result
+
+    def _reset(self):
+        """Drop a broken pool; the next job starts a fresh one"""
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "started": self._executor is not None,
+            "workers": self._workers,
+            "capacity": self.capacity,
+            "active": self._active,
+            "completed": self.completed,
+            "failed": self.failed,
+            "timeouts": self.timeouts,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# Singleton instance
+processing_pool = ProcessingPool()
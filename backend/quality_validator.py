@@ -3,41 +3,107 @@ Quality Validation using CLIP
 Validates that generated images match logo criteria (professional, clean, minimal text artifacts)
 """
 
+import asyncio
 import io
-import torch
-import requests
+import threading
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
-from typing import Tuple, Optional
+from typing import Dict, List, Tuple, Optional
+from config import settings
 from logger import get_logger
+from blob_cache import blob_cache
+from clip_backends import ClipBackend, create_clip_backend
+from validation_server import validation_client
 
 logger = get_logger(__name__)
 
-# Lazy imports to avoid slow startup
-_clip_model = None
-_clip_processor = None
+# Prompts the image should NOT look like (positive prompt is built per request)
+NEGATIVE_PROMPTS = [
+    "blurry image, low quality, gradient shadows",
+    "3D render, realistic photo, complex illustration",
+    "text heavy design, word art, typography poster"
+]
 
+MAX_DOWNLOAD_WORKERS = 8
 
-def _load_clip():
-    """Lazy load CLIP model (only when needed)"""
-    global _clip_model, _clip_processor
+# Lazy load to avoid slow startup
+_clip_backend: Optional[ClipBackend] = None
+_load_lock = threading.Lock()  # Concurrent first validations must share one model load
+
+# Text embeddings: negatives are fixed (encoded once at load), positives are
+# shared by every variation of a request (bounded LRU keyed by prompt text)
+_negative_embeds: Optional[np.ndarray] = None
+_positive_embeds: "OrderedDict[str, np.ndarray]" = OrderedDict()
+_text_cache_lock = threading.Lock()
+_text_cache_stats = {"hits": 0, "misses": 0}
+
+
+def _load_clip() -> ClipBackend:
+    """Lazy load the CLIP inference backend (only when needed)"""
+    if _clip_backend is None:
+        with _load_lock:
+            # Another thread may have finished loading while this one waited
+            if _clip_backend is None:
+                logger.info("⏳ Loading CLIP model for quality validation...")
+                try:
+                    use_backend(create_clip_backend())
+                    logger.info(f"✅ CLIP model loaded ({_clip_backend.name})")
+                except Exception as e:
+                    logger.error(f"❌ Failed to load CLIP model: {e}")
+                    raise
     
-    if _clip_model is None:
-        logger.info("⏳ Loading CLIP model for quality validation...")
-        try:
-            from transformers import CLIPProcessor, CLIPModel
-            
-            _clip_model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32")
-            _clip_processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32")
-            
-            logger.info("✅ CLIP model loaded")
-        except Exception as e:
-            logger.error(f"❌ Failed to load CLIP model: {e}")
-            raise
+    return _clip_backend
+
+
+def use_backend(backend: ClipBackend):
+    """Switch the validator to a backend (embeddings from another backend are dropped)"""
+    global _clip_backend, _negative_embeds
     
-    return _clip_model, _clip_processor
+    negative_embeds = backend.encode_text(NEGATIVE_PROMPTS)
+    with _text_cache_lock:
+        _positive_embeds.clear()
+        _negative_embeds = negative_embeds
+        _clip_backend = backend
+
+
+def _positive_prompt(prompt: str) -> str:
+    return f"professional logo design for {prompt}, clean, minimal, vector style"
+
+
+def _text_embeddings(backend: ClipBackend, prompt: str) -> np.ndarray:
+    """Positive + negative prompt embeddings; runs the text tower only on a cache miss"""
+    text = _positive_prompt(prompt)
+    
+    with _text_cache_lock:
+        positive = _positive_embeds.get(text)
+        if positive is not None:
+            _positive_embeds.move_to_end(text)
+            _text_cache_stats["hits"] += 1
+    
+    if positive is None:
+        positive = backend.encode_text([text])
+        with _text_cache_lock:
+            _text_cache_stats["misses"] += 1
+            _positive_embeds[text] = positive
+            while len(_positive_embeds) > settings.clip_text_cache_size:
+                _positive_embeds.popitem(last=False)
+    
+    return np.vstack([positive, _negative_embeds])
+
 
+def text_cache_stats() -> Dict[str, int]:
+    with _text_cache_lock:
+        return {**_text_cache_stats, "size": len(_positive_embeds), "max_size": settings.clip_text_cache_size}
 
-def validate_logo_quality(image_url: str, prompt: str, threshold: float = 0.28) -> Tuple[bool, float]:
+
+def validate_logo_quality(
+    image_url: str,
+    prompt: str,
+    threshold: float = 0.28,
+    image_bytes: Optional[bytes] = None
+) -> Tuple[bool, float]:
     """
     Validate logo quality using CLIP similarity score
     
@@ -45,44 +111,85 @@ def validate_logo_quality(image_url: str, prompt: str, threshold: float = 0.28)
         image_url: URL of generated image
         prompt: Original user prompt
         threshold: Minimum similarity score (0-1) to pass validation
+        image_bytes: Image already in memory (b64_json generations); skips the download
     
     Returns:
         (is_valid, score): Boolean validity and actual score
     """
-    try:
-        logger.debug(f"→ Validating quality for: {image_url[:60]}...")
-        
-        # Load CLIP model
-        model, processor = _load_clip()
-        
-        # Download image
-        response = requests.get(image_url, timeout=30)
-        response.raise_for_status()
-        image = Image.open(io.BytesIO(response.content))
-        
-        # Create validation prompts
-        positive_prompt = f"professional logo design for {prompt}, clean, minimal, vector style"
-        negative_prompts = [
-            "blurry image, low quality, gradient shadows",
-            "3D render, realistic photo, complex illustration",
-            "text heavy design, word art, typography poster"
-        ]
-        
-        # Calculate similarity scores
-        inputs = processor(
-            text=[positive_prompt] + negative_prompts,
-            images=image,
-            return_tensors="pt",
-            padding=True
-        )
+    return validate_batch([image_url], prompt, threshold, images_bytes=[image_bytes])[0]
+
+
+async def avalidate_logo_quality(
+    image_url: str,
+    prompt: str,
+    threshold: float = 0.28,
+    image_bytes: Optional[bytes] = None
+) -> Tuple[bool, float]:
+    """Async validate_logo_quality (uses the validation sidecar when enabled)"""
+    return (await avalidate_batch([image_url], prompt, threshold, images_bytes=[image_bytes]))[0]
+
+
+def _load_image(image_url: str, image_bytes: Optional[bytes]) -> Image.Image:
+    # Download image (at most once per host via the blob cache)
+    if image_bytes is None:
+        image_bytes = blob_cache.fetch(image_url)
+    image = Image.open(io.BytesIO(image_bytes))
+    return image.convert("RGB") if image.mode != "RGB" else image
+
+
+def load_images(
+    image_urls: List[str],
+    images_bytes: List[Optional[bytes]]
+) -> List[Optional[Image.Image]]:
+    """Download/decode all images concurrently; None for any that fail"""
+    def load(index: int) -> Optional[Image.Image]:
+        try:
+            return _load_image(image_urls[index], images_bytes[index])
+        except Exception as e:
+            logger.error(f"❌ Quality validation error: {str(e)}", image_url=image_urls[index][:60])
+            return None
+    
+    workers = min(len(image_urls), MAX_DOWNLOAD_WORKERS)
+    if workers <= 1:
+        return [load(i) for i in range(len(image_urls))]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(load, range(len(image_urls))))
+
+
+def score_images(images: List[Image.Image], prompts: List[str]) -> List[float]:
+    """
+    Probability of its positive prompt for each image, in one forward pass:
+    all images are stacked into a single batch and compared with cached
+    text embeddings of their own prompt (prompts may differ per image).
+    """
+    backend = _load_clip()
+    image_embeds = backend.encode_images(images)
+    
+    scores = [0.0] * len(images)
+    for prompt in set(prompts):
+        rows = [i for i, p in enumerate(prompts) if p == prompt]
+        text_embeds = _text_embeddings(backend, prompt)
         
-        with torch.no_grad():
-            outputs = model(**inputs)
-            logits_per_image = outputs.logits_per_image
-            probs = logits_per_image.softmax(dim=1)
+        # Same logits as CLIPModel.forward (logits_per_image), softmax over prompts
+        logits = backend.logit_scale * image_embeds[rows] @ text_embeds.T
+        logits -= logits.max(axis=1, keepdims=True)
+        probs = np.exp(logits)
+        probs /= probs.sum(axis=1, keepdims=True)
         
         # Score is probability of positive prompt
-        positive_score = probs[0][0].item()
+        for row, score in zip(rows, probs[:, 0].tolist()):
+            scores[row] = score
+    
+    return scores
+
+
+def _apply_threshold(scores: List[Optional[float]], threshold: float) -> List[Tuple[bool, float]]:
+    """(is_valid, score) per image; unscored images (None) count as valid with score 0.0"""
+    results = []
+    for positive_score in scores:
+        if positive_score is None:
+            results.append((True, 0.0))
+            continue
         
         # Check against threshold
         is_valid = positive_score >= threshold
@@ -92,22 +199,86 @@ def validate_logo_quality(image_url: str, prompt: str, threshold: float = 0.28)
         else:
             logger.warning(f"⚠️ Quality validation failed (score: {positive_score:.3f} < {threshold})")
         
-        return is_valid, positive_score
-        
-    except Exception as e:
-        logger.error(f"❌ Quality validation error: {str(e)}")
-        # On error, assume valid to not block generation
-        return True, 0.0
+        results.append((is_valid, positive_score))
+    return results
 
 
-def validate_batch(image_urls: list[str], prompt: str, threshold: float = 0.28) -> list[Tuple[bool, float]]:
+def score_batch(
+    image_urls: list[str],
+    prompt: str,
+    images_bytes: Optional[List[Optional[bytes]]] = None
+) -> List[Optional[float]]:
     """
-    Validate multiple images in batch
-    Returns list of (is_valid, score) tuples
+    Positive-prompt score per image (in this process), in input order.
+    None marks an image that could not be scored (failed to load, failing model).
     """
-    results = []
+    if not image_urls:
+        return []
+    
     for url in image_urls:
-        result = validate_logo_quality(url, prompt, threshold)
-        results.append(result)
+        logger.debug(f"→ Validating quality for: {url[:60]}...")
     
-    return results
+    images = load_images(image_urls, images_bytes or [None] * len(image_urls))
+    loaded = [i for i, image in enumerate(images) if image is not None]
+    
+    scores: List[Optional[float]] = [None] * len(image_urls)
+    if loaded:
+        try:
+            loaded_scores = score_images([images[i] for i in loaded], [prompt] * len(loaded))
+        except Exception as e:
+            logger.error(f"❌ Quality validation error: {str(e)}")
+            loaded_scores = [None] * len(loaded)
+        for i, score in zip(loaded, loaded_scores):
+            scores[i] = score
+    
+    return scores
+
+
+async def ascore_batch(
+    image_urls: list[str],
+    prompt: str,
+    images_bytes: Optional[List[Optional[bytes]]] = None
+) -> List[Optional[float]]:
+    """
+    Async score_batch.
+    With the validation sidecar enabled, scoring happens there (one shared
+    model, batched across workers). If it is not running the batch is
+    scored in this process instead; if it is too slow the images stay
+    unscored (None).
+    """
+    if not image_urls:
+        return []
+    
+    if settings.validation_sidecar_enabled:
+        scores = await validation_client.score(image_urls, prompt, images_bytes)
+        if scores is not None:
+            return scores
+    
+    return await asyncio.to_thread(score_batch, image_urls, prompt, images_bytes)
+
+
+def validate_batch(
+    image_urls: list[str],
+    prompt: str,
+    threshold: float = 0.28,
+    images_bytes: Optional[List[Optional[bytes]]] = None
+) -> list[Tuple[bool, float]]:
+    """
+    Validate multiple images in batch (in this process)
+    Returns list of (is_valid, score) tuples, in input order
+    
+    Images are downloaded concurrently and scored in a single CLIP forward
+    pass. Images that fail to load, or a failing model, count as valid with
+    score 0.0 (validation never blocks generation).
+    """
+    return _apply_threshold(score_batch(image_urls, prompt, images_bytes), threshold)
+
+
+async def avalidate_batch(
+    image_urls: list[str],
+    prompt: str,
+    threshold: float = 0.28,
+    images_bytes: Optional[List[Optional[bytes]]] = None
+) -> list[Tuple[bool, float]]:
+    """Async validate_batch (uses the validation sidecar when enabled)"""
+    return _apply_threshold(await ascore_batch(image_urls, prompt, images_bytes), threshold)
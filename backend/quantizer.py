@@ -0,0 +1,130 @@
+"""
+Pixova AI - Palette Quantizer
+k-means palette fitted on a downsampled histogram, applied to full-resolution
+pixels through a 32x32x32 nearest-color lookup table
+"""
+import math
+from typing import Tuple
+
+import numpy as np
+
+
+class PaletteQuantizer:
+    """
+    Reduces an RGB image to at most `colors` colors.
+
+    - fit(): the image is sampled on a regular grid down to ~`sample_pixels`
+      pixels and binned into 32 levels per channel. Weighted k-means runs on
+      the occupied bins (a few thousand points, not a million pixels),
+      seeded with k-means++.
+    - build_lut(): the nearest palette entry of every bin, computed once
+      per palette (32768 entries).
+    - map(): full-resolution pixels are assigned with one table lookup each.
+    """
+
+    GRID_BITS = 5                 # 32 levels per channel
+    KMEANS_ITERATIONS = 8
+    KMEANS_TOLERANCE = 0.5        # Stop when no center moves further (RGB units)
+    CHUNK_POINTS = 4096           # Bounds the points x centers distance matrix
+
+    def __init__(self, sample_pixels: int = 65536):
+        self.sample_pixels = sample_pixels
+        shift = 8 - self.GRID_BITS
+        levels = (np.arange(1 << self.GRID_BITS, dtype=np.float32) * (1 << shift)) + (1 << shift) / 2
+        r, g, b = np.meshgrid(levels, levels, levels, indexing="ij")
+        # Bin centers in bin-index order (r major, b minor)
+        self._grid = np.stack([r.ravel(), g.ravel(), b.ravel()], axis=1)
+
+    def _bin_index(self, pixels: np.ndarray) -> np.ndarray:
+        """Flat 15-bit bin index of each RGB pixel"""
+        shift = 8 - self.GRID_BITS
+        bins = (pixels >> shift).astype(np.int32)
+        return (bins[..., 0] << (2 * self.GRID_BITS)) | (bins[..., 1] << self.GRID_BITS) | bins[..., 2]
+
+    def _sample(self, pixels: np.ndarray) -> np.ndarray:
+        height, width = pixels.shape[:2]
+        step = max(int(math.sqrt(height * width / self.sample_pixels)), 1)
+        return pixels[::step, ::step]
+
+    # ===========================================
+    # FIT
+    # ===========================================
+
+    def fit(self, pixels: np.ndarray, colors: int) -> np.ndarray:
+        """Palette (k x 3 uint8, k <= colors) for an H x W x 3 uint8 image"""
+        sample = np.ascontiguousarray(self._sample(pixels))
+
+        # Occupied bins: pixel count and mean color of each
+        bins = self._bin_index(sample).ravel()
+        flat = sample.reshape(-1, 3).astype(np.float64)
+        size = 1 << (3 * self.GRID_BITS)
+        weights = np.bincount(bins, minlength=size)
+        occupied = np.nonzero(weights)[0]
+        weights = weights[occupied].astype(np.float64)
+        points = np.stack(
+            [np.bincount(bins, weights=flat[:, c], minlength=size)[occupied] for c in range(3)],
+            axis=1
+        ) / weights[:, None]
+
+        if len(points) <= colors:
+            return np.clip(np.rint(points), 0, 255).astype(np.uint8)
+        centers = self._seed(points, weights, colors)
+
+        for _ in range(self.KMEANS_ITERATIONS):
+            labels = self._nearest(points, centers)
+            totals = np.bincount(labels, weights=weights, minlength=len(centers))
+            moved = centers.copy()
+            for c in range(3):
+                sums = np.bincount(labels, weights=weights * points[:, c], minlength=len(centers))
+                # Empty clusters keep their previous center
+                np.divide(sums, totals, out=moved[:, c], where=totals > 0)
+            shift = np.abs(moved - centers).max()
+            centers = moved
+            if shift < self.KMEANS_TOLERANCE:
+                break
+
+        return np.clip(np.rint(centers), 0, 255).astype(np.uint8)
+
+    @staticmethod
+    def _seed(points: np.ndarray, weights: np.ndarray, colors: int) -> np.ndarray:
+        """Initial centers: weighted k-means++ (fixed seed, so output is deterministic)"""
+        rng = np.random.default_rng(0)
+        centers = [points[int(weights.argmax())]]
+        closest = ((points - centers[0]) ** 2).sum(axis=1)
+        for _ in range(colors - 1):
+            scores = closest * weights
+            total = scores.sum()
+            if total <= 0:
+                break
+            index = int(np.searchsorted(np.cumsum(scores), rng.random() * total))
+            centers.append(points[min(index, len(points) - 1)])
+            np.minimum(closest, ((points - centers[-1]) ** 2).sum(axis=1), out=closest)
+        return np.array(centers)
+
+    def _nearest(self, points: np.ndarray, centers: np.ndarray) -> np.ndarray:
+        """Index of the nearest center for every point (squared Euclidean, in chunks)"""
+        labels = np.empty(len(points), dtype=np.int64)
+        center_norms = (centers * centers).sum(axis=1)[None, :]
+        for start in range(0, len(points), self.CHUNK_POINTS):
+            chunk = points[start:start + self.CHUNK_POINTS]
+            # |p|^2 is the same for every center, so it does not affect the argmin
+            distances = center_norms - 2.0 * chunk @ centers.T
+            labels[start:start + len(chunk)] = distances.argmin(axis=1)
+        return labels
+
+    # ===========================================
+    # MAP
+    # ===========================================
+
+    def build_lut(self, palette: np.ndarray) -> np.ndarray:
+        """Nearest palette index for every color bin"""
+        return self._nearest(self._grid, palette.astype(np.float32)).astype(np.uint8)
+
+    def map(self, pixels: np.ndarray, lut: np.ndarray) -> np.ndarray:
+        """H x W palette indices for an H x W x 3 uint8 image"""
+        return lut[self._bin_index(pixels)]
+
+    def quantize(self, pixels: np.ndarray, colors: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(palette, indices) for an H x W x 3 uint8 image"""
+        palette = self.fit(pixels, colors)
+        return palette, self.map(pixels, self.build_lut(palette))
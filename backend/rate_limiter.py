@@ -0,0 +1,324 @@
+"""
+Pixova AI - Rate Limiter
+GCRA (generic cell rate algorithm): constant time and one float of state per client
+"""
+import asyncio
+import math
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, NamedTuple, Optional, Tuple
+
+from config import settings
+from logger import get_logger
+from utils import open_sqlite
+
+logger = get_logger(__name__)
+
+
+class RateLimitResult(NamedTuple):
+    allowed: bool
+    limit: int
+    remaining: int
+    reset_at: int         # Epoch seconds when the full quota is available again
+    retry_after: int      # Seconds until the request would be allowed (0 if allowed)
+
+
+# decide(current TAT or None) -> (TAT to store or None to leave unchanged, outcome)
+Decision = Callable[[Optional[float]], Tuple[Optional[float], Any]]
+
+
+# ===========================================
+# STATE STORES
+# ===========================================
+
+class RateLimitStore:
+    """Per-client TAT storage; update() must apply a decision atomically"""
+
+    name = "base"
+    blocking = False  # True if calls do I/O and must run off the event loop
+
+    def update(self, client_id: str, decide: Decision, now: float) -> Any:
+        raise NotImplementedError
+
+    def get(self, client_id: str) -> Optional[float]:
+        raise NotImplementedError
+
+    def size(self) -> int:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class MemoryRateLimitStore(RateLimitStore):
+    """
+    In-process store (limits apply per worker).
+    Clients whose TAT has passed are indistinguishable from new clients, so
+    they are swept from the LRU front; the number of tracked clients is also
+    hard-capped.
+    """
+
+    name = "memory"
+
+    def __init__(self, max_clients: int):
+        self.max_clients = max_clients
+        self._tats: "OrderedDict[str, float]" = OrderedDict()
+
+    def update(self, client_id: str, decide: Decision, now: float) -> Any:
+        new_tat, outcome = decide(self._tats.get(client_id))
+        if new_tat is not None:
+            self._tats[client_id] = new_tat
+        if client_id in self._tats:
+            self._tats.move_to_end(client_id)
+        self._sweep(now)
+        return outcome
+
+    def _sweep(self, now: float):
+        # Sweep fully-replenished clients from the least recently used end
+        while self._tats:
+            oldest_id, oldest_tat = next(iter(self._tats.items()))
+            if oldest_tat > now and len(self._tats) <= self.max_clients:
+                break
+            del self._tats[oldest_id]
+
+    def get(self, client_id: str) -> Optional[float]:
+        return self._tats.get(client_id)
+
+    def size(self) -> int:
+        return len(self._tats)
+
+
+class SQLiteRateLimitStore(RateLimitStore):
+    """
+    SQLite store shared by all gunicorn workers on the host, so the limit
+    holds regardless of which worker serves a request.
+    Each update is one short BEGIN IMMEDIATE transaction on a single row
+    (WAL + synchronous=NORMAL: no fsync per commit). Rows whose TAT has
+    passed carry no state; every SWEEP_EVERY updates up to SWEEP_BATCH of
+    them are deleted in a separate transaction, after the update's commit.
+    """
+
+    name = "sqlite"
+    blocking = True
+    SWEEP_EVERY = 500
+    SWEEP_BATCH = 1000
+
+    def __init__(self, path: str, busy_timeout_ms: int):
+        self._lock = threading.Lock()
+        self._updates = 0
+        self._conn = open_sqlite(path, busy_timeout_ms=busy_timeout_ms)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_limits ("
+            "client_id TEXT PRIMARY KEY, tat REAL NOT NULL) WITHOUT ROWID"
+        )
+
+    def update(self, client_id: str, decide: Decision, now: float) -> Any:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT tat FROM rate_limits WHERE client_id = ?", (client_id,)
+                ).fetchone()
+                new_tat, outcome = decide(row[0] if row else None)
+                if new_tat is not None:
+                    self._conn.execute(
+                        "INSERT INTO rate_limits (client_id, tat) VALUES (?, ?) "
+                        "ON CONFLICT(client_id) DO UPDATE SET tat = excluded.tat",
+                        (client_id, new_tat)
+                    )
+
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+            self._updates += 1
+            if self._updates % self.SWEEP_EVERY == 0:
+                self._sweep(now)
+        return outcome
+
+    def _sweep(self, now: float):
+        """Delete a batch of expired rows (best effort: a busy database skips this sweep)"""
+        try:
+            self._conn.execute(
+                "DELETE FROM rate_limits WHERE client_id IN "
+                "(SELECT client_id FROM rate_limits WHERE tat <= ? LIMIT ?)",
+                (now, self.SWEEP_BATCH)
+            )
+        except sqlite3.Error as e:
+            logger.debug("Rate limit sweep skipped", error=str(e))
+
+    def get(self, client_id: str) -> Optional[float]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT tat FROM rate_limits WHERE client_id = ?", (client_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def size(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM rate_limits").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# ===========================================
+# LIMITER
+# ===========================================
+
+class GCRALimiter:
+    """
+    Allows `limit` units per `window` seconds with bursts up to `limit`.
+
+    State per client is a single theoretical arrival time (TAT). A request of
+    cost c is allowed if TAT + c * interval - now <= window.
+
+    If the shared store fails (e.g. its lock is held longer than the busy
+    timeout) the check falls back to an in-process store rather than
+    failing or stalling the request.
+    """
+
+    def __init__(self, limit: int, window: float, max_clients: int, backend: str = "memory"):
+        self.limit = limit
+        self.window = float(window)
+        self.interval = self.window / limit
+        self.max_clients = max_clients
+        self.backend = backend
+        self._store: Optional[RateLimitStore] = None
+        self._fallback = MemoryRateLimitStore(max_clients)
+        self.fallbacks = 0
+
+    def _get_store(self) -> RateLimitStore:
+        """Lazy store creation (falls back to memory if SQLite is unavailable)"""
+        if self._store is None:
+            if self.backend == "sqlite":
+                try:
+                    self._store = SQLiteRateLimitStore(
+                        settings.rate_limit_sqlite_path,
+                        settings.rate_limit_busy_timeout_ms
+                    )
+                except Exception as e:
+                    logger.warning("SQLite rate limiter unavailable, using memory", error=str(e))
+            if self._store is None:
+                self._store = self._fallback
+            logger.info(f"🚦 Rate limiter ready ({self._store.name})")
+        return self._store
+
+    def _result(self, allowed: bool, tat: float, now: float, retry_after: float = 0.0) -> RateLimitResult:
+        used = max(tat - now, 0.0)
+        remaining = int((self.window - used) // self.interval) if used < self.window else 0
+        return RateLimitResult(
+            allowed=allowed,
+            limit=self.limit,
+            remaining=max(min(remaining, self.limit), 0),
+            reset_at=int(math.ceil(now + used)),
+            retry_after=int(math.ceil(retry_after)) if retry_after > 0 else 0,
+        )
+
+    def check(self, client_id: str, cost: int = 1, now: Optional[float] = None) -> RateLimitResult:
+        """Consume `cost` units for a client if allowed"""
+        now = time.time() if now is None else now
+        cost = min(max(cost, 0), self.limit)
+
+        def decide(stored: Optional[float]) -> Tuple[Optional[float], RateLimitResult]:
+            tat = max(stored if stored is not None else now, now)
+            new_tat = tat + cost * self.interval
+            allow_at = new_tat - self.window
+            if now < allow_at:
+                return None, self._result(False, tat, now, retry_after=allow_at - now)
+            return new_tat, self._result(True, new_tat, now)
+
+        store = self._get_store()
+        try:
+            return store.update(client_id, decide, now)
+        except sqlite3.Error as e:
+            self.fallbacks += 1
+            if self.fallbacks % 100 == 1:
+                logger.warning(
+                    "Shared rate limiter unavailable, using in-process limit",
+                    error=str(e),
+                    fallbacks=self.fallbacks
+                )
+            return self._fallback.update(client_id, decide, now)
+
+    async def acheck(self, client_id: str, cost: int = 1) -> RateLimitResult:
+        """check() for request handlers: runs in a thread when the store blocks (SQLite)"""
+        if self._get_store().blocking:
+            return await asyncio.to_thread(self.check, client_id, cost)
+        return self.check(client_id, cost)
+
+    def peek(self, client_id: str, now: Optional[float] = None) -> RateLimitResult:
+        """Current quota for a client without consuming anything"""
+        now = time.time() if now is None else now
+        try:
+            stored = self._get_store().get(client_id)
+        except sqlite3.Error:
+            stored = self._fallback.get(client_id)
+        tat = max(stored if stored is not None else now, now)
+        return self._result(True, tat, now)
+
+    @property
+    def tracked_clients(self) -> int:
+        return self._get_store().size()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self._store.name if self._store else self.backend,
+            "limit": self.limit,
+            "window_seconds": int(self.window),
+            "tracked_clients": self.tracked_clients,
+            "fallbacks": self.fallbacks,
+        }
+
+    def close(self):
+        if self._store is not None and self._store is not self._fallback:
+            self._store.close()
+        self._store = None
+
+
+# ===========================================
+# ROUTE COSTS
+# ===========================================
+
+def _parse_route_costs(raw: str) -> Dict[str, int]:
+    """Parse 'path:cost,path:cost' (paths ending in '/' match as prefixes)"""
+    costs = {}
+    for item in raw.split(","):
+        if ":" not in item:
+            continue
+        path, cost = item.rsplit(":", 1)
+        costs[path.strip()] = int(cost)
+    return costs
+
+
+ROUTE_COSTS = _parse_route_costs(settings.rate_limit_route_costs)
+
+
+def route_cost(path: str) -> int:
+    """Rate limit cost of a request path (exact match, then longest prefix, default 1)"""
+    if path in ROUTE_COSTS:
+        return ROUTE_COSTS[path]
+
+    best, best_len = 1, -1
+    for prefix, cost in ROUTE_COSTS.items():
+        if prefix.endswith("/") and path.startswith(prefix) and len(prefix) > best_len:
+            best, best_len = cost, len(prefix)
+    return best
+
+
+def variation_cost(num_variations: int) -> int:
+    """Extra cost of a generation request beyond its route cost"""
+    return max(num_variations - 1, 0) * settings.rate_limit_variation_cost
+
+
+# Singleton instance
+rate_limiter = GCRALimiter(
+    limit=settings.rate_limit_requests,
+    window=settings.rate_limit_window,
+    max_clients=settings.rate_limit_max_clients,
+    backend=settings.rate_limit_backend
+)
@@ -0,0 +1,225 @@
+"""
+Pixova AI - Generation Result Cache
+Exact-match cache for identical generation requests (TTL + LRU)
+"""
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any
+
+from config import settings
+from logger import get_logger
+from utils import open_sqlite
+
+logger = get_logger(__name__)
+
+
+class CacheBackend:
+    """Storage interface for cached generation results"""
+
+    name = "base"
+    blocking = False  # True = run calls off the event loop
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Dict[str, Any], ttl: float):
+        raise NotImplementedError
+
+    def size(self) -> int:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class MemoryCacheBackend(CacheBackend):
+    """In-process LRU cache with per-entry expiry"""
+
+    name = "memory"
+
+    def __init__(self, max_entries: int):
+        self._max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[float, Dict[str, Any]]] = OrderedDict()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, value = entry
+        if expires_at < time.time():
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Dict[str, Any], ttl: float):
+        self._entries[key] = (time.time() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    def size(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """
+    Local SQLite cache shared by all gunicorn workers on the host.
+    LRU is tracked via accessed_at; expired and least-recently-used rows
+    are pruned every EVICT_EVERY writes.
+    """
+
+    name = "sqlite"
+    blocking = True
+    EVICT_EVERY = 50
+
+    def __init__(self, path: str, max_entries: int):
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._conn = open_sqlite(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS result_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_result_cache_accessed ON result_cache(accessed_at)"
+        )
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM result_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            value, expires_at = row
+            if expires_at < now:
+                self._conn.execute("DELETE FROM result_cache WHERE key = ?", (key,))
+                return None
+
+            self._conn.execute(
+                "UPDATE result_cache SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+        return json.loads(value)
+
+    def set(self, key: str, value: Dict[str, Any], ttl: float):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO result_cache (key, value, expires_at, accessed_at) "
+                "VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now + ttl, now)
+            )
+            self._writes += 1
+            if self._writes % self.EVICT_EVERY == 0:
+                self._evict(now)
+
+    def _evict(self, now: float):
+        self._conn.execute("DELETE FROM result_cache WHERE expires_at < ?", (now,))
+        self._conn.execute(
+            "DELETE FROM result_cache WHERE key IN ("
+            "SELECT key FROM result_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self._max_entries,)
+        )
+
+    def size(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM result_cache").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class ResultCache:
+    """
+    Async facade over a cache backend with hit/miss counters.
+    Backend errors are logged and treated as misses - the cache never fails a request.
+    """
+
+    def __init__(self):
+        self._backend: Optional[CacheBackend] = None
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return settings.cache_enabled
+
+    def _get_backend(self) -> CacheBackend:
+        """Lazy backend creation (falls back to memory if SQLite is unavailable)"""
+        if self._backend is None:
+            if settings.cache_backend == "sqlite":
+                try:
+                    self._backend = SQLiteCacheBackend(settings.cache_sqlite_path, settings.cache_max_entries)
+                except Exception as e:
+                    logger.warning("SQLite result cache unavailable, using memory", error=str(e))
+            if self._backend is None:
+                self._backend = MemoryCacheBackend(settings.cache_max_entries)
+            logger.info(f"🗄️ Result cache ready ({self._backend.name})")
+        return self._backend
+
+    @staticmethod
+    def make_key(prompt: str, size: str, model: str, variation_number: int) -> str:
+        """Hash of the fully enhanced prompt, size, model chain and variation index"""
+        raw = json.dumps([prompt, size, model, variation_number])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def _call(self, method: str, *args):
+        backend = self._get_backend()
+        func = getattr(backend, method)
+        if backend.blocking:
+            return await asyncio.to_thread(func, *args)
+        return func(*args)
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            value = await self._call("get", key)
+        except Exception as e:
+            self.errors += 1
+            logger.warning("Result cache read failed", error=str(e))
+            value = None
+
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def set(self, key: str, value: Dict[str, Any]):
+        try:
+            await self._call("set", key, value, settings.cache_ttl_seconds)
+        except Exception as e:
+            self.errors += 1
+            logger.warning("Result cache write failed", error=str(e))
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "backend": self._backend.name if self._backend else settings.cache_backend,
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+        }
+
+    def close(self):
+        if self._backend is not None:
+            self._backend.close()
+            self._backend = None
+
+
+# Singleton instance
+result_cache = ResultCache()
@@ -0,0 +1,276 @@
+"""
+Pixova AI - Generation Scheduler
+Bounded priority queue in front of upstream image API calls:
+global concurrency limit, plan-tier priorities, per-user fair queuing
+"""
+import asyncio
+import hmac
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from config import settings
+from logger import get_logger
+from exceptions import ServiceOverloadedError
+
+logger = get_logger(__name__)
+
+# Lower number = served first (plans from db/schema.sql)
+PLAN_PRIORITIES = {
+    "admin": 0,
+    "enterprise": 1,
+    "pro": 2,
+    "free": 3,
+}
+DEFAULT_PLAN = "free"
+
+# Set by the authenticating gateway (profiles.plan_id of the signed-in user)
+PLAN_HEADER = "X-Pixova-Plan"
+GATEWAY_SECRET_HEADER = "X-Pixova-Gateway-Secret"
+
+# (user_id, plan) of the request whose upstream calls are being scheduled
+caller_ctx: ContextVar[Tuple[str, str]] = ContextVar("scheduler_caller", default=("anonymous", DEFAULT_PLAN))
+
+
+def set_caller(user_id: str, plan: str):
+    """Attribute upstream calls made in this context to a user and plan"""
+    return caller_ctx.set((user_id, plan if plan in PLAN_PRIORITIES else DEFAULT_PLAN))
+
+
+def resolve_plan(claimed_plan: Optional[str], gateway_secret: Optional[str]) -> str:
+    """
+    Plan used for queue priority. Only a plan header that comes with the
+    configured gateway secret is trusted; anything else (including the plan
+    in the request body, which any client can set) is served as free.
+    """
+    if not settings.gateway_secret or not claimed_plan or not gateway_secret:
+        return DEFAULT_PLAN
+    if not hmac.compare_digest(gateway_secret.encode("utf-8"), settings.gateway_secret.encode("utf-8")):
+        logger.warning("Plan header with an invalid gateway secret, serving as free")
+        return DEFAULT_PLAN
+    plan = claimed_plan.strip().lower()
+    return plan if plan in PLAN_PRIORITIES else DEFAULT_PLAN
+
+
+class _Waiter:
+    __slots__ = ("future", "user_id", "priority", "enqueued_at")
+
+    def __init__(self, user_id: str, priority: int):
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.user_id = user_id
+        self.priority = priority
+        self.enqueued_at = time.perf_counter()
+
+
+class GenerationScheduler:
+    """
+    Grants slots for upstream calls.
+
+    - At most `scheduler_max_concurrent` upstream calls run at once (per worker).
+    - Waiting calls are served by plan priority (admin > enterprise > pro > free).
+    - Within a priority, users are served round-robin so one user's burst
+      of variations cannot starve others on the same plan.
+    - Requests whose estimated queue wait exceeds `scheduler_max_queue_wait`
+      are rejected up front with 503 + Retry-After.
+    """
+
+    def __init__(self):
+        self._in_flight = 0
+        self._queues: Dict[int, "OrderedDict[str, Deque[_Waiter]]"] = {
+            priority: OrderedDict() for priority in sorted(set(PLAN_PRIORITIES.values()))
+        }
+        self._depth = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.granted = 0
+        self.wait_ewma_ms = 0.0
+        self.max_wait_ms = 0.0
+        self.service_ewma_ms: Optional[float] = None
+
+    @property
+    def enabled(self) -> bool:
+        return settings.scheduler_enabled
+
+    # ===========================================
+    # ADMISSION
+    # ===========================================
+
+    def estimate_wait(self, plan: str, cost: int = 1) -> float:
+        """Estimated seconds until `cost` new calls at this plan's priority would all start"""
+        priority = PLAN_PRIORITIES.get(plan, PLAN_PRIORITIES[DEFAULT_PLAN])
+        limit = settings.scheduler_max_concurrent
+
+        ahead = sum(
+            len(waiters)
+            for p, queue in self._queues.items() if p <= priority
+            for waiters in queue.values()
+        )
+        free_slots = max(limit - self._in_flight, 0)
+        backlog = ahead + cost - free_slots
+        if backlog <= 0:
+            return 0.0
+
+        service_s = (self.service_ewma_ms or settings.scheduler_default_service_seconds * 1000) / 1000
+        return math.ceil(backlog / limit) * service_s
+
+    def admit(self, plan: str, cost: int = 1):
+        """Reject now (503) rather than time out later when the queue is too deep"""
+        if not self.enabled:
+            return
+
+        wait = self.estimate_wait(plan, cost)
+        if wait > settings.scheduler_max_queue_wait:
+            self.rejected += 1
+            retry_after = max(int(math.ceil(wait - settings.scheduler_max_queue_wait)), 1)
+            logger.warning(
+                "Generation queue full, rejecting request",
+                plan=plan,
+                cost=cost,
+                estimated_wait_s=round(wait, 1),
+                queue_depth=self._depth
+            )
+            raise ServiceOverloadedError(retry_after=retry_after, estimated_wait=wait)
+
+        self.admitted += 1
+
+    # ===========================================
+    # SLOTS
+    # ===========================================
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one upstream-call slot for the current caller (no-op when disabled)"""
+        if not self.enabled:
+            yield
+            return
+
+        user_id, plan = caller_ctx.get()
+        await self._acquire(user_id, PLAN_PRIORITIES[plan])
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._record_service((time.perf_counter() - started) * 1000)
+            self._release()
+
+    async def _acquire(self, user_id: str, priority: int):
+        if self._in_flight < settings.scheduler_max_concurrent and self._depth == 0:
+            self._in_flight += 1
+            self._record_wait(0.0)
+            return
+
+        waiter = _Waiter(user_id, priority)
+        self._queues[priority].setdefault(user_id, deque()).append(waiter)
+        self._depth += 1
+
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout=settings.scheduler_max_queue_wait)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Slot was granted just as we gave up: hand it on
+                self._release()
+            else:
+                waiter.future.cancel()
+                self._remove(waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                self.timeouts += 1
+                raise ServiceOverloadedError(
+                    retry_after=int(settings.scheduler_default_service_seconds),
+                    estimated_wait=settings.scheduler_max_queue_wait
+                )
+            raise
+
+        self._record_wait((time.perf_counter() - waiter.enqueued_at) * 1000)
+
+    def _remove(self, waiter: _Waiter):
+        queue = self._queues[waiter.priority]
+        waiters = queue.get(waiter.user_id)
+        if waiters is None:
+            return
+        try:
+            waiters.remove(waiter)
+            self._depth -= 1
+        except ValueError:
+            return
+        if not waiters:
+            del queue[waiter.user_id]
+
+    def _release(self):
+        """Free a slot and hand it to the next waiter (priority first, round-robin by user)"""
+        self._in_flight -= 1
+        while self._depth and self._in_flight < settings.scheduler_max_concurrent:
+            waiter = self._next_waiter()
+            if waiter is None:
+                break
+            if waiter.future.done():
+                continue
+            self._in_flight += 1
+            self.granted += 1
+            waiter.future.set_result(None)
+
+    def _next_waiter(self) -> Optional[_Waiter]:
+        for queue in self._queues.values():
+            if not queue:
+                continue
+            user_id, waiters = next(iter(queue.items()))
+            waiter = waiters.popleft()
+            self._depth -= 1
+            if waiters:
+                queue.move_to_end(user_id)
+            else:
+                del queue[user_id]
+            return waiter
+        return None
+
+    # ===========================================
+    # METRICS
+    # ===========================================
+
+    def _record_wait(self, wait_ms: float):
+        self.wait_ewma_ms = 0.2 * wait_ms + 0.8 * self.wait_ewma_ms
+        self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+
+    def _record_service(self, service_ms: float):
+        if self.service_ewma_ms is None:
+            self.service_ewma_ms = service_ms
+        else:
+            self.service_ewma_ms = 0.2 * service_ms + 0.8 * self.service_ewma_ms
+
+    def stats(self) -> Dict[str, Any]:
+        depth_by_plan = {
+            plan: sum(len(w) for w in self._queues[priority].values())
+            for plan, priority in PLAN_PRIORITIES.items()
+        }
+        return {
+            "enabled": self.enabled,
+            "in_flight": self._in_flight,
+            "max_concurrent": settings.scheduler_max_concurrent,
+            "queue_depth": self._depth,
+            "queue_depth_by_plan": depth_by_plan,
+            "queued_users": sum(len(q) for q in self._queues.values()),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "wait_ewma_ms": int(self.wait_ewma_ms),
+            "max_wait_ms": int(self.max_wait_ms),
+            "service_ewma_ms": int(self.service_ewma_ms) if self.service_ewma_ms is not None else None,
+            "estimated_wait_s": {plan: round(self.estimate_wait(plan), 1) for plan in PLAN_PRIORITIES},
+        }
+
+    def health(self) -> Dict[str, Any]:
+        """Degraded while lowest-priority requests are being turned away"""
+        stats = self.stats()
+        rejecting = stats["estimated_wait_s"][DEFAULT_PLAN] > settings.scheduler_max_queue_wait
+        return {
+            "status": "degraded" if rejecting else "healthy",
+            "message": "Queue full for free plan" if rejecting else None,
+            "details": stats
+        }
+
+
+# Singleton instance
+scheduler = GenerationScheduler()
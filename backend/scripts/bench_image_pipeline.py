@@ -0,0 +1,199 @@
+"""
+Pixova AI - Image Post-Processing Benchmark
+Latency and peak memory of ImageProcessor.process_image against the original
+stage-by-stage chain (median cut, 128 colors), plus a comparison of their outputs.
+"pixels" times the processing stages only; "total" adds decode and the
+PNG encode (optimize=True) that process_bytes performs.
+
+Each variant runs in its own spawned process so its peak RSS is not
+polluted by the other variant; it is reported as growth over the warmed-up
+baseline (VmHWM after resetting it on Linux, ru_maxrss elsewhere).
+
+Usage (from backend/):
+    python scripts/bench_image_pipeline.py [--size 1024] [--runs 10] [--image logo.png]
+"""
+import argparse
+import functools
+import io
+import multiprocessing
+import os
+import resource
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("A4F_API_KEY", "benchmark")
+
+import numpy as np  # noqa: E402
+from PIL import Image, ImageEnhance, ImageFilter  # noqa: E402
+
+# The k-means palette is not median cut's, so final outputs differ; the
+# check is that quantization is at least as faithful to the source
+MAX_ERROR_RATIO = 1.05
+
+
+def legacy_pixels(image: Image.Image) -> Image.Image:
+    """The original pipeline: every stage converts the full image"""
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    posterized = image.quantize(colors=128, method=Image.MEDIANCUT)
+    image = posterized.convert('RGB')
+    image = ImageEnhance.Contrast(image).enhance(2.5)
+
+    img_array = np.array(image)
+    img_array = (img_array // 16) * 16
+    image = Image.fromarray(img_array.astype('uint8'))
+
+    image = image.filter(ImageFilter.UnsharpMask(radius=3, percent=200, threshold=2))
+    image = ImageEnhance.Sharpness(image).enhance(3.0)
+    return image.filter(ImageFilter.MedianFilter(size=3))
+
+
+def current_pixels(image: Image.Image, colors: int = 128) -> Image.Image:
+    from image_processor import processor
+    return processor.process_image(image, colors)
+
+
+VARIANTS = {"legacy": legacy_pixels, "current": current_pixels}
+
+
+def encode(image: Image.Image) -> bytes:
+    """Same encoding as ImageProcessor.process_bytes"""
+    output = io.BytesIO()
+    image.save(output, format='PNG', optimize=True)
+    return output.getvalue()
+
+
+def synthetic_logo(size: int) -> bytes:
+    """Logo-like test image: gradient background, soft shapes, noise"""
+    rng = np.random.default_rng(7)
+    y, x = np.mgrid[0:size, 0:size].astype(np.float32) / size
+    img = np.empty((size, size, 3), dtype=np.float32)
+    img[..., 0] = 40 + 180 * x
+    img[..., 1] = 60 + 120 * y
+    img[..., 2] = 200 - 150 * x * y
+
+    for cx, cy, r, color in ((0.35, 0.4, 0.2, (230, 80, 40)), (0.65, 0.6, 0.15, (30, 160, 220))):
+        dist = np.sqrt((x - cx) ** 2 + (y - cy) ** 2)
+        alpha = np.clip((r - dist) / 0.02, 0, 1)[..., None]  # Soft (anti-aliased) edge
+        img = img * (1 - alpha) + np.array(color, dtype=np.float32) * alpha
+
+    img += rng.normal(0, 4, img.shape)
+    output = io.BytesIO()
+    Image.fromarray(np.clip(img, 0, 255).astype(np.uint8)).save(output, format='PNG')
+    return output.getvalue()
+
+
+def _reset_peak_rss() -> int:
+    """Reset the RSS high-water mark (Linux) and return the current RSS in KB"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return _proc_status_kb("VmRSS")
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _peak_rss() -> int:
+    try:
+        return _proc_status_kb("VmHWM")
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _proc_status_kb(field: str) -> int:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    raise OSError(field)
+
+
+def run_variant(name: str, image_bytes: bytes, runs: int, colors: int, queue):
+    func = VARIANTS[name]
+    if name == "current":
+        func = functools.partial(func, colors=colors)
+    func(Image.new('RGB', (64, 64)))  # Warm up imports
+    baseline_kb = _reset_peak_rss()
+
+    pixel_ms, total_ms = [], []
+    for _ in range(runs):
+        started = time.perf_counter()
+        image = func(Image.open(io.BytesIO(image_bytes)))
+        pixel_ms.append((time.perf_counter() - started) * 1000)
+        output = encode(image)
+        total_ms.append((time.perf_counter() - started) * 1000)
+
+    # Peak growth over the warmed-up baseline (decode + pipeline + encode)
+    peak_kb = _peak_rss() - baseline_kb
+    queue.put((name, pixel_ms, total_ms, peak_kb, output))
+
+
+def compare(a: bytes, b: bytes):
+    pixels_a = np.asarray(Image.open(io.BytesIO(a)).convert('RGB'), dtype=np.int16)
+    pixels_b = np.asarray(Image.open(io.BytesIO(b)).convert('RGB'), dtype=np.int16)
+    diff = np.abs(pixels_a - pixels_b)
+    differing = np.any(diff > 0, axis=-1).mean() * 100
+    return float(diff.mean()), float(differing)
+
+
+def quantization_errors(image_bytes: bytes, colors: int):
+    """Mean absolute error of each quantizer against the source pixels"""
+    from image_processor import processor
+
+    image = Image.open(io.BytesIO(image_bytes)).convert('RGB')
+    source = np.asarray(image, dtype=np.int16)
+
+    median_cut = np.asarray(image.quantize(colors=colors, method=Image.MEDIANCUT).convert('RGB'), dtype=np.int16)
+    palette, indices = processor.quantizer.quantize(np.asarray(image), colors)
+    kmeans = palette[indices].astype(np.int16)
+    return float(np.abs(median_cut - source).mean()), float(np.abs(kmeans - source).mean())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=1024, help="Synthetic image size (pixels)")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--image", help="Benchmark this image file instead of a synthetic one")
+    parser.add_argument("--colors", type=int, default=128, help="Palette size for the current pipeline")
+    args = parser.parse_args()
+
+    if args.image:
+        with open(args.image, "rb") as f:
+            image_bytes = f.read()
+    else:
+        image_bytes = synthetic_logo(args.size)
+
+    ctx = multiprocessing.get_context("spawn")
+    results = {}
+    for name in VARIANTS:
+        queue = ctx.Queue()
+        proc = ctx.Process(target=run_variant, args=(name, image_bytes, args.runs, args.colors, queue))
+        proc.start()
+        results[name] = queue.get()
+        proc.join()
+
+    print(f"{'variant':<10}{'pixels p50 ms':>15}{'total p50 ms':>15}{'peak +RSS MB':>15}")
+    for name, pixel_ms, total_ms, peak_kb, _ in results.values():
+        print(
+            f"{name:<10}{statistics.median(pixel_ms):>15.1f}"
+            f"{statistics.median(total_ms):>15.1f}{peak_kb / 1024:>15.1f}"
+        )
+
+    mean_diff, differing = compare(results["legacy"][4], results["current"][4])
+    print(f"\noutput vs legacy: mean abs diff {mean_diff:.2f}, differing pixels {differing:.2f}%")
+
+    median_cut_error, kmeans_error = quantization_errors(image_bytes, args.colors)
+    ok = kmeans_error <= median_cut_error * MAX_ERROR_RATIO
+    print(
+        f"quantization error at {args.colors} colors: median cut {median_cut_error:.2f}, "
+        f"k-means {kmeans_error:.2f}  -> {'OK' if ok else 'WORSE'}"
+    )
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
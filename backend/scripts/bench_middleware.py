@@ -0,0 +1,188 @@
+"""
+Pixova AI - Middleware Overhead Benchmark
+Per-request cost of the middleware stack (tracking + rate limit + errors),
+measured by calling the ASGI app directly (no network, no HTTP client).
+Compares the pure ASGI stack in middleware.py ("after") with the same three
+middlewares written on BaseHTTPMiddleware, as they were before ("before").
+
+Usage (from backend/):
+    python scripts/bench_middleware.py [--requests 20000]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Isolate middleware cost: in-process limiter, and no log handlers are
+# installed (setup_logging is not called) so records are built but not written
+os.environ.setdefault("A4F_API_KEY", "benchmark")
+os.environ.setdefault("RATE_LIMIT_BACKEND", "memory")
+os.environ.setdefault("RATE_LIMIT_REQUESTS", "1000000000")
+
+from starlette.applications import Starlette  # noqa: E402
+from starlette.middleware.base import BaseHTTPMiddleware  # noqa: E402
+from starlette.requests import Request  # noqa: E402
+from starlette.responses import JSONResponse, StreamingResponse  # noqa: E402
+from starlette.routing import Route  # noqa: E402
+
+from config import settings  # noqa: E402
+from exceptions import PixovaException, RateLimitError  # noqa: E402
+from logger import clear_request_context, generate_request_id, get_logger, set_request_context  # noqa: E402
+from middleware import (  # noqa: E402
+    RequestTrackingMiddleware,
+    RateLimitMiddleware,
+    ErrorHandlingMiddleware
+)
+from rate_limiter import rate_limiter, route_cost  # noqa: E402
+
+logger = get_logger("bench")
+
+
+# ===========================================
+# BASELINE: the BaseHTTPMiddleware stack middleware.py replaced
+# ===========================================
+
+class BaselineRequestTracking(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        request_id = request.headers.get("X-Request-ID", generate_request_id())
+        set_request_context(request_id, request.headers.get("X-User-ID", "anonymous"))
+        request.state.request_id = request_id
+        request.state.start_time = time.perf_counter()
+        logger.info(f"📥 {request.method} {request.url.path}")
+        try:
+            response = await call_next(request)
+            duration_ms = int((time.perf_counter() - request.state.start_time) * 1000)
+            response.headers["X-Request-ID"] = request_id
+            response.headers["X-Response-Time-Ms"] = str(duration_ms)
+            logger.info(f"✅ Completed in {duration_ms}ms (Status: {response.status_code})")
+            return response
+        finally:
+            clear_request_context()
+
+
+class BaselineRateLimit(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        if request.url.path in ["/", "/health", "/docs", "/openapi.json"]:
+            return await call_next(request)
+        client_id = request.headers.get("X-User-ID", request.client.host if request.client else "unknown")
+        request.state.rate_limit_client = client_id
+        result = rate_limiter.check(client_id, cost=route_cost(request.url.path))
+        if not result.allowed:
+            error = RateLimitError(retry_after=result.retry_after)
+            return JSONResponse(status_code=error.status_code, content=error.to_dict(),
+                                headers={"Retry-After": str(result.retry_after)})
+        response = await call_next(request)
+        quota = rate_limiter.peek(client_id)
+        response.headers["X-RateLimit-Limit"] = str(quota.limit)
+        response.headers["X-RateLimit-Remaining"] = str(quota.remaining)
+        response.headers["X-RateLimit-Reset"] = str(quota.reset_at)
+        return response
+
+
+class BaselineErrorHandling(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        try:
+            return await call_next(request)
+        except PixovaException as e:
+            return JSONResponse(status_code=e.status_code, content=e.to_dict())
+        except Exception as e:
+            message = str(e) if settings.is_development else "An unexpected error occurred"
+            return JSONResponse(status_code=500, content={"success": False, "error": {"message": message}})
+
+
+STACKS = {
+    "before": (BaselineErrorHandling, BaselineRateLimit, BaselineRequestTracking),
+    "after": (ErrorHandlingMiddleware, RateLimitMiddleware, RequestTrackingMiddleware),
+}
+
+
+async def json_endpoint(request):
+    return JSONResponse({"ok": True})
+
+
+async def stream_endpoint(request):
+    async def body():
+        for _ in range(8):
+            yield b"x" * 4096
+    return StreamingResponse(body(), media_type="application/octet-stream")
+
+
+def build_app(stack: str = None) -> Starlette:
+    app = Starlette(routes=[Route("/json", json_endpoint), Route("/stream", stream_endpoint)])
+    # Same order as main.py (the last one added is outermost)
+    for middleware in STACKS.get(stack, ()):
+        app.add_middleware(middleware)
+    return app
+
+
+def make_scope(path: str, client_id: int) -> dict:
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"bench"), (b"x-user-id", f"bench-{client_id % 64}".encode())],
+        "client": ("127.0.0.1", 50000),
+        "server": ("bench", 80),
+    }
+
+
+async def call(app, scope: dict):
+    """One request: body on the first receive(), then the client stays connected"""
+    sent_body = False
+    disconnected = asyncio.Event()
+
+    async def receive():
+        nonlocal sent_body
+        if not sent_body:
+            sent_body = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        pass
+
+    await app(scope, receive, send)
+
+
+async def run(app, path: str, requests: int) -> float:
+    """Mean microseconds per request"""
+    # Warm up (route compilation, limiter state, lazy stores)
+    for i in range(200):
+        await call(app, make_scope(path, i))
+
+    started = time.perf_counter()
+    for i in range(requests):
+        await call(app, make_scope(path, i))
+    return (time.perf_counter() - started) / requests * 1e6
+
+
+async def main(requests: int):
+    bare = build_app()
+    before = build_app("before")
+    after = build_app("after")
+
+    print(f"{'route':<10}{'bare (us)':>12}{'before (us)':>13}{'after (us)':>12}"
+          f"{'overhead before':>17}{'overhead after':>16}")
+    for path in ("/json", "/stream"):
+        bare_us = await run(bare, path, requests)
+        before_us = await run(before, path, requests)
+        after_us = await run(after, path, requests)
+        print(f"{path:<10}{bare_us:>12.1f}{before_us:>13.1f}{after_us:>12.1f}"
+              f"{before_us - bare_us:>17.1f}{after_us - bare_us:>16.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests))
@@ -0,0 +1,95 @@
+"""
+Pixova AI - CLIP Backend Parity Check
+Scores the same images with the PyTorch backend (reference) and the ONNX
+backends, and fails if any validation score differs by more than the tolerance.
+Also reports per-image latency of each backend.
+
+Usage (from backend/, after scripts/export_clip_onnx.py):
+    python scripts/check_clip_parity.py [--images a.png b.png ...] [--tolerance 0.03]
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("A4F_API_KEY", "parity")
+
+import numpy as np  # noqa: E402
+from PIL import Image, ImageDraw  # noqa: E402
+
+import quality_validator  # noqa: E402
+from clip_backends import OnnxClipBackend, TorchClipBackend  # noqa: E402
+from config import settings  # noqa: E402
+
+PROMPTS = ["a coffee shop", "a tech startup", "a lion for a sports team"]
+
+
+def synthetic_images(count: int) -> list:
+    """Mix of flat logo-like shapes and noisy photo-like images"""
+    rng = np.random.default_rng(0)
+    images = []
+    for i in range(count):
+        if i % 2 == 0:
+            image = Image.new("RGB", (512, 512), tuple(int(c) for c in rng.integers(180, 256, 3)))
+            draw = ImageDraw.Draw(image)
+            for _ in range(3):
+                x, y = (int(v) for v in rng.integers(50, 350, 2))
+                draw.ellipse((x, y, x + 120, y + 120), fill=tuple(int(c) for c in rng.integers(0, 200, 3)))
+        else:
+            image = Image.fromarray(rng.integers(0, 256, (512, 512, 3), dtype=np.uint8))
+        images.append(image)
+    return images
+
+
+def score(backend, images: list, prompt: str):
+    quality_validator.use_backend(backend)
+    started = time.perf_counter()
+    scores = quality_validator.score_images(images, [prompt] * len(images))
+    return np.array(scores), (time.perf_counter() - started) * 1000 / len(images)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", nargs="*", help="Image files (default: synthetic images)")
+    parser.add_argument("--count", type=int, default=8, help="Synthetic images to generate")
+    parser.add_argument("--tolerance", type=float, default=0.03, help="Max allowed score difference")
+    args = parser.parse_args()
+
+    if args.images:
+        images = []
+        for path in args.images:
+            with open(path, "rb") as f:
+                images.append(Image.open(io.BytesIO(f.read())).convert("RGB"))
+    else:
+        images = synthetic_images(args.count)
+
+    reference = TorchClipBackend(settings.clip_model_name, settings.clip_threads)
+    candidates = [
+        OnnxClipBackend(settings.clip_onnx_dir, quantized=False, threads=settings.clip_threads),
+        OnnxClipBackend(settings.clip_onnx_dir, quantized=True, threads=settings.clip_threads),
+    ]
+
+    for backend in [reference] + candidates:
+        backend.encode_images(images[:1])  # Warm up (first run allocates and optimizes)
+
+    ok = True
+    print(f"{'backend':<12}{'max |diff|':>12}{'mean |diff|':>13}{'ms/image':>10}")
+    for prompt in PROMPTS:
+        expected, reference_ms = score(reference, images, prompt)
+        print(f"prompt: {prompt!r}")
+        print(f"{reference.name:<12}{'-':>12}{'-':>13}{reference_ms:>10.1f}")
+        for backend in candidates:
+            actual, ms = score(backend, images, prompt)
+            diff = np.abs(actual - expected)
+            ok = ok and float(diff.max()) <= args.tolerance
+            print(f"{backend.name:<12}{diff.max():>12.4f}{diff.mean():>13.4f}{ms:>10.1f}")
+
+    print(f"\nTolerance {args.tolerance}: {'OK' if ok else 'FAILED'}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
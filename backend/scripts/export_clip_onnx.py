@@ -0,0 +1,127 @@
+"""
+Pixova AI - Export CLIP to ONNX
+Writes the text and vision towers of the validation CLIP model as ONNX graphs
+(fp32 and dynamically int8-quantized) for CLIP_BACKEND=onnx.
+
+Needs the export-only dependencies: torch, transformers, onnx, onnxruntime.
+
+Usage (from backend/):
+    python scripts/export_clip_onnx.py [--model openai/clip-vit-base-patch32] [--out ./models/clip-onnx]
+"""
+import argparse
+import inspect
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("A4F_API_KEY", "export")
+
+import torch  # noqa: E402
+from onnxruntime.quantization import QuantType, quantize_dynamic  # noqa: E402
+from transformers import CLIPModel, CLIPProcessor  # noqa: E402
+
+from clip_backends import (  # noqa: E402
+    ONNX_META_FILE,
+    ONNX_TEXT_FILE,
+    ONNX_TEXT_INT8_FILE,
+    ONNX_VISION_FILE,
+    ONNX_VISION_INT8_FILE,
+    TorchClipBackend,
+)
+from config import settings  # noqa: E402
+
+OPSET = 17
+
+
+class TextTower(torch.nn.Module):
+    def __init__(self, model: CLIPModel):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask):
+        return TorchClipBackend._features(
+            self.model.get_text_features(input_ids=input_ids, attention_mask=attention_mask)
+        )
+
+
+class VisionTower(torch.nn.Module):
+    def __init__(self, model: CLIPModel):
+        super().__init__()
+        self.model = model
+
+    def forward(self, pixel_values):
+        return TorchClipBackend._features(self.model.get_image_features(pixel_values=pixel_values))
+
+
+def export(module: torch.nn.Module, args: tuple, path: str, input_names: list, output_name: str, dynamic_axes: dict):
+    kwargs = {}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        kwargs["dynamo"] = False  # TorchScript exporter: honours dynamic_axes
+    torch.onnx.export(
+        module,
+        args,
+        path,
+        input_names=input_names,
+        output_names=[output_name],
+        dynamic_axes=dynamic_axes,
+        opset_version=OPSET,
+        **kwargs
+    )
+    print(f"  wrote {path} ({os.path.getsize(path) / 1e6:.0f} MB)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=settings.clip_model_name)
+    parser.add_argument("--out", default=settings.clip_onnx_dir)
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    model = CLIPModel.from_pretrained(args.model).eval()
+    processor = CLIPProcessor.from_pretrained(args.model)
+
+    text = processor.tokenizer(["a logo", "a professional logo design"], return_tensors="pt", padding=True)
+    pixel_values = torch.zeros(2, 3, processor.image_processor.crop_size["height"], processor.image_processor.crop_size["width"])
+
+    print(f"Exporting {args.model} -> {args.out}")
+    with torch.no_grad():
+        export(
+            TextTower(model),
+            (text["input_ids"], text["attention_mask"]),
+            os.path.join(args.out, ONNX_TEXT_FILE),
+            ["input_ids", "attention_mask"],
+            "text_embeds",
+            {"input_ids": {0: "batch", 1: "sequence"}, "attention_mask": {0: "batch", 1: "sequence"}, "text_embeds": {0: "batch"}},
+        )
+        export(
+            VisionTower(model),
+            (pixel_values,),
+            os.path.join(args.out, ONNX_VISION_FILE),
+            ["pixel_values"],
+            "image_embeds",
+            {"pixel_values": {0: "batch"}, "image_embeds": {0: "batch"}},
+        )
+
+    # Dynamic quantization: int8 weights, activations quantized on the fly per batch
+    for source, target in ((ONNX_TEXT_FILE, ONNX_TEXT_INT8_FILE), (ONNX_VISION_FILE, ONNX_VISION_INT8_FILE)):
+        quantize_dynamic(
+            os.path.join(args.out, source),
+            os.path.join(args.out, target),
+            weight_type=QuantType.QInt8
+        )
+        print(f"  wrote {os.path.join(args.out, target)} ({os.path.getsize(os.path.join(args.out, target)) / 1e6:.0f} MB)")
+
+    with open(os.path.join(args.out, ONNX_META_FILE), "w") as f:
+        json.dump({
+            "model_name": args.model,
+            "logit_scale": float(model.logit_scale.exp().item()),
+            "opset": OPSET,
+        }, f, indent=2)
+
+    print("Done. Check parity with: python scripts/check_clip_parity.py")
+
+
+if __name__ == "__main__":
+    main()
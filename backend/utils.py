@@ -2,44 +2,259 @@
 Utility Functions
 Helper functions for image downloads and other utilities
 """
+import asyncio
+import os
+import sqlite3
+from typing import AsyncGenerator, AsyncIterator, Optional, Tuple, Union
 import httpx
 from fastapi import HTTPException
-from fastapi.responses import Response
+from fastapi.responses import FileResponse, Response, StreamingResponse
 
+from config import settings
+from logger import get_logger
+from blob_cache import blob_cache
+from exceptions import ImageNotFoundError
 
-async def proxy_image_download(image_url: str) -> Response:
+logger = get_logger(__name__)
+
+# Upstream headers passed through to the client
+PASSTHROUGH_HEADERS = (
+    "content-length",
+    "content-range",
+    "content-encoding",
+    "accept-ranges",
+    "etag",
+    "last-modified",
+)
+
+# Shared pooled client for image downloads (created in the app lifespan)
+_download_client: Optional[httpx.AsyncClient] = None
+
+
+def init_download_client() -> httpx.AsyncClient:
+    """Create the pooled download client (idempotent)"""
+    global _download_client
+    if _download_client is None:
+        _download_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.download_max_connections,
+                max_keepalive_connections=settings.http_max_keepalive,
+                keepalive_expiry=settings.http_keepalive_expiry
+            ),
+            timeout=httpx.Timeout(settings.download_timeout, connect=settings.http_connect_timeout),
+            follow_redirects=True
+        )
+    return _download_client
+
+
+async def close_download_client():
+    """Close pooled download connections (call on shutdown)"""
+    global _download_client
+    if _download_client is not None:
+        await _download_client.aclose()
+        _download_client = None
+
+
+def get_download_client() -> httpx.AsyncClient:
+    return _download_client or init_download_client()
+
+
+def _declared_size(upstream: httpx.Response) -> Optional[int]:
+    """Full size of the upstream image if the response declares it"""
+    content_range = upstream.headers.get("content-range", "")
+    if "/" in content_range:
+        total = content_range.rsplit("/", 1)[1].strip()
+        if total.isdigit():
+            return int(total)
+    content_length = upstream.headers.get("content-length", "")
+    return int(content_length) if content_length.isdigit() else None
+
+
+async def proxy_image_download(image_url: str, range_header: Optional[str] = None) -> Response:
     """
     Proxy image download to add proper CORS headers and enable downloads.
     
     This allows frontend to download images from external URLs by proxying
-    through our backend with proper headers.
+    through our backend with proper headers. The body is streamed through
+    a pooled client (never fully buffered); Range requests are forwarded.
+    With the blob cache enabled, images on provider hosts are served from
+    local disk once cached (Range handled locally); the first download is
+    streamed to the client and written to the cache at the same time.
     
     Args:
         image_url: The external image URL to download
+        range_header: Optional client Range header (e.g. "bytes=0-1023")
         
     Returns:
-        Response with image data and download headers
+        Streaming response with image data and download headers
     """
+    # Images we store ourselves (b64_json generations) never go over HTTP,
+    # whether or not provider images are cached
+    local_hash = blob_cache.local_hash(image_url)
+    if local_hash is not None:
+        return await _local_image_download(local_hash)
+    
+    cacheable = False
+    if blob_cache.enabled:
+        cached, cacheable = await asyncio.to_thread(_lookup_cacheable, image_url)
+        if cached is not None:
+            blob_cache.hits += 1
+            return _blob_download_response(*cached)
+    
+    # Only whole-image downloads of provider images are worth storing
+    if cacheable and not range_header:
+        upstream = await _open_upstream(image_url, None)
+        if isinstance(upstream, Response):
+            return upstream
+        content_type = upstream.headers.get("content-type", "image/png")
+        return _stream_response(
+            upstream,
+            blob_cache.tee(image_url, upstream.aiter_bytes(), content_type),
+            decoded=True
+        )
+    
+    upstream = await _open_upstream(image_url, range_header)
+    if isinstance(upstream, Response):
+        return upstream
+    return _stream_response(upstream, _limited(upstream.aiter_raw()))
+
+
+def _lookup_cacheable(image_url: str) -> Tuple[Optional[Tuple[str, str]], bool]:
+    """(cache entry or None, whether the URL may be cached) in one thread hop"""
+    cached = blob_cache.lookup(image_url)
+    if cached is not None:
+        return cached, True
+    return None, blob_cache.is_cacheable(image_url)
+
+
+async def _open_upstream(image_url: str, range_header: Optional[str]) -> Union[httpx.Response, Response]:
+    """Start the upstream request; returns an error response instead if it cannot be proxied"""
+    client = get_download_client()
+    request_headers = {"Range": range_header} if range_header else None
+    
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(image_url)
-            response.raise_for_status()
-            
-            # Get content type from source
-            content_type = response.headers.get("content-type", "image/png")
-            
-            # Return image with download headers
-            return Response(
-                content=response.content,
-                media_type=content_type,
-                headers={
-                    "Content-Disposition": "attachment; filename=pixova-design.png",
-                    "Access-Control-Allow-Origin": "*",
-                    "Cache-Control": "public, max-age=3600"
-                }
-            )
+        upstream = await client.send(
+            client.build_request("GET", image_url, headers=request_headers),
+            stream=True
+        )
     except httpx.HTTPError as e:
         raise HTTPException(
             status_code=502,
             detail=f"Failed to download image: {str(e)}"
         )
+    
+    max_bytes = settings.download_max_bytes
+    
+    if upstream.status_code == 416:
+        # Unsatisfiable range: tell the client the real size
+        await upstream.aclose()
+        headers = {"Content-Range": upstream.headers.get("content-range", "bytes */*")}
+        return Response(status_code=416, headers=headers)
+    
+    if upstream.is_error:
+        await upstream.aclose()
+        raise HTTPException(
+            status_code=502,
+            detail=f"Failed to download image: upstream returned {upstream.status_code}"
+        )
+    
+    size = _declared_size(upstream)
+    if size is not None and size > max_bytes:
+        await upstream.aclose()
+        raise HTTPException(
+            status_code=413,
+            detail=f"Image exceeds the {max_bytes} byte download limit"
+        )
+    
+    return upstream
+
+
+async def _limited(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Cut a stream whose undeclared size goes over the download limit"""
+    max_bytes = settings.download_max_bytes
+    sent = 0
+    async for chunk in chunks:
+        sent += len(chunk)
+        if sent > max_bytes:
+            logger.warning("Download exceeded size limit, aborting", max_bytes=max_bytes)
+            raise ValueError("Image exceeds download size limit")
+        yield chunk
+
+
+def _stream_response(upstream: httpx.Response, chunks: AsyncGenerator[bytes, None], decoded: bool = False) -> StreamingResponse:
+    """
+    Stream `chunks` (read from `upstream`) to the client with download headers.
+    `decoded` chunks have any Content-Encoding removed, so its length no longer applies.
+    """
+    async def body() -> AsyncIterator[bytes]:
+        try:
+            async for chunk in chunks:
+                yield chunk
+        finally:
+            # Client gone or stream done: release the cache temp file and the socket now
+            await chunks.aclose()
+            await upstream.aclose()
+    
+    encoded = decoded and "content-encoding" in upstream.headers
+    headers = {
+        name: upstream.headers[name]
+        for name in PASSTHROUGH_HEADERS
+        if name in upstream.headers and not (encoded and name in ("content-encoding", "content-length"))
+    }
+    headers.update({
+        "Content-Disposition": "attachment; filename=pixova-design.png",
+        "Access-Control-Allow-Origin": "*",
+        "Cache-Control": "public, max-age=3600"
+    })
+    
+    # Get content type from source
+    content_type = upstream.headers.get("content-type", "image/png")
+    
+    return StreamingResponse(
+        body(),
+        status_code=upstream.status_code,
+        media_type=content_type,
+        headers=headers
+    )
+
+
+async def _local_image_download(blob_hash: str) -> Response:
+    """Serve an image stored by this API (an /api/images link) from disk"""
+    cached = await asyncio.to_thread(blob_cache.lookup, blob_cache.image_url(blob_hash))
+    if cached is None:
+        raise ImageNotFoundError(blob_hash)
+    return _blob_download_response(*cached)
+
+
+def _blob_download_response(blob_hash: str, content_type: str) -> FileResponse:
+    return FileResponse(
+        blob_cache.blob_path(blob_hash),
+        media_type=content_type,
+        headers={
+            "ETag": f'"{blob_hash}"',
+            "Content-Disposition": "attachment; filename=pixova-design.png",
+            "Access-Control-Allow-Origin": "*",
+            "Cache-Control": "public, max-age=3600"
+        }
+    )
+
+
+def open_sqlite(path: str, busy_timeout_ms: int = 5000) -> sqlite3.Connection:
+    """
+    Open a SQLite database tuned for cheap concurrent access from several
+    processes on one host (WAL journal, relaxed fsync, autocommit).
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    
+    conn = sqlite3.connect(
+        path,
+        timeout=busy_timeout_ms / 1000,
+        isolation_level=None,
+        check_same_thread=False
+    )
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={int(busy_timeout_ms)}")
+    return conn
@@ -0,0 +1,364 @@
+"""
+Pixova AI - Validation Sidecar
+One local process owns the CLIP model and scores images for every API worker
+over a Unix socket, micro-batching requests from all workers into shared
+forward passes.
+
+Run next to the API (same host, same BLOB_CACHE_DIR):
+    python validation_server.py
+
+Wire format (both directions): 4-byte big-endian header length, JSON header,
+then the raw payloads whose lengths the header lists in "sizes".
+"""
+import asyncio
+import json
+import os
+import signal
+import struct
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import settings
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+MAX_HEADER_BYTES = 1024 * 1024
+
+
+# ===========================================
+# PROTOCOL
+# ===========================================
+
+async def write_frame(writer: asyncio.StreamWriter, header: Dict[str, Any], payloads: List[bytes] = ()):
+    header = {**header, "sizes": [len(p) for p in payloads]}
+    encoded = json.dumps(header).encode("utf-8")
+    writer.write(struct.pack("!I", len(encoded)) + encoded)
+    for payload in payloads:
+        writer.write(payload)
+    await writer.drain()
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Tuple[Dict[str, Any], List[bytes]]:
+    (length,) = struct.unpack("!I", await reader.readexactly(4))
+    if length > MAX_HEADER_BYTES:
+        raise ValueError(f"Frame header too large ({length} bytes)")
+    header = json.loads(await reader.readexactly(length))
+
+    payloads = []
+    for size in header.get("sizes", []):
+        if size > settings.download_max_bytes:
+            raise ValueError(f"Payload too large ({size} bytes)")
+        payloads.append(await reader.readexactly(size))
+    return header, payloads
+
+
+# ===========================================
+# CLIENT (API workers)
+# ===========================================
+
+class ValidationClient:
+    """
+    Sends validation batches to the sidecar.
+    - Sidecar not running (socket missing or connection refused): returns
+      None so the caller can validate in-process instead.
+    - Sidecar running but slow or misbehaving (timeout, protocol error):
+      returns the images unscored. Falling back here would load a model copy
+      into the worker exactly when the host is already overloaded.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.unavailable = 0
+        self.failures = 0
+
+    async def score(
+        self,
+        image_urls: List[str],
+        prompt: str,
+        images_bytes: Optional[List[Optional[bytes]]] = None
+    ) -> Optional[List[Optional[float]]]:
+        """
+        Positive-prompt score per image (None for images the sidecar could not
+        load or score in time), or None if the sidecar is not running
+        """
+        images_bytes = images_bytes or [None] * len(image_urls)
+        header = {
+            "op": "score",
+            "prompt": prompt,
+            "urls": image_urls,
+            # In-memory images (b64_json) travel inline; others are read from the shared blob cache
+            "inline": [image is not None for image in images_bytes],
+        }
+        payloads = [image for image in images_bytes if image is not None]
+
+        self.requests += 1
+        try:
+            response = await asyncio.wait_for(self._call(header, payloads), timeout=settings.validation_timeout)
+            if "error" in response:
+                raise RuntimeError(response["error"])
+            scores = response["scores"]
+            if len(scores) != len(image_urls):
+                raise ValueError("Score count does not match the request")
+            return scores
+        except (FileNotFoundError, ConnectionRefusedError) as e:
+            self.unavailable += 1
+            if self.unavailable % 100 == 1:
+                logger.warning(
+                    "Validation sidecar not running, validating in-process",
+                    error=str(e) or type(e).__name__,
+                    unavailable=self.unavailable
+                )
+            return None
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError, KeyError, RuntimeError) as e:
+            self.failures += 1
+            if self.failures % 100 == 1:
+                logger.warning(
+                    "Validation sidecar failed, leaving images unscored",
+                    error=str(e) or type(e).__name__,
+                    failures=self.failures
+                )
+            return [None] * len(image_urls)
+
+    async def _call(self, header: Dict[str, Any], payloads: List[bytes]) -> Dict[str, Any]:
+        reader, writer = await asyncio.open_unix_connection(settings.validation_socket_path)
+        try:
+            await write_frame(writer, header, payloads)
+            response, _ = await read_frame(reader)
+            return response
+        finally:
+            writer.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": settings.validation_sidecar_enabled,
+            "requests": self.requests,
+            "unavailable": self.unavailable,
+            "failures": self.failures,
+        }
+
+
+# ===========================================
+# SERVER (sidecar process)
+# ===========================================
+
+class _PendingImage:
+    __slots__ = ("image", "prompt", "future")
+
+    def __init__(self, image, prompt: str):
+        self.image = image
+        self.prompt = prompt
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+
+class ValidationServer:
+    """
+    Scores images for all workers with one model.
+
+    Connections decode their images and queue them; a single batcher takes
+    whatever is queued (up to `validation_max_batch`, waiting at most
+    `validation_batch_window_ms` for more once the first image arrives) and
+    scores it in one forward pass. While a pass runs, new images queue up
+    for the next one, so batches grow with load.
+    """
+
+    def __init__(self):
+        self._queue: Optional[asyncio.Queue] = None
+        self._stopping: Optional[asyncio.Event] = None
+        self.batches = 0
+        self.images = 0
+        self.largest_batch = 0
+        self.busy_ms = 0.0
+
+    async def serve(self):
+        from quality_validator import _load_clip
+
+        self._queue = asyncio.Queue()
+        self._stopping = asyncio.Event()
+        path = settings.validation_socket_path
+
+        # Load (and warm) the model before accepting work
+        await asyncio.to_thread(_load_clip)
+
+        await self._claim_socket(path)
+        server = await asyncio.start_unix_server(self._handle, path=path)
+        os.chmod(path, 0o660)
+
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, self._stopping.set)
+
+        batcher = asyncio.create_task(self._batcher())
+        logger.info(f"🧠 Validation sidecar listening on {path}")
+        try:
+            async with server:
+                await self._stopping.wait()
+        finally:
+            batcher.cancel()
+            if os.path.exists(path):
+                os.unlink(path)
+            logger.info("Validation sidecar stopped", **self.stats())
+
+    @staticmethod
+    async def _claim_socket(path: str):
+        """Remove a stale socket file, refusing to start if a live sidecar owns it"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if not os.path.exists(path):
+            return
+        try:
+            _, writer = await asyncio.open_unix_connection(path)
+        except OSError:
+            os.unlink(path)
+            return
+        writer.close()
+        raise RuntimeError(f"Another validation sidecar is listening on {path}")
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """One connection; serves frames (one request at a time) until the client closes it"""
+        try:
+            while True:
+                try:
+                    header, payloads = await read_frame(reader)
+                except asyncio.IncompleteReadError:
+                    return
+                try:
+                    response = await self._dispatch_while_connected(reader, header, payloads)
+                except ConnectionError:
+                    raise
+                except Exception as e:
+                    logger.error("Validation request failed", error=str(e))
+                    response = {"error": str(e)}
+                await write_frame(writer, response)
+        except (ConnectionError, ValueError) as e:
+            logger.warning("Validation connection dropped", error=str(e))
+        finally:
+            writer.close()
+
+    async def _dispatch_while_connected(
+        self,
+        reader: asyncio.StreamReader,
+        header: Dict[str, Any],
+        payloads: List[bytes]
+    ) -> Dict[str, Any]:
+        """
+        Run a request, abandoning it if the client goes away first (it timed
+        out) so its images are not scored for nobody
+        """
+        dispatch = asyncio.create_task(self._dispatch(header, payloads))
+        # Clients wait for the response before sending again, so any read
+        # completing here means the connection was closed
+        hangup = asyncio.create_task(reader.read(1))
+        try:
+            await asyncio.wait({dispatch, hangup}, return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            dispatch.cancel()
+            raise
+        finally:
+            hangup.cancel()
+
+        if not dispatch.done():
+            dispatch.cancel()
+            if not hangup.cancelled():
+                hangup.exception()  # Reset by the peer: same outcome, nothing to report
+            raise ConnectionResetError("Client closed the connection before the response")
+        return dispatch.result()
+
+    async def _dispatch(self, header: Dict[str, Any], payloads: List[bytes]) -> Dict[str, Any]:
+        op = header.get("op")
+        if op == "stats":
+            return self.stats()
+        if op != "score":
+            raise ValueError(f"Unknown op {op!r}")
+
+        from quality_validator import load_images
+
+        urls = header["urls"]
+        inline = iter(payloads)
+        images_bytes = [next(inline) if flag else None for flag in header["inline"]]
+        images = await asyncio.to_thread(load_images, urls, images_bytes)
+
+        pending = [_PendingImage(image, header["prompt"]) for image in images if image is not None]
+        for item in pending:
+            self._queue.put_nowait(item)
+        try:
+            scores = iter(await asyncio.gather(*(item.future for item in pending)))
+        finally:
+            # Request abandoned: the batcher skips cancelled images
+            for item in pending:
+                item.future.cancel()
+        return {"scores": [next(scores) if image is not None else None for image in images]}
+
+    async def _batcher(self):
+        from quality_validator import score_images
+
+        window = settings.validation_batch_window_ms / 1000
+        while True:
+            batch = [await self._queue.get()]
+            deadline = time.monotonic() + window
+            while len(batch) < settings.validation_max_batch:
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            # Drop images whose request was abandoned (cancelled futures are done)
+            batch = [item for item in batch if not item.future.done()]
+            if not batch:
+                continue
+
+            started = time.perf_counter()
+            try:
+                scores = await asyncio.to_thread(
+                    score_images, [item.image for item in batch], [item.prompt for item in batch]
+                )
+            except Exception as e:
+                logger.error("Validation batch failed", error=str(e), batch_size=len(batch))
+                for item in batch:
+                    if not item.future.done():
+                        item.future.set_exception(e)
+                continue
+
+            self._record(len(batch), (time.perf_counter() - started) * 1000)
+            for item, score in zip(batch, scores):
+                if not item.future.done():
+                    item.future.set_result(score)
+
+    def _record(self, size: int, elapsed_ms: float):
+        self.batches += 1
+        self.images += size
+        self.largest_batch = max(self.largest_batch, size)
+        self.busy_ms += elapsed_ms
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "images": self.images,
+            "avg_batch": round(self.images / self.batches, 2) if self.batches else None,
+            "largest_batch": self.largest_batch,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "busy_ms": int(self.busy_ms),
+        }
+
+
+# Singleton instance
+validation_client = ValidationClient()
+
+
+if __name__ == "__main__":
+    from logger import setup_logging
+
+    setup_logging(
+        level=settings.log_level,
+        format_type="text" if settings.is_development else "json",
+        queue_size=settings.log_queue_size if settings.log_async else 0,
+        queue_policy=settings.log_queue_policy,
+        block_timeout=settings.log_block_timeout,
+        batch_size=settings.log_batch_size
+    )
+    asyncio.run(ValidationServer().serve())
@@ -206,8 +206,9 @@ export default function GeneratePage() {
 
         if (variation) {
           // Upload image to Supabase Storage
+          // (images stored by the API may come back as relative /api/images/... paths)
           const permanentUrl = await uploadImageFromUrl(
-            variation.image_url,
+            new URL(variation.image_url, apiUrl).toString(),
             user.email || 'unknown@user.com',
             user.id,
             prompt,